@@ -0,0 +1,164 @@
+"""
+Materialized per-scope aggregates.
+
+The sidebar, Quick Stats and data summary used to recount students and
+submissions from the raw rows on every Streamlit rerun. Instead, each
+(grade, class_section) partition is rolled up once per data version into
+per-student counts and quiz sums; any scope, including the 'All' ones, is
+answered by merging the rollups of the partitions it covers, so reads only
+touch one row per student.
+"""
+
+from datetime import date, timedelta
+
+import pandas as pd
+
+# Quiz scores below this count towards `below_threshold`
+LOW_SCORE_THRESHOLD = 70
+
+ROLLUP_KEYS = ['grade', 'class_section', 'student_name']
+
+# Quiz dates are counted in days from here for the per-student trend sums
+TREND_EPOCH = pd.Timestamp('2020-01-01')
+
+TREND_SUMS = ['trend_n', 'trend_t', 'trend_s', 'trend_tt', 'trend_ts']
+
+
+def partition_rollup(df):
+    """
+    Roll up the rows of one partition (or any frame).
+
+    Returns a dict with per-student counts ('students'), the distinct
+    homework/quiz names and the (scheduled date, student) pairs of quizzes.
+    """
+    scores = df['quiz_score'].astype('float64')
+    # Least-squares sums of (quiz day, score), so trends merge across partitions
+    days = ((df['quiz_date'] - TREND_EPOCH).dt.days).astype('float64')
+    dated = scores.notna() & days.notna()
+    t, s = days.where(dated, 0), scores.where(dated, 0)
+    students = (
+        df[ROLLUP_KEYS]
+        .assign(
+            records=1,
+            submitted=(df['submission_status'] == 'Submitted').astype(int),
+            quiz_count=scores.notna().astype(int),
+            quiz_sum=scores.fillna(0),
+            quiz_min=scores,
+            quiz_max=scores,
+            below_threshold=(scores < LOW_SCORE_THRESHOLD).astype(int),
+            trend_n=dated.astype(int), trend_t=t, trend_s=s, trend_tt=t * t, trend_ts=t * s,
+        )
+        .groupby(ROLLUP_KEYS, sort=True, observed=True)
+        .agg(records=('records', 'sum'), submitted=('submitted', 'sum'),
+             quiz_count=('quiz_count', 'sum'), quiz_sum=('quiz_sum', 'sum'),
+             quiz_min=('quiz_min', 'min'), quiz_max=('quiz_max', 'max'),
+             below_threshold=('below_threshold', 'sum'),
+             **{column: (column, 'sum') for column in TREND_SUMS})
+        .reset_index()
+    )
+
+    return {
+        'students': students,
+        'entities': {
+            column: df[column].dropna().unique().tolist()
+            for column in ('student_name', 'homework_title', 'quiz_name')
+        },
+        'scheduled': df.loc[df['quiz_scheduled_date'].notna(), ['quiz_scheduled_date', 'student_name']]
+                       .drop_duplicates(),
+    }
+
+
+def merge_rollups(rollups):
+    """
+    Fold several rollups of the same partition (e.g. of consecutive chunks of
+    a file) into one, as if partition_rollup had seen all their rows at once.
+    """
+    students = pd.concat([r['students'] for r in rollups], ignore_index=True)
+    for column in ROLLUP_KEYS:
+        # Chunks are typed separately, so their categories differ
+        if isinstance(students[column].dtype, pd.CategoricalDtype):
+            students[column] = students[column].astype(students[column].cat.categories.dtype)
+    students = (
+        students.groupby(ROLLUP_KEYS, sort=True, observed=True)
+        .agg(records=('records', 'sum'), submitted=('submitted', 'sum'),
+             quiz_count=('quiz_count', 'sum'), quiz_sum=('quiz_sum', 'sum'),
+             quiz_min=('quiz_min', 'min'), quiz_max=('quiz_max', 'max'),
+             below_threshold=('below_threshold', 'sum'),
+             **{column: (column, 'sum') for column in TREND_SUMS})
+        .reset_index()
+    )
+
+    return {
+        'students': students,
+        'entities': {
+            column: list(dict.fromkeys(value for r in rollups for value in r['entities'][column]))
+            for column in ('student_name', 'homework_title', 'quiz_name')
+        },
+        'scheduled': pd.concat([r['scheduled'] for r in rollups]).drop_duplicates(),
+    }
+
+
+def _trend(students):
+    """Least-squares slope of quiz score over time, in points per week (NaN with < 2 quiz days)."""
+    n, t, s = students['trend_n'], students['trend_t'], students['trend_s']
+    spread = n * students['trend_tt'] - t * t
+    slope = (n * students['trend_ts'] - t * s) / spread.where(spread > 1e-9)
+    return (slope * 7).astype('float64')
+
+
+class ScopeAggregates:
+    """Merged rollups for one admin scope; every attribute is precomputed."""
+
+    def __init__(self, rollups):
+        students = pd.concat([r['students'] for r in rollups], ignore_index=True)
+
+        # A student whose rows span partitions is merged into one line
+        merged = (
+            students.groupby('student_name', sort=True, observed=True)
+            .agg(grade=('grade', 'first'), class_section=('class_section', 'first'),
+                 records=('records', 'sum'), submitted=('submitted', 'sum'),
+                 quiz_count=('quiz_count', 'sum'), quiz_sum=('quiz_sum', 'sum'),
+                 min_quiz=('quiz_min', 'min'), max_quiz=('quiz_max', 'max'),
+                 below_threshold=('below_threshold', 'sum'),
+                 **{column: (column, 'sum') for column in TREND_SUMS})
+            .reset_index()
+        )
+        merged[['min_quiz', 'max_quiz']] = merged[['min_quiz', 'max_quiz']].astype('float64')
+        merged['pending'] = merged['records'] - merged['submitted']
+        merged['avg_quiz'] = merged['quiz_sum'] / merged['quiz_count'].where(merged['quiz_count'] > 0)
+        merged['quiz_trend'] = _trend(merged)
+        self.students = merged.drop(columns=TREND_SUMS)
+
+        self.total_records = int(merged['records'].sum())
+        self.total_students = len(merged)
+        self.submitted = int(merged['submitted'].sum())
+        self.quiz_count = int(merged['quiz_count'].sum())
+        self.quiz_sum = float(merged['quiz_sum'].sum())
+        self.quiz_min = merged['min_quiz'].min()
+        self.quiz_max = merged['max_quiz'].max()
+        self.below_threshold = int(merged['below_threshold'].sum())
+        self.students_below_threshold = int((merged['below_threshold'] > 0).sum())
+
+        self.entities = {
+            column: list(dict.fromkeys(value for r in rollups for value in r['entities'][column]))
+            for column in ('student_name', 'homework_title', 'quiz_name')
+        }
+        self.scheduled = pd.concat([r['scheduled'] for r in rollups]).drop_duplicates()
+
+    @property
+    def submission_rate(self):
+        """Percentage of records with homework submitted."""
+        return self.submitted / self.total_records * 100 if self.total_records else 0.0
+
+    @property
+    def average_quiz_score(self):
+        return self.quiz_sum / self.quiz_count if self.quiz_count else float('nan')
+
+    def upcoming_quizzes(self, days=None, today=None):
+        """Series of student counts per scheduled quiz date from today (within `days`, if given)."""
+        today = pd.Timestamp(today or date.today())
+        when = self.scheduled['quiz_scheduled_date']
+        window = when >= today
+        if days is not None:
+            window &= when < today + timedelta(days=days)
+        return self.scheduled[window].groupby('quiz_scheduled_date', sort=True)['student_name'].nunique()
@@ -1,19 +1,37 @@
-import pandas as pd
 import google.generativeai as genai
 import os
 from dotenv import load_dotenv
-import json
+import asyncio
+import contextlib
+import weakref
+from data_store import get_dataset_store
+from analytics import scope_features
+from local_query_engine import default_engine
+from response_cache import default_cache, scope_key
+from prompt_builder import PromptBuilder, estimate_tokens
+from retrieval import scope_index
+from query_plan import PlanError, answer_from_plan, build_plan_prompt
+from rate_limit import call_with_retries
+from model_resolver import default_resolver, is_model_not_found
+from tracing import current_trace, default_tracer, null_tracer, stage
+from query_log import default_query_log, prompt_hash
 
 # Load environment variables
 load_dotenv()
 
+QUERY_MODES = ('summary', 'plan')
+
 class AdminQuerySystem:
     """
     AI-powered query system with role-based access control.
     Uses Google Gemini API - AUTOMATICALLY FINDS BEST MODEL
     """
     
-    def __init__(self, api_key=None, admin_grade=None, admin_class=None):
+    def __init__(self, api_key=None, admin_grade=None, admin_class=None,
+                 data_path=None, local_engine=default_engine,
+                 answer_cache=default_cache, max_prompt_tokens=8000,
+                 model_resolver=default_resolver, query_mode='summary',
+                 tracer=default_tracer, query_log=default_query_log):
         """
         Initialize the query system with admin permissions.
         
@@ -21,10 +39,40 @@ class AdminQuerySystem:
             api_key: Gemini API key
             admin_grade: Grade the admin has access to (e.g., 8, 9, 10)
             admin_class: Class section the admin has access to (e.g., 'A', 'B')
+            data_path: Student data file, CSV/Parquet/Arrow (default: $STUDENT_DATA_PATH
+                or student_data.csv); shared between all systems in the process, and
+                streamed in chunks when larger than STREAMING_MIN_MB (see streaming_source.py)
+            local_engine: Engine answering common questions without Gemini (None to disable)
+            answer_cache: ResponseCache for Gemini answers (None to disable)
+            max_prompt_tokens: Prompt token budget (capped by the model's input limit)
+            model_resolver: ModelResolver choosing (and caching) the Gemini model
+            query_mode: 'summary' sends a data summary for Gemini to answer from;
+                'plan' has Gemini write a query plan that runs locally on the admin's rows
+                (summary mode is used when only a sample of a streamed scope is loaded)
+            tracer: Tracer receiving per-stage timings and token counts for every
+                query (see tracing.py; None to disable)
+            query_log: QueryLog recording every query for replay (see query_log.py;
+                None to disable)
         """
         self.api_key = api_key or os.getenv('GEMINI_API_KEY')
         self.admin_grade = admin_grade
         self.admin_class = admin_class
+        self.data_path = data_path or os.getenv('STUDENT_DATA_PATH', 'student_data.csv')
+        self.local_engine = local_engine
+        self.answer_cache = answer_cache
+        self.last_answer_source = None
+        self.tracer = tracer
+        self.query_log = query_log
+        self.last_trace = None
+        self.last_error = None
+        self.max_prompt_tokens = max_prompt_tokens
+        self.model_resolver = model_resolver
+        self.model_name = None
+        self.input_token_limit = None
+        
+        if query_mode not in QUERY_MODES:
+            raise ValueError(f"query_mode must be one of: {', '.join(QUERY_MODES)}")
+        self.query_mode = query_mode
         
         if not self.api_key:
             raise ValueError("Gemini API key is required!")
@@ -34,177 +82,441 @@ class AdminQuerySystem:
         
         # Automatically find and use the best available model
         self.model = self._get_best_model()
+        self.prompt_builder = PromptBuilder(self._prompt_budget())
         
-        # Load the full dataset
-        self.full_data = pd.read_csv('student_data.csv')
-        
-        # Filter data based on admin's access rights
-        self.filtered_data = self._apply_role_filters()
-    
-    def _get_best_model(self):
-        """Automatically find the best available model"""
-        print("🔍 Finding best available Gemini model...")
-        
-        # Try models in order of preference
-        preferred_models = [
-            'gemini-1.5-pro-latest',
-            'gemini-1.5-pro',
-            'gemini-1.5-flash-latest', 
-            'gemini-1.5-flash',
-            'gemini-pro',
-            'models/gemini-pro',
-            'models/gemini-1.5-flash',
-            'models/gemini-1.5-pro'
-        ]
-        
-        # Get list of available models
+        # Get the shared dataset (parsed once per process, not per admin)
+        self._acquire_dataset()
+    
+    def _acquire_dataset(self):
+        store = get_dataset_store()
+        self._dataset = store.acquire(self.data_path, self.admin_grade, self.admin_class)
+        self._release_dataset = weakref.finalize(self, store.release, self._dataset)
+        self._filtered_data = None
+        self._filtered_version = None
+    
+    @property
+    def dataset(self):
+        """The shared data snapshot, moved forward when new records are ingested."""
+        if self._dataset.successor is not None:
+            self._release_dataset()
+            self._acquire_dataset()
+        return self._dataset
+    
+    def close(self):
+        """Release this system's reference on the shared dataset."""
+        self._release_dataset()
+    
+    def _get_best_model(self, force_refresh=False):
+        """Automatically find the best available model (cached across systems and restarts)"""
+        with stage('model_resolution'):
+            resolved = self.model_resolver.resolve(self.api_key, force_refresh=force_refresh)
+        self.model_name = resolved.name
+        self.input_token_limit = resolved.input_token_limit
+        return resolved.model
+    
+    def _refresh_model(self):
+        """Re-resolve the model after the current one was not found."""
+        print(f"⚠️ Model {self.model_name} not found, finding another one...")
+        self.model = self._get_best_model(force_refresh=True)
+        self.prompt_builder.token_budget = self._prompt_budget()
+    
+    def _generate(self, prompt, **kwargs):
+        """Call Gemini, re-resolving the model once if it has disappeared."""
+        self._note_prompt(prompt)
         try:
-            available_models = []
-            for model in genai.list_models():
-                if 'generateContent' in model.supported_generation_methods:
-                    available_models.append(model.name)
-            
-            print(f"📋 Found {len(available_models)} available models")
-            
-            # Try to use preferred models
-            for preferred in preferred_models:
-                for available in available_models:
-                    if preferred in available:
-                        print(f"✅ Using model: {available}")
-                        return genai.GenerativeModel(available)
-            
-            # If no preferred model found, use the first available
-            if available_models:
-                model_name = available_models[0]
-                print(f"✅ Using model: {model_name}")
-                return genai.GenerativeModel(model_name)
-            
+            with stage('gemini_call'):
+                response = self.model.generate_content(prompt, **kwargs)
         except Exception as e:
-            print(f"⚠️ Error listing models: {e}")
-        
-        # Fallback to gemini-pro (most common)
-        print("⚠️ Using fallback model: gemini-pro")
-        return genai.GenerativeModel('gemini-pro')
+            if not is_model_not_found(e):
+                raise
+            self._refresh_model()
+            with stage('gemini_call'):
+                response = self.model.generate_content(prompt, **kwargs)
+        if not kwargs.get('stream'):
+            self._record_usage(prompt, response)
+        return response
+    
+    async def _generate_async(self, prompt, limiter, retries):
+        self._note_prompt(prompt)
+        make_call = lambda: self.model.generate_content_async(prompt)
+        try:
+            with stage('gemini_call'):
+                response = await call_with_retries(make_call, limiter=limiter, retries=retries)
+        except Exception as e:
+            if not is_model_not_found(e):
+                raise
+            await asyncio.to_thread(self._refresh_model)
+            with stage('gemini_call'):
+                response = await call_with_retries(make_call, limiter=limiter, retries=retries)
+        self._record_usage(prompt, response)
+        return response
+    
+    def _note_prompt(self, prompt):
+        trace = current_trace()
+        if trace is not None:
+            trace.attributes['prompt_hash'] = prompt_hash(prompt)
+    
+    def _record_usage(self, prompt, response, text=None):
+        """Add a Gemini call's token counts to the current trace (estimated if not reported)."""
+        trace = current_trace()
+        if trace is None:
+            return
+        usage = getattr(response, 'usage_metadata', None)
+        prompt_tokens = getattr(usage, 'prompt_token_count', None) or estimate_tokens(prompt)
+        response_tokens = getattr(usage, 'candidates_token_count', None)
+        if response_tokens is None:
+            response_tokens = estimate_tokens(response.text if text is None else text)
+        trace.record_tokens(prompt_tokens, response_tokens)
+    
+    def _prompt_budget(self):
+        """Prompt token budget, leaving headroom below the model's input limit."""
+        if self.input_token_limit:
+            return min(self.max_prompt_tokens, int(self.input_token_limit * 0.9))
+        return self.max_prompt_tokens
+    
+    @property
+    def full_data(self):
+        """Every record in the data source (not limited to this admin)."""
+        return self.dataset.frame
+    
+    @property
+    def filtered_data(self):
+        """Records this admin may see, reloaded when the scope's rows change."""
+        version = self.dataset.scope_version(self.admin_grade, self.admin_class)
+        if self._filtered_data is None or self._filtered_version != version:
+            # Filter data based on admin's access rights
+            self._filtered_data = self._apply_role_filters()
+            self._filtered_version = version
+        return self._filtered_data
+    
+    def _scope_index(self):
+        """Index of the scope's students/homework/quizzes, built once per data version."""
+        with stage('retrieval'):
+            return scope_index(self.dataset, self.admin_grade, self.admin_class)
+    
+    def _rows_sampled(self):
+        """True if filtered_data is only a sample of the scope (a streamed file too large to load)."""
+        return bool(self.filtered_data.attrs.get('sample_of'))
     
     def _apply_role_filters(self):
         """Filter the dataset based on admin's access rights."""
-        df = self.full_data.copy()
-        
-        if self.admin_grade is not None:
-            df = df[df['grade'] == self.admin_grade]
-        
-        if self.admin_class is not None:
-            df = df[df['class_section'] == self.admin_class]
-        
-        return df
+        return self.dataset.view(self.admin_grade, self.admin_class)
     
     def get_access_info(self):
         """Return information about admin's access rights."""
+        stats = self.get_aggregates()
         info = {
             'grade': self.admin_grade or 'All grades',
             'class': self.admin_class or 'All classes',
-            'total_records': len(self.filtered_data),
-            'total_students': self.filtered_data['student_name'].nunique()
+            'total_records': stats.total_records,
+            'total_students': stats.total_students
         }
         return info
     
     def _create_data_summary(self):
-        """Create a summary of the data for the AI."""
-        df = self.filtered_data
-        
-        # Get unique students
-        students = df[['student_name', 'grade', 'class_section']].drop_duplicates()
-        
-        # Homework summary
-        hw_summary = df.groupby(['student_name', 'homework_title', 'submission_status']).size().reset_index(name='count')
-        
-        # Quiz summary - handle N/A values
-        quiz_data = df[['student_name', 'quiz_name', 'quiz_score']].copy()
-        quiz_data = quiz_data[quiz_data['quiz_score'] != 'N/A']
-        
-        return {
-            'total_students': len(students),
-            'students_list': students['student_name'].tolist(),
-            'homework_data': hw_summary.to_dict('records')[:50],
-            'quiz_data': quiz_data.to_dict('records')[:50],
-            'columns': list(df.columns),
-            'sample_data': df.head(20).to_dict('records')
-        }
+        """
+        Create a summary of the data for the AI.
+        
+        Built lazily on the first query and shared by every admin with the
+        same scope on the same data version, so follow-up questions skip the
+        pandas work entirely. Treat the returned dict as read-only.
+        """
+        with stage('summary'):
+            return self.dataset.scope_summary(self.admin_grade, self.admin_class)
+    
+    def _answer_without_gemini(self, question, mode='summary'):
+        """Answer from the local engine or the answer cache, or return None."""
+        # Answer common questions locally, without a Gemini round trip
+        answer = self._local_answer(question)
+        if answer is not None:
+            return answer
+        
+        # Reuse an earlier answer for this scope if the data hasn't changed
+        if self.answer_cache is not None:
+            with stage('cache_lookup'):
+                answer = self.answer_cache.get(self._cache_question(question, mode), *self._cache_scope())
+            if answer is not None:
+                self._answered_by('cache')
+                return answer
+        
+        return None
+    
+    def _local_answer(self, question):
+        """The local engine's answer, or None (rows are only loaded when a template matches)."""
+        if self.local_engine is None or self.local_engine.match(question)[0] is None:
+            return None
+        with stage('local_engine'):
+            answer = self.local_engine.answer(question, self.filtered_data, self._scope_index())
+        if answer is not None:
+            self._answered_by('local')
+        return answer
+    
+    def _cache_scope(self):
+        """(scope, data version) used to key cached answers."""
+        return (
+            scope_key(self.admin_grade, self.admin_class, self.data_path),
+            self.dataset.scope_version(self.admin_grade, self.admin_class)
+        )
+    
+    def _cache_question(self, question, mode):
+        # Plan answers are formatted differently, so they're cached separately
+        return question if mode == 'summary' else f"[{mode}] {question}"
+    
+    def _remember_answer(self, question, answer, mode='summary'):
+        if self.answer_cache is not None:
+            with stage('cache_store'):
+                self.answer_cache.put(self._cache_question(question, mode), *self._cache_scope(), answer)
+    
+    def _answered_by(self, source):
+        """Record where the answer came from: 'local', 'cache', 'plan' or 'gemini'."""
+        self.last_answer_source = source
+        trace = current_trace()
+        if trace is not None:
+            trace.source = source
+            trace.cache_hit = source == 'cache'
+    
+    @contextlib.contextmanager
+    def _trace(self, question, mode):
+        """Trace one query (see tracing.py) and log it (see query_log.py)."""
+        tracer = self.tracer if self.tracer is not None else null_tracer
+        scope = scope_key(self.admin_grade, self.admin_class)
+        try:
+            with tracer.trace(question, mode=mode, scope=scope) as trace:
+                self.last_trace = trace
+                try:
+                    yield trace
+                finally:
+                    # The model can change during the query if it had to be re-resolved
+                    trace.attributes['model'] = self.model_name
+        finally:
+            if self.query_log is not None:
+                self._log_query(trace)
+    
+    def _log_query(self, trace):
+        self.query_log.record({
+            'timestamp': trace.started_at,
+            'question': trace.question,
+            'mode': trace.attributes['mode'],
+            'grade': None if self.admin_grade is None else int(self.admin_grade),
+            'class_section': self.admin_class,
+            'data_path': self.data_path,
+            'data_version': self.dataset.scope_version(self.admin_grade, self.admin_class),
+            'prompt_hash': trace.attributes.get('prompt_hash'),
+            'model': self.model_name,
+            'source': trace.source,
+            'latency_ms': round(trace.total_ms, 3),
+            'prompt_tokens': trace.prompt_tokens,
+            'response_tokens': trace.response_tokens,
+            'answer': trace.answer,
+            'error': trace.error and {'type': trace.error['type'], 'message': trace.error['message']},
+        })
+    
+    def _query_error(self, trace, error):
+        """Keep the exception on the trace and the system; return the message shown to the admin."""
+        trace.record_error(error)
+        self.last_error = error
+        return f"❌ Error processing query: {str(error)}\n\nPlease try rephrasing your question."
+    
+    def _plan_answer(self, question, response):
+        """
+        Run the query plan in a Gemini response on this admin's rows.
+        
+        Returns (answer, mode): if the plan is unusable, the question is
+        answered in summary mode instead and None is returned for the answer.
+        """
+        try:
+            with stage('plan_execute'):
+                return answer_from_plan(response.text, self.filtered_data), 'plan'
+        except PlanError as e:
+            print(f"⚠️ Query plan rejected ({e}), answering from the data summary instead")
+            return None, 'summary'
     
-    def query(self, question):
+    def _build_prompt(self, question, mode='summary'):
+        if mode == 'plan':
+            # Schema only: the prompt doesn't grow with the data
+            with stage('prompt_build'):
+                return build_plan_prompt(question, self.filtered_data)
+        
+        # Get data summary
+        data_summary = self._create_data_summary()
+        
+        index = self._scope_index()
+        
+        # Build a prompt that fits the token budget, keeping the rows
+        # relevant to this question
+        with stage('prompt_build'):
+            # The index holds the scope's rows already; filtered_data isn't needed
+            return self.prompt_builder.build(question, index.frame, data_summary, index=index)
+    
+    def query(self, question, mode=None):
         """
         Process a natural language query and return results.
         
         Args:
             question: Natural language question from the admin
+            mode: 'summary' or 'plan' (default: the system's query_mode)
             
         Returns:
             Answer to the query based on filtered data
         """
-        try:
-            # Get data summary
-            data_summary = self._create_data_summary()
+        mode = mode or self.query_mode
+        with self._trace(question, mode) as trace:
+            try:
+                trace.answer = self._query(question, mode)
+            except Exception as e:
+                trace.answer = self._query_error(trace, e)
+            return trace.answer
+    
+    def _query(self, question, mode):
+        answer = self._answer_without_gemini(question, mode)
+        if answer is not None:
+            return answer
+        
+        if mode == 'plan' and not self._rows_sampled():
+            response = self._generate(self._build_prompt(question, 'plan'))
+            answer, mode = self._plan_answer(question, response)
+            if answer is not None:
+                self._answered_by('plan')
+                self._remember_answer(question, answer, mode)
+                return answer
+        
+        prompt = self._build_prompt(question)
+        
+        # Generate response using Gemini
+        response = self._generate(prompt)
+        self._answered_by('gemini')
+        
+        self._remember_answer(question, response.text)
+        return response.text
+    
+    def query_stream(self, question, mode=None):
+        """
+        Like query(), but yield the answer in chunks as Gemini generates it.
+        
+        Local, cached and plan answers are yielded in one piece. If generation
+        fails part-way, the text received so far is followed by the error
+        message, so joining the chunks always gives what the admin saw.
+        """
+        mode = mode or self.query_mode
+        with self._trace(question, mode) as trace:
+            parts = []
+            try:
+                for part in self._query_stream(question, mode):
+                    parts.append(part)
+                    yield part
+            except Exception as e:
+                separator = "\n\n" if parts else ""
+                parts.append(separator + self._query_error(trace, e))
+                yield parts[-1]
+            finally:
+                trace.answer = ''.join(parts)
+    
+    def _query_stream(self, question, mode):
+        answer = self._answer_without_gemini(question, mode)
+        if answer is not None:
+            yield answer
+            return
+        
+        if mode == 'plan' and not self._rows_sampled():
+            response = self._generate(self._build_prompt(question, 'plan'))
+            answer, mode = self._plan_answer(question, response)
+            if answer is not None:
+                self._answered_by('plan')
+                self._remember_answer(question, answer, mode)
+                yield answer
+                return
+        
+        prompt = self._build_prompt(question)
+        
+        response = self._generate(prompt, stream=True)
+        self._answered_by('gemini')
+        
+        parts = []
+        chunk = None
+        with stage('gemini_stream'):
+            for chunk in response:
+                if chunk.text:
+                    parts.append(chunk.text)
+                    yield chunk.text
+        # Gemini reports the token counts on the last chunk
+        self._record_usage(prompt, chunk, ''.join(parts))
+        
+        # Only complete answers are cached
+        self._remember_answer(question, ''.join(parts))
+    
+    async def aquery(self, question, limiter=None, retries=3, deadline=None, mode=None):
+        """
+        Async version of query() for running many questions concurrently.
+        
+        Args:
+            question: Natural language question from the admin
+            limiter: Optional GeminiRateLimiter shared by concurrent queries
+            retries: Retries (with jittered backoff) on 429/5xx errors
+            deadline: Seconds allowed for the whole request, retries included
+            mode: 'summary' or 'plan' (default: the system's query_mode)
             
-            # Create the prompt
-            prompt = f"""You are a helpful AI assistant analyzing student data for a school administrator.
-
-Your task: Answer the following question based on the provided student data.
-
-QUESTION: {question}
-
-DATA AVAILABLE:
-- Total Students: {data_summary['total_students']}
-- Students: {', '.join(data_summary['students_list'])}
-
-COLUMNS IN DATASET:
-- student_id, student_name, grade, class_section
-- homework_title, submission_status, submission_date
-- quiz_name, quiz_score, quiz_date, quiz_scheduled_date
-
-HOMEWORK SUBMISSION DATA (sample):
-{json.dumps(data_summary['homework_data'][:30], indent=2)}
-
-QUIZ SCORE DATA (sample):
-{json.dumps(data_summary['quiz_data'][:30], indent=2)}
-
-FULL SAMPLE DATA:
-{json.dumps(data_summary['sample_data'], indent=2)}
-
-INSTRUCTIONS:
-1. Answer the question clearly and concisely
-2. List specific student names when relevant
-3. For "not submitted" queries, look for submission_status = 'Not Submitted'
-4. For quiz scores, ignore entries with 'N/A' values
-5. Calculate averages only from numeric quiz scores
-6. Use bullet points or numbered lists for clarity when listing multiple items
-7. Be specific with numbers and percentages
-
-Provide a clear, helpful answer now:"""
-
-            # Generate response using Gemini
-            response = self.model.generate_content(prompt)
+        Returns:
+            Answer to the query based on filtered data
+        """
+        mode = mode or self.query_mode
+        with self._trace(question, mode) as trace:
+            try:
+                trace.answer = await asyncio.wait_for(
+                    self._aquery(question, limiter, retries, mode),
+                    timeout=deadline
+                )
             
-            return response.text
+            except asyncio.TimeoutError as e:
+                self._query_error(trace, e)
+                trace.answer = f"❌ Error processing query: no answer within {deadline}s\n\nPlease try again later."
+            except Exception as e:
+                trace.answer = self._query_error(trace, e)
+            return trace.answer
+    
+    async def _aquery(self, question, limiter, retries, mode):
+        # The local engine, prompt building and plan execution work on the
+        # data: run them on a worker thread so the event loop keeps serving
+        # (to_thread copies the context, so their stages land in the trace)
+        answer = await asyncio.to_thread(self._answer_without_gemini, question, mode)
+        if answer is not None:
+            return answer
         
-        except Exception as e:
-            return f"❌ Error processing query: {str(e)}\n\nPlease try rephrasing your question."
+        if mode == 'plan' and not self._rows_sampled():
+            prompt = await asyncio.to_thread(self._build_prompt, question, 'plan')
+            response = await self._generate_async(prompt, limiter, retries)
+            answer, mode = await asyncio.to_thread(self._plan_answer, question, response)
+            if answer is not None:
+                self._answered_by('plan')
+                self._remember_answer(question, answer, mode)
+                return answer
+        
+        prompt = await asyncio.to_thread(self._build_prompt, question)
+        
+        response = await self._generate_async(prompt, limiter, retries)
+        self._answered_by('gemini')
+        
+        self._remember_answer(question, response.text)
+        return response.text
+    
+    def get_aggregates(self):
+        """Precomputed counts and rollups for the admin's scope (see aggregates.py)."""
+        return self.dataset.aggregates(self.admin_grade, self.admin_class)
+    
+    def get_student_features(self, today=None):
+        """Per-student feature table for the admin's scope (see analytics.py)."""
+        return scope_features(self.dataset, self.admin_grade, self.admin_class, today)
     
     def get_data_summary(self):
         """Get a summary of accessible data."""
-        df = self.filtered_data
-        
-        # Calculate submission rate
-        submitted_count = (df['submission_status'] == 'Submitted').sum()
-        total_count = len(df)
-        submission_rate = (submitted_count / total_count * 100) if total_count > 0 else 0
+        stats = self.get_aggregates()
         
         summary = f"""
 📊 Data Access Summary:
 - Grade: {self.admin_grade or 'All'}
 - Class: {self.admin_class or 'All'}
-- Total Students: {df['student_name'].nunique()}
-- Total Records: {len(df)}
-- Submission Rate: {submission_rate:.1f}%
+- Total Students: {stats.total_students}
+- Total Records: {stats.total_records}
+- Submission Rate: {stats.submission_rate:.1f}%
         """
         return summary
 
@@ -254,7 +566,7 @@ def main():
             result = admin_system.query(query)
             print(f"💬 Answer:\n{result}")
             print()
-            
+    
     except Exception as e:
         print(f"❌ Error: {e}")
         print("\n💡 Troubleshooting:")
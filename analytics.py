@@ -0,0 +1,157 @@
+"""
+Per-student feature table and vectorized risk analytics.
+
+"Who scored below 70?" or "who is falling behind?" shouldn't depend on the LLM
+reading a sample of rows. The feature table has one row per student, read off
+the per-student rollups in aggregates.py (one groupby pass over the rows,
+memoized per data version): submission rate, missing assignments, quiz
+mean/min/max, the quiz score trend and days until the next scheduled quiz.
+Ranking, threshold and top-k operations then work on that table, so they
+only touch one row per student however many records there are.
+
+    features = scope_features(system.dataset, grade=8, class_section='A')
+    top_k(features, 'mean_quiz', k=5)
+    at_risk(features)
+"""
+
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from aggregates import LOW_SCORE_THRESHOLD, ScopeAggregates, partition_rollup
+
+FEATURE_COLUMNS = [
+    'student_name', 'grade', 'class_section', 'assignments', 'submitted', 'missing',
+    'submission_rate', 'quiz_count', 'mean_quiz', 'min_quiz', 'max_quiz', 'below_threshold',
+    'quiz_trend', 'next_quiz_date', 'days_to_next_quiz',
+]
+
+# Risk score weights (they add up to 100)
+RISK_WEIGHTS = {'missing': 40, 'score': 35, 'decline': 15, 'low_quizzes': 10}
+
+# A student with this risk score or more is reported as at risk
+RISK_THRESHOLD = 30
+
+# Quiz trends steeper than this many points per week count fully towards the risk score
+DECLINE_SCALE = 5.0
+
+
+def static_features(aggregates):
+    """The date-independent columns of the feature table (everything but the next quiz)."""
+    students = aggregates.students
+    assignments = students['records']
+    return pd.DataFrame({
+        'student_name': students['student_name'],
+        'grade': students['grade'],
+        'class_section': students['class_section'],
+        'assignments': assignments,
+        'submitted': students['submitted'],
+        'missing': students['pending'],
+        'submission_rate': students['submitted'] / assignments.where(assignments > 0) * 100,
+        'quiz_count': students['quiz_count'],
+        'mean_quiz': students['avg_quiz'],
+        'min_quiz': students['min_quiz'],
+        'max_quiz': students['max_quiz'],
+        'below_threshold': students['below_threshold'],
+        'quiz_trend': students['quiz_trend'],
+    })
+
+
+def _with_schedule(features, scheduled, today):
+    """Add each student's next scheduled quiz date and the days until it."""
+    today = pd.Timestamp(today or date.today())
+    upcoming = scheduled[scheduled['quiz_scheduled_date'] >= today]
+    next_quiz = upcoming.groupby('student_name', sort=False, observed=True)['quiz_scheduled_date'].min()
+    next_quiz_date = next_quiz.reindex(features['student_name'].to_numpy()).to_numpy()
+    features = features.assign(next_quiz_date=pd.Series(next_quiz_date, index=features.index, dtype='datetime64[us]'))
+    features['days_to_next_quiz'] = (features['next_quiz_date'] - today).dt.days.astype('Int64')
+    return features
+
+
+def student_features(aggregates, today=None):
+    """
+    Per-student feature table for a ScopeAggregates.
+
+    Args:
+        aggregates: ScopeAggregates of the admin's scope
+        today: Date that `days_to_next_quiz` counts from (default: today)
+
+    Returns:
+        DataFrame with FEATURE_COLUMNS, one row per student, sorted by name
+    """
+    return _with_schedule(static_features(aggregates), aggregates.scheduled, today)
+
+
+def feature_table(df, today=None):
+    """Per-student feature table computed straight from records (e.g. an already filtered frame)."""
+    return student_features(ScopeAggregates([partition_rollup(df)]), today)
+
+
+def scope_features(source, grade=None, class_section=None, today=None):
+    """
+    Per-student feature table for a scope of a Dataset or SQLiteDataSource.
+
+    The date-independent columns are memoized per data version with the
+    scope's aggregates; only the next-quiz columns are computed per call.
+    """
+    aggregates = source.aggregates(grade, class_section)
+    base = source.memoize(('features', grade, class_section), lambda: static_features(aggregates))
+    return _with_schedule(base, aggregates.scheduled, today)
+
+
+def threshold(features, column, value, below=True):
+    """Students whose `column` is below (or above) `value`, worst first."""
+    values = features[column]
+    hits = features[values < value] if below else features[values > value]
+    return hits.sort_values(column, ascending=below, kind='stable')
+
+
+def top_k(features, column, k=5, largest=True):
+    """The `k` students with the largest (or smallest) `column`; students without a value are skipped."""
+    values = features[column].dropna()
+    picked = values.nlargest(k, keep='first') if largest else values.nsmallest(k, keep='first')
+    return features.loc[picked.index]
+
+
+def rank(features, column, ascending=False):
+    """1-based rank of every student by `column` (ties share the best rank, missing values last)."""
+    return features[column].rank(method='min', ascending=ascending, na_option='bottom').astype('int64')
+
+
+def risk_scores(features):
+    """
+    Risk score from 0 to 100 per student, weighted by RISK_WEIGHTS:
+    share of homework missing, how far the quiz average is below
+    LOW_SCORE_THRESHOLD + 10, how fast quiz scores are falling and the share
+    of quizzes below LOW_SCORE_THRESHOLD.
+    """
+    missing = (features['missing'] / features['assignments'].where(features['assignments'] > 0)).fillna(0)
+    score_gap = ((LOW_SCORE_THRESHOLD + 10 - features['mean_quiz']) / 40).clip(0, 1).fillna(0)
+    decline = (-features['quiz_trend'] / DECLINE_SCALE).clip(0, 1).fillna(0)
+    low_quizzes = (features['below_threshold'] / features['quiz_count'].where(features['quiz_count'] > 0)).fillna(0)
+    score = (RISK_WEIGHTS['missing'] * missing + RISK_WEIGHTS['score'] * score_gap
+             + RISK_WEIGHTS['decline'] * decline + RISK_WEIGHTS['low_quizzes'] * low_quizzes)
+    return score.astype('float64').round(1)
+
+
+def _reasons(features):
+    """Short, human-readable reasons behind each student's risk score."""
+    columns = [
+        np.where(features['missing'] > 0, features['missing'].astype(str) + " missing", ''),
+        np.where(features['mean_quiz'] < LOW_SCORE_THRESHOLD,
+                 "quiz avg " + features['mean_quiz'].round(1).astype(str), ''),
+        np.where(features['quiz_trend'] < -1,
+                 "falling " + (-features['quiz_trend']).round(1).astype(str) + " pts/week", ''),
+        np.where(features['below_threshold'] > 0,
+                 features['below_threshold'].astype(str) + f" quiz score(s) below {LOW_SCORE_THRESHOLD}", ''),
+    ]
+    return pd.Series(['; '.join(part for part in parts if part) for parts in zip(*columns)],
+                     index=features.index)
+
+
+def at_risk(features, min_score=RISK_THRESHOLD):
+    """Students with a risk score of at least `min_score`, highest first, with `risk` and `reasons` columns."""
+    scored = features.assign(risk=risk_scores(features))
+    flagged = scored[scored['risk'] >= min_score].sort_values('risk', ascending=False, kind='stable')
+    return flagged.assign(reasons=_reasons(flagged))
@@ -0,0 +1,140 @@
+"""
+Batch querying across admin scopes, e.g. for nightly reports.
+
+Runs many (scope, question) pairs concurrently through
+AdminQuerySystem.aquery, sharing one rate limiter so the whole batch stays
+inside the Gemini quota.
+
+Usage:
+    python batch_query.py --output report.jsonl
+    python batch_query.py --question "Who needs extra help?" --concurrency 8
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from dotenv import load_dotenv
+
+from ai_query_system_gemini import AdminQuerySystem
+from data_store import get_dataset_store
+from rate_limit import GeminiRateLimiter
+
+load_dotenv()
+
+DEFAULT_QUESTIONS = [
+    "Which students haven't submitted their homework yet?",
+    "List all students who scored below 70 in quizzes",
+    "What's the average quiz score for my students?",
+    "Which students need extra attention this week, and why?",
+]
+
+
+async def query_many(pairs, api_key=None, limiter=None, concurrency=4, deadline=120,
+                     retries=3, data_path=None):
+    """
+    Answer many (scope, question) pairs concurrently.
+
+    Args:
+        pairs: Iterable of ((admin_grade, admin_class), question)
+        api_key: Gemini API key
+        limiter: GeminiRateLimiter shared by all requests (default: from env)
+        concurrency: Maximum requests in flight
+        deadline: Seconds allowed per request, retries included
+        retries: Retries per request on 429/5xx errors
+        data_path: Student data file (default: $STUDENT_DATA_PATH or student_data.csv)
+
+    Returns:
+        List of result dicts, in the same order as `pairs`
+    """
+    pairs = list(pairs)
+    limiter = limiter or GeminiRateLimiter.from_env()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    # One system per scope, shared by every question for that scope
+    systems = {}
+    for scope, _ in pairs:
+        if scope not in systems:
+            systems[scope] = AdminQuerySystem(
+                api_key=api_key,
+                admin_grade=scope[0],
+                admin_class=scope[1],
+                data_path=data_path
+            )
+
+    async def run(scope, question):
+        async with semaphore:
+            started = time.perf_counter()
+            answer = await systems[scope].aquery(
+                question, limiter=limiter, retries=retries, deadline=deadline
+            )
+            return {
+                'grade': scope[0],
+                'class': scope[1],
+                'question': question,
+                'answer': answer,
+                'seconds': round(time.perf_counter() - started, 3),
+            }
+
+    try:
+        return await asyncio.gather(*(run(scope, question) for scope, question in pairs))
+    finally:
+        for system in systems.values():
+            system.close()
+
+
+def all_scopes(data_path=None):
+    """Every (grade, class_section) pair present in the data."""
+    store = get_dataset_store()
+    dataset = store.acquire(data_path or os.getenv('STUDENT_DATA_PATH', 'student_data.csv'))
+    try:
+        return [(int(grade), section) for grade, section in dataset.partitions]
+    finally:
+        store.release(dataset)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run questions for every grade/section concurrently.")
+    parser.add_argument('--question', action='append', dest='questions',
+                        help="Question to ask every scope (repeatable; default: report questions)")
+    parser.add_argument('--data', default=os.getenv('STUDENT_DATA_PATH', 'student_data.csv'),
+                        help="Student data file (CSV, Parquet or Arrow)")
+    parser.add_argument('--output', default='report.jsonl', help="JSONL file to write results to")
+    parser.add_argument('--concurrency', type=int, default=4, help="Requests in flight")
+    parser.add_argument('--rpm', type=int, default=int(os.getenv('GEMINI_RPM', 15)), help="Requests per minute")
+    parser.add_argument('--rpd', type=int, default=int(os.getenv('GEMINI_RPD', 1500)), help="Requests per day")
+    parser.add_argument('--deadline', type=float, default=120, help="Seconds per request")
+    args = parser.parse_args()
+
+    api_key = os.getenv('GEMINI_API_KEY')
+    if not api_key:
+        print("❌ Please set GEMINI_API_KEY in your .env file")
+        return
+
+    questions = args.questions or DEFAULT_QUESTIONS
+    pairs = [(scope, question) for scope in all_scopes(args.data) for question in questions]
+    print(f"📋 Running {len(pairs)} queries ({len(questions)} questions × {len(pairs) // len(questions)} scopes)")
+
+    started = time.perf_counter()
+    results = asyncio.run(query_many(
+        pairs,
+        api_key=api_key,
+        limiter=GeminiRateLimiter(args.rpm, args.rpd),
+        concurrency=args.concurrency,
+        deadline=args.deadline,
+        data_path=args.data
+    ))
+
+    with open(args.output, 'w') as f:
+        for result in results:
+            f.write(json.dumps(result) + '\n')
+
+    failed = sum(result['answer'].startswith('❌') for result in results)
+    print(f"✅ Wrote {len(results)} answers to {args.output} in {time.perf_counter() - started:.1f}s"
+          f" ({failed} failed)")
+
+
+if __name__ == "__main__":
+    main()
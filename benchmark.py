@@ -0,0 +1,217 @@
+"""
+Benchmarks for the query pipeline, runnable offline.
+
+Generates seeded datasets of several sizes (create_sample_data.py) and times
+each stage of AdminQuerySystem against a FakeGenerativeModel: data load,
+role filtering, the data summary, prompt construction and end-to-end
+query(). Reports p50/p95 latency, throughput, peak memory and prompt tokens,
+and can save the results as a baseline or compare a run against one.
+
+Usage:
+    python benchmark.py
+    python benchmark.py --sizes 10000 1000000 --latency 0.2
+    python benchmark.py --save-baseline benchmark_baseline.json
+    python benchmark.py --compare benchmark_baseline.json     # exit code 1 on regressions
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from ai_query_system_gemini import AdminQuerySystem
+from create_sample_data import Roster, generate_chunks, write_chunks
+from data_store import DatasetStore, get_dataset_store
+from fake_model import FakeGenerativeModel, FakeModelResolver
+from prompt_builder import estimate_tokens
+
+# Both kinds of question: the first two are answered by the local engine
+QUESTIONS = [
+    "Which students haven't submitted their homework yet?",
+    "What's the average quiz score for my students?",
+    "Which students need extra attention this week, and why?",
+    "How is Aarav Kumar doing in science?",
+    "Summarize homework completion by class section",
+]
+
+SCOPES = [(8, 'A'), (None, 'A'), (None, None)]
+
+STAGES = ['load', 'role_filter', 'summary', 'prompt', 'query']
+
+# Fixed date so the generated data (and the prompts) are the same every run
+DATA_DATE = date(2025, 1, 15)
+
+
+def make_dataset(rows, folder):
+    """Write a seeded dataset of about `rows` records and return its path."""
+    grades, sections, homeworks = [8, 9, 10], ['A', 'B'], 4
+    per_section = max(-(-rows // (homeworks * len(grades) * len(sections))), 1)
+    path = os.path.join(folder, f'bench_{rows}.csv')
+    with contextlib.redirect_stdout(io.StringIO()):
+        write_chunks(generate_chunks(Roster(grades, sections, per_section), homeworks=homeworks,
+                                     seed=0, today=DATA_DATE), path)
+    return path
+
+
+def measure(fn, repeat):
+    """Time `fn(i)` for i in range(repeat); peak memory comes from one extra traced call."""
+    durations = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(repeat):
+            started = time.perf_counter()
+            fn(i)
+            durations.append(time.perf_counter() - started)
+
+        tracemalloc.start()
+        try:
+            fn(repeat)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    durations = np.array(durations)
+    return {
+        'p50_ms': round(float(np.percentile(durations, 50)) * 1000, 3),
+        'p95_ms': round(float(np.percentile(durations, 95)) * 1000, 3),
+        'throughput': round(repeat / durations.sum(), 2),
+        'peak_mb': round(peak / 1e6, 2),
+    }
+
+
+def benchmark_size(path, repeat, latency):
+    """Run every stage on the dataset at `path`; return {stage: metrics}."""
+    results = {}
+
+    results['load'] = measure(lambda i: DatasetStore().acquire(path), max(repeat // 10, 3))
+
+    model = FakeGenerativeModel(latency=latency)
+    with contextlib.redirect_stdout(io.StringIO()):
+        systems = [
+            AdminQuerySystem(api_key='offline', admin_grade=grade, admin_class=class_section,
+                             data_path=path, answer_cache=None, model_resolver=FakeModelResolver(model),
+                             query_log=None)
+            for grade, class_section in SCOPES
+        ]
+    dataset = systems[0].dataset
+
+    def role_filter(i):
+        dataset._views.clear()
+        systems[i % len(systems)]._apply_role_filters()
+
+    def summary(i):
+        dataset._memo.clear()
+        systems[i % len(systems)]._create_data_summary()
+
+    results['role_filter'] = measure(role_filter, repeat)
+    results['summary'] = measure(summary, repeat)
+
+    prompts = []
+
+    def prompt(i):
+        prompts.append(systems[i % len(systems)]._build_prompt(QUESTIONS[i % len(QUESTIONS)]))
+
+    results['prompt'] = measure(prompt, repeat)
+    results['prompt']['prompt_tokens'] = round(float(np.mean([estimate_tokens(p) for p in prompts])), 1)
+
+    model.reset()
+    results['query'] = measure(lambda i: systems[i % len(systems)].query(QUESTIONS[i % len(QUESTIONS)]), repeat)
+    results['query']['prompt_tokens'] = round(model.prompt_tokens / max(model.calls, 1), 1)
+    results['query']['model_calls'] = model.calls
+
+    for system in systems:
+        system.close()
+    get_dataset_store().clear()
+    return results
+
+
+def print_report(results):
+    for rows, stages in results.items():
+        print(f"\n📏 {int(rows):,} rows")
+        print(f"  {'stage':<12} {'p50 ms':>10} {'p95 ms':>10} {'ops/s':>10} {'peak MB':>9} {'tokens':>8}")
+        for stage in STAGES:
+            m = stages[stage]
+            tokens = f"{m['prompt_tokens']:.0f}" if 'prompt_tokens' in m else '-'
+            print(f"  {stage:<12} {m['p50_ms']:>10.2f} {m['p95_ms']:>10.2f} {m['throughput']:>10.1f} "
+                  f"{m['peak_mb']:>9.1f} {tokens:>8}")
+
+
+def compare(results, baseline, tolerance):
+    """Print changes against `baseline`; return the list of regressions."""
+    regressions = []
+    print(f"\n📊 Compared with baseline (tolerance {tolerance:.0%}):")
+    for rows, stages in results.items():
+        for stage, m in stages.items():
+            old = baseline.get(rows, {}).get(stage)
+            if old is None:
+                continue
+            for metric in ('p50_ms', 'p95_ms', 'peak_mb', 'prompt_tokens'):
+                if metric not in m or not old.get(metric):
+                    continue
+                change = m[metric] / old[metric] - 1
+                flag = ''
+                # p95 and sub-millisecond timings are too noisy to fail a run on their own
+                noisy = metric == 'p95_ms' or (metric == 'p50_ms' and max(m[metric], old[metric]) < 1)
+                if change > tolerance and not noisy:
+                    regressions.append((rows, stage, metric, change))
+                    flag = ' ❌'
+                print(f"  {int(rows):>9,} {stage:<12} {metric:<14} {old[metric]:>10} → {m[metric]:<10} "
+                      f"({change:+.0%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the query pipeline offline.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000], help="Dataset sizes (rows)")
+    parser.add_argument('--repeat', type=int, default=30,
+                        help="Timed runs per stage (a multiple of 15 cycles evenly through questions and scopes)")
+    parser.add_argument('--latency', type=float, default=0.0, help="Simulated Gemini latency (seconds)")
+    parser.add_argument('--save-baseline', metavar='PATH', help="Write the results to PATH")
+    parser.add_argument('--compare', metavar='PATH', help="Compare with a saved baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed slowdown before failing")
+    parser.add_argument('--output', metavar='PATH', help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for rows in args.sizes:
+            print(f"⏱️ Benchmarking {rows:,} rows...")
+            results[str(rows)] = benchmark_size(make_dataset(rows, folder), args.repeat, args.latency)
+
+    print_report(results)
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'repeat': args.repeat,
+        'latency': args.latency,
+        'results': results,
+    }
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Saved results to {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline['results'], args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            sys.exit(1)
+        print("\n✅ No regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Multi-turn chat about one admin's scope.
+
+AdminQuerySystem.query is stateless: every question rebuilds and resends the
+data summary, and a follow-up like "and which of them are in Section B?" has
+nothing to refer to. A ChatSession builds the scope's data context once per
+data version and keeps it out of the per-turn prompt:
+
+- with Gemini context caching (when the model supports it and the context is
+  large enough), the context is uploaded once and each turn only sends the
+  question and recent history;
+- otherwise the context leads the chat history, built once instead of per
+  question.
+
+Earlier turns are kept within a token budget: the most recent ones verbatim,
+older ones condensed to one line each, the oldest dropped.
+
+    chat = ChatSession(system)
+    chat.send("Which students haven't submitted their homework?")
+    chat.send("And which of them are in Section B?")
+"""
+
+from datetime import timedelta
+
+import google.generativeai as genai
+
+from prompt_builder import estimate_tokens
+from tracing import stage
+
+# Gemini refuses to cache less than this many tokens
+MIN_CACHED_TOKENS = 4096
+
+CONTEXT_REPLY = "Understood. I'll answer the administrator's questions from this data."
+
+
+class ChatSession:
+    """A conversation with Gemini about the data an AdminQuerySystem can see."""
+
+    def __init__(self, system, history_tokens=1500, context_cache=True, cache_ttl=3600):
+        """
+        Args:
+            system: AdminQuerySystem for the admin's scope
+            history_tokens: Token budget for earlier turns sent with each question
+            context_cache: Upload the data context with Gemini context caching when possible
+            cache_ttl: Seconds a cached context lives without being used
+        """
+        self.system = system
+        self.history_tokens = history_tokens
+        self.context_cache = context_cache
+        self.cache_ttl = cache_ttl
+        self.turns = []
+        self._context = None
+        self._context_version = None
+        self._cached = None
+        self._cached_model = None
+
+    def _refresh_context(self):
+        """Build the data context once per data version (and cache it if possible)."""
+        version = self.system.dataset.scope_version(self.system.admin_grade, self.system.admin_class)
+        if version == self._context_version:
+            return
+
+        self._drop_cached_context()
+        with stage('prompt_build'):
+            self._context = self.system.prompt_builder.build_context(
+                self.system.filtered_data, self.system._create_data_summary()
+            )
+        self._context_version = version
+
+        if self.context_cache and estimate_tokens(self._context) >= MIN_CACHED_TOKENS and \
+           isinstance(self.system.model, genai.GenerativeModel):
+            self._cache_context()
+
+    def _cache_context(self):
+        try:
+            from google.generativeai import caching
+            self._cached = caching.CachedContent.create(
+                model=self.system.model_name,
+                system_instruction=self._context,
+                ttl=timedelta(seconds=self.cache_ttl),
+            )
+            self._cached_model = genai.GenerativeModel.from_cached_content(self._cached)
+        except Exception as e:
+            # Not every model (or key) supports caching; don't try again this session
+            print(f"⚠️ Context caching unavailable ({e}), sending the data context with the chat instead")
+            self.context_cache = False
+            self._cached = self._cached_model = None
+
+    def _drop_cached_context(self):
+        if self._cached is not None:
+            try:
+                self._cached.delete()
+            except Exception:
+                pass  # It expires on its own
+        self._cached = self._cached_model = None
+
+    def _history(self):
+        """
+        Chat history for the next turn: recent turns verbatim within the
+        token budget, and a one-line-per-turn summary of older ones.
+        """
+        recent, summary = [], []
+        budget = self.history_tokens
+        for question, answer in reversed(self.turns):
+            cost = estimate_tokens(question) + estimate_tokens(answer)
+            if not summary and cost <= budget:
+                recent.insert(0, (question, answer))
+                budget -= cost
+                continue
+            line = f"- Q: {question} → A: {' '.join(answer.split())[:150]}"
+            if estimate_tokens(line) > budget:
+                break
+            summary.insert(0, line)
+            budget -= estimate_tokens(line)
+
+        history = []
+        if self._cached_model is None:
+            history += [{'role': 'user', 'parts': [self._context]}, {'role': 'model', 'parts': [CONTEXT_REPLY]}]
+        if summary:
+            history += [
+                {'role': 'user', 'parts': ["Summary of our earlier conversation:\n" + '\n'.join(summary)]},
+                {'role': 'model', 'parts': ["Noted."]},
+            ]
+        for question, answer in recent:
+            history += [{'role': 'user', 'parts': [question]}, {'role': 'model', 'parts': [answer]}]
+        return history
+
+    def _start(self):
+        self._refresh_context()
+        history = self._history()
+        model = self._cached_model or self.system.model
+        prompt = '\n'.join(part for content in history for part in content['parts'])
+        return model.start_chat(history=history), prompt
+
+    def _local_answer(self, question):
+        # Standalone common questions are still answered without Gemini
+        return self.system._local_answer(question)
+
+    def send(self, question):
+        """Ask the next question and return the answer."""
+        with self.system._trace(question, 'chat') as trace:
+            try:
+                answer = self._local_answer(question)
+                if answer is None:
+                    chat, prompt = self._start()
+                    with stage('gemini_call'):
+                        response = chat.send_message(question)
+                    self.system._record_usage(prompt + question, response)
+                    self.system._answered_by('gemini')
+                    answer = response.text
+                self.turns.append((question, answer))
+            except Exception as e:
+                answer = self.system._query_error(trace, e)
+            trace.answer = answer
+            return answer
+
+    def send_stream(self, question):
+        """Like send(), but yield the answer in chunks as Gemini generates it."""
+        with self.system._trace(question, 'chat') as trace:
+            parts = []
+            try:
+                answer = self._local_answer(question)
+                if answer is not None:
+                    parts.append(answer)
+                    yield answer
+                else:
+                    chat, prompt = self._start()
+                    with stage('gemini_call'):
+                        response = chat.send_message(question, stream=True)
+                    self.system._answered_by('gemini')
+                    chunk = None
+                    with stage('gemini_stream'):
+                        for chunk in response:
+                            if chunk.text:
+                                parts.append(chunk.text)
+                                yield chunk.text
+                    self.system._record_usage(prompt + question, chunk, ''.join(parts))
+                # Only complete answers become history
+                self.turns.append((question, ''.join(parts)))
+            except Exception as e:
+                separator = "\n\n" if parts else ""
+                parts.append(separator + self.system._query_error(trace, e))
+                yield parts[-1]
+            finally:
+                trace.answer = ''.join(parts)
+
+    def reset(self):
+        """Forget the conversation (the data context is kept)."""
+        self.turns = []
+
+    def close(self):
+        """Forget the conversation and delete the cached context, if any."""
+        self.reset()
+        self._drop_cached_context()
+        self._context_version = None
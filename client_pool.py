@@ -0,0 +1,424 @@
+"""
+Load-balanced pool of Gemini backends (API key × model) with failover.
+
+One API key bound to one model means a per-key rate limit throttles every
+query and a model outage fails them all. The pool spreads requests over every
+configured (key, model) backend:
+
+- weighted least-outstanding-requests: the backend with the fewest requests
+  in flight per unit of weight gets the next one;
+- a circuit breaker per backend: after `failure_threshold` consecutive
+  failures it is skipped for `reset_timeout` seconds, then one trial request
+  decides whether it closes again; a 429 benches it for `throttle_cooldown`;
+- tiers: 'fallback' models (flash, by default) only take traffic when every
+  preferred backend is open, throttled or slower than `slow_ms`;
+- a failed request moves on to the next backend before giving up.
+
+The pool behaves like a GenerativeModel, and PoolResolver hands it to
+AdminQuerySystem:
+
+    pool = ClientPool.from_env()   # GEMINI_API_KEYS, GEMINI_POOL_MODELS
+    system = AdminQuerySystem(model_resolver=PoolResolver(pool))
+    pool.print_stats()
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from google.ai import generativelanguage as glm
+from google.generativeai.types import content_types, generation_types, safety_types
+
+from model_resolver import ResolvedModel
+from rate_limit import is_retryable
+
+DEFAULT_POOL_MODELS = ['gemini-1.5-pro', 'gemini-1.5-flash']
+
+# Status codes that mean "try another backend"; anything else (a bad request)
+# would fail the same way everywhere
+FAILOVER_STATUS = {404, 408, 429, 500, 502, 503, 504}
+
+
+class PoolExhaustedError(RuntimeError):
+    """No backend is available to take the request."""
+
+
+class CircuitBreaker:
+    """Closed → open after repeated failures → half-open trial → closed."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allows(self):
+        """True if a request may go through now (one at a time while half-open)."""
+        state = self.state
+        return state == 'closed' or (state == 'half-open' and not self._trial)
+
+    def on_start(self):
+        if self.state == 'half-open':
+            self._trial = True
+
+    def on_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def on_release(self):
+        """The request ended without a verdict (throttled or cancelled): let the next one be the trial."""
+        self._trial = False
+
+    def on_failure(self):
+        self.failures += 1
+        self._trial = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class Backend:
+    """One (API key, model) pair and its health."""
+
+    def __init__(self, name, model, weight=1.0, tier='preferred', failure_threshold=5, reset_timeout=30.0):
+        """
+        Args:
+            name: Label for stats, e.g. 'gemini-1.5-pro#key2'
+            model: GenerativeModel (or anything with the same methods)
+            weight: Share of traffic relative to the other backends in its tier
+            tier: 'preferred' or 'fallback'
+        """
+        self.name = name
+        self.model = model
+        self.weight = weight
+        self.tier = tier
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self.throttled_until = 0.0
+        self.slow_until = 0.0
+        self.latency_ewma = None
+        self.latencies = deque(maxlen=500)
+
+    def available(self):
+        return self.breaker.allows() and time.monotonic() >= self.throttled_until
+
+    def _state(self):
+        now = time.monotonic()
+        if now < self.throttled_until:
+            return 'throttled'
+        if self.breaker.state == 'closed' and now < self.slow_until:
+            return 'slow'
+        return self.breaker.state
+
+    def load(self):
+        """Weighted outstanding requests, the balancing key."""
+        return (self.outstanding + 1) / self.weight
+
+    def stats(self):
+        latencies = np.array(self.latencies) if self.latencies else None
+        return {
+            'backend': self.name,
+            'tier': self.tier,
+            'state': self._state(),
+            'outstanding': self.outstanding,
+            'requests': self.requests,
+            'errors': self.errors,
+            'throttled': self.throttled,
+            'error_rate': self.errors / self.requests if self.requests else 0.0,
+            'p50_ms': None if latencies is None else float(np.percentile(latencies, 50)),
+            'p95_ms': None if latencies is None else float(np.percentile(latencies, 95)),
+        }
+
+
+class ClientPool:
+    """Spread Gemini calls over backends with balancing, circuit breakers and failover."""
+
+    def __init__(self, backends, slow_ms=None, slow_cooldown=30.0, throttle_cooldown=10.0, max_attempts=None):
+        """
+        Args:
+            backends: Backend objects
+            slow_ms: Preferred backends slower than this (latency EWMA) give way to
+                the fallback tier for `slow_cooldown` seconds, then get a retry
+            throttle_cooldown: Seconds a backend is skipped after a 429
+            max_attempts: Backends tried per request (default: all of them)
+        """
+        if not backends:
+            raise ValueError("A client pool needs at least one backend")
+        self.backends = list(backends)
+        self.slow_ms = slow_ms
+        self.slow_cooldown = slow_cooldown
+        self.throttle_cooldown = throttle_cooldown
+        self.max_attempts = max_attempts or len(self.backends)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """
+        Pool over GEMINI_API_KEYS (comma-separated; default GEMINI_API_KEY) ×
+        GEMINI_POOL_MODELS (comma-separated 'name' or 'name:weight'; models
+        with 'flash' in the name are the fallback tier). GEMINI_POOL_SLOW_MS
+        sets the latency that triggers failover to the fallback tier.
+        """
+        keys = [k.strip() for k in os.getenv('GEMINI_API_KEYS', os.getenv('GEMINI_API_KEY', '')).split(',')
+                if k.strip()]
+        if not keys:
+            raise ValueError("Set GEMINI_API_KEYS (or GEMINI_API_KEY) to build a client pool")
+
+        models = []
+        for spec in os.getenv('GEMINI_POOL_MODELS', ','.join(DEFAULT_POOL_MODELS)).split(','):
+            name, _, weight = spec.strip().partition(':')
+            models.append((name, float(weight or 1)))
+
+        slow_ms = os.getenv('GEMINI_POOL_SLOW_MS')
+        return cls.from_keys(keys, models, slow_ms=float(slow_ms) if slow_ms else None)
+
+    @classmethod
+    def from_keys(cls, keys, models, **kwargs):
+        """
+        One backend per (key, model).
+
+        Args:
+            keys: Gemini API keys
+            models: (model name, weight) pairs; 'flash' models are the fallback
+                tier unless every model is a flash model
+        """
+        all_flash = all('flash' in name for name, _ in models)
+        backends = []
+        for i, key in enumerate(keys, 1):
+            for name, weight in models:
+                tier = 'fallback' if 'flash' in name and not all_flash else 'preferred'
+                label = name if len(keys) == 1 else f"{name}#key{i}"
+                backends.append(Backend(label, KeyedModel(name, key), weight=weight, tier=tier))
+        return cls(backends, **kwargs)
+
+    @property
+    def model_name(self):
+        return '+'.join(dict.fromkeys(b.model.model_name.removeprefix('models/') for b in self.backends))
+
+    def _pick(self, tried):
+        """The least loaded available backend, preferring the preferred tier while it is healthy."""
+        candidates = [b for b in self.backends if b not in tried and b.available()]
+        if not candidates:
+            raise PoolExhaustedError("No Gemini backend available (all open, throttled or tried)")
+
+        now = time.monotonic()
+        preferred = [b for b in candidates if b.tier == 'preferred' and now >= b.slow_until]
+        fallback = [b for b in candidates if b.tier == 'fallback']
+        return min(preferred or fallback or candidates, key=Backend.load)
+
+    def _choose(self, tried):
+        with self._lock:
+            backend = self._pick(tried)
+            backend.breaker.on_start()
+            backend.outstanding += 1
+            backend.requests += 1
+            return backend
+
+    def _finish(self, backend, started, error=None):
+        with self._lock:
+            backend.outstanding -= 1
+            if error is None:
+                elapsed = (time.perf_counter() - started) * 1000
+                backend.latencies.append(elapsed)
+                backend.latency_ewma = elapsed if backend.latency_ewma is None else \
+                    0.8 * backend.latency_ewma + 0.2 * elapsed
+                backend.breaker.on_success()
+                if self.slow_ms is not None and backend.latency_ewma > self.slow_ms:
+                    # Start afresh after the cooldown, so one fast answer brings it back
+                    backend.slow_until = time.monotonic() + self.slow_cooldown
+                    backend.latency_ewma = None
+                return
+
+            backend.errors += 1
+            if getattr(error, 'code', None) == 429:
+                backend.throttled += 1
+                backend.throttled_until = time.monotonic() + self.throttle_cooldown
+                backend.breaker.on_release()
+            elif self._should_fail_over(error):
+                backend.breaker.on_failure()
+            else:
+                # The backend answered; the request itself was bad
+                backend.breaker.on_success()
+
+    def _cancel(self, backend):
+        """A request abandoned by its caller says nothing about the backend's health."""
+        with self._lock:
+            backend.outstanding -= 1
+            backend.breaker.on_release()
+
+    @staticmethod
+    def _should_fail_over(error):
+        return isinstance(error, PoolExhaustedError) or getattr(error, 'code', None) in FAILOVER_STATUS \
+            or is_retryable(error)
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        """GenerativeModel.generate_content on the best backend, failing over on 429/5xx/404."""
+        tried = []
+        while True:
+            backend = self._choose(tried)
+            tried.append(backend)
+            started = time.perf_counter()
+            try:
+                response = backend.model.generate_content(prompt, stream=stream, **kwargs)
+            except Exception as e:
+                self._finish(backend, started, e)
+                if not self._should_fail_over(e) or len(tried) >= self.max_attempts:
+                    raise
+                continue
+            if stream:
+                # The backend stays busy until the stream is consumed
+                return self._tracked_stream(backend, started, response)
+            self._finish(backend, started)
+            return response
+
+    def _tracked_stream(self, backend, started, response):
+        try:
+            yield from response
+        except Exception as e:
+            self._finish(backend, started, e)
+            raise
+        except GeneratorExit:
+            self._finish(backend, started)
+            raise
+        self._finish(backend, started)
+
+    async def generate_content_async(self, prompt, **kwargs):
+        """Async generate_content with the same balancing and failover."""
+        tried = []
+        while True:
+            backend = self._choose(tried)
+            tried.append(backend)
+            started = time.perf_counter()
+            try:
+                response = await backend.model.generate_content_async(prompt, **kwargs)
+            except asyncio.CancelledError:
+                self._cancel(backend)
+                raise
+            except Exception as e:
+                self._finish(backend, started, e)
+                if not self._should_fail_over(e) or len(tried) >= self.max_attempts:
+                    raise
+                continue
+            self._finish(backend, started)
+            return response
+
+    def count_tokens(self, prompt):
+        return self.backends[0].model.count_tokens(prompt)
+
+    def start_chat(self, history=None):
+        """A chat on the backend that would take the next request (no failover mid-conversation)."""
+        with self._lock:
+            backend = self._pick([])
+        return backend.model.start_chat(history=history)
+
+    def stats(self):
+        """Per-backend request, error and latency stats."""
+        with self._lock:
+            return [b.stats() for b in self.backends]
+
+    def print_stats(self):
+        print(f"  {'backend':<32} {'tier':<9} {'state':<10} {'reqs':>6} {'errors':>6} {'429s':>5} "
+              f"{'p50 ms':>8} {'p95 ms':>8}")
+        for s in self.stats():
+            p50 = '-' if s['p50_ms'] is None else f"{s['p50_ms']:.0f}"
+            p95 = '-' if s['p95_ms'] is None else f"{s['p95_ms']:.0f}"
+            print(f"  {s['backend']:<32} {s['tier']:<9} {s['state']:<10} {s['requests']:>6} {s['errors']:>6} "
+                  f"{s['throttled']:>5} {p50:>8} {p95:>8}")
+
+
+class PoolResolver:
+    """ModelResolver stand-in that hands every system the same ClientPool."""
+
+    def __init__(self, pool, input_token_limit=None):
+        self.pool = pool
+        self.input_token_limit = input_token_limit
+
+    def resolve(self, api_key, force_refresh=False):
+        return ResolvedModel(self.pool.model_name, self.input_token_limit, self.pool)
+
+
+class KeyedModel:
+    """
+    A Gemini model that calls the API with its own key instead of genai.configure's.
+
+    genai keeps one process-wide key, so a pool backend builds its requests
+    with the public genai types and sends them through GenerativeService
+    clients configured with its key.
+    """
+
+    def __init__(self, name, api_key):
+        self.model_name = name if name.startswith('models/') else f"models/{name}"
+        self.client_options = {'api_key': api_key}
+        self.client = glm.GenerativeServiceClient(client_options=self.client_options)
+        # Created on first use, inside the event loop that uses it
+        self.async_client = None
+
+    def _request(self, contents, generation_config=None, safety_settings=None):
+        request = glm.GenerateContentRequest(
+            model=self.model_name,
+            contents=content_types.to_contents(contents),
+            generation_config=generation_types.to_generation_config_dict(generation_config),
+            safety_settings=safety_types.normalize_safety_settings(safety_types.to_easy_safety_dict(safety_settings)),
+        )
+        if request.contents and not request.contents[-1].role:
+            request.contents[-1].role = 'user'
+        return request
+
+    def generate_content(self, contents, stream=False, generation_config=None, safety_settings=None,
+                         request_options=None):
+        request = self._request(contents, generation_config, safety_settings)
+        if stream:
+            with generation_types.rewrite_stream_error():
+                chunks = self.client.stream_generate_content(request, **(request_options or {}))
+            return generation_types.GenerateContentResponse.from_iterator(chunks)
+        response = self.client.generate_content(request, **(request_options or {}))
+        return generation_types.GenerateContentResponse.from_response(response)
+
+    async def generate_content_async(self, contents, generation_config=None, safety_settings=None,
+                                     request_options=None):
+        if self.async_client is None:
+            self.async_client = glm.GenerativeServiceAsyncClient(client_options=self.client_options)
+        request = self._request(contents, generation_config, safety_settings)
+        response = await self.async_client.generate_content(request, **(request_options or {}))
+        return generation_types.AsyncGenerateContentResponse.from_response(response)
+
+    def count_tokens(self, contents):
+        request = glm.CountTokensRequest(model=self.model_name, contents=content_types.to_contents(contents))
+        return self.client.count_tokens(request)
+
+    def start_chat(self, history=None):
+        return KeyedChatSession(self, history)
+
+
+class KeyedChatSession:
+    """Chat on a KeyedModel: every message is sent with the history before it."""
+
+    def __init__(self, model, history=None):
+        self.model = model
+        self.history = content_types.to_contents(history or [])
+
+    def send_message(self, content, stream=False, **kwargs):
+        message = content_types.to_content(content)
+        if not message.role:
+            message.role = 'user'
+        response = self.model.generate_content(self.history + [message], stream=stream, **kwargs)
+        self.history.append(message)
+        if not stream:
+            self.history.append(response.candidates[0].content)
+        return response
+
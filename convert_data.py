@@ -0,0 +1,53 @@
+"""
+Convert the student data to a columnar format.
+
+Reads student_data.csv or student_data.json and writes Parquet or Arrow IPC,
+with typed columns and rows sorted by grade/class so admins' scope filters
+can skip whole row groups.
+
+Usage:
+    python convert_data.py student_data.csv student_data.parquet
+    python convert_data.py student_data.json student_data.arrow
+
+Then point the app at it:
+    STUDENT_DATA_PATH=student_data.parquet streamlit run streamlit_app_gemini.py
+"""
+
+import argparse
+import os
+
+import pandas as pd
+
+from data_schema import apply_schema, load_student_data, memory_report
+from storage import CsvStorage, open_storage, write_storage
+
+
+def read_source(path):
+    """Load a CSV, JSON (records), JSONL, Parquet or Arrow export with the typed schema."""
+    if path.lower().endswith(('.json', '.jsonl')):
+        lines = path.lower().endswith('.jsonl')
+        return apply_schema(pd.read_json(path, orient='records', lines=lines, convert_dates=False, dtype=False))
+
+    storage = open_storage(path)
+    if type(storage) is CsvStorage:
+        return load_student_data(path, report=False)
+    return storage.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert student data between CSV/JSON and Parquet/Arrow.")
+    parser.add_argument('source', help="Input file (.csv, .json or .jsonl)")
+    parser.add_argument('target', help="Output file (.parquet, .arrow/.feather or .csv)")
+    args = parser.parse_args()
+
+    df = read_source(args.source)
+    write_storage(df, args.target)
+
+    typed, _ = memory_report(df)
+    print(f"✅ Wrote {len(df)} records to {args.target}")
+    print(f"   {os.path.getsize(args.source) / 1024:.1f} KB on disk → "
+          f"{os.path.getsize(args.target) / 1024:.1f} KB ({typed / 1024:.1f} KB in memory)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,32 @@
+"""
+Sample student data generator.
+
+With no arguments this writes the small demo dataset (13 named students in
+grades 8-10, 4 homeworks each) to student_data.csv and student_data.json.
+For load and benchmark testing it scales to millions of rows: records are
+generated with NumPy one chunk of students at a time and streamed to
+CSV, JSONL or Parquet, so memory stays flat whatever the size.
+
+Usage:
+    python create_sample_data.py
+    python create_sample_data.py --rows 1000000 --seed 42 --output bench.parquet
+    python create_sample_data.py --grades 6 7 8 --sections A B C D \\
+        --students-per-section 500 --homeworks 10 --output big.csv
+"""
+
+import argparse
+import math
+import os
+import time
+from datetime import date
+
+import numpy as np
 import pandas as pd
-import json
-from datetime import datetime, timedelta
-
-# Create sample student data with multiple grades and classes
-data = {
-    'student_id': [],
-    'student_name': [],
-    'grade': [],
-    'class_section': [],
-    'homework_title': [],
-    'submission_status': [],
-    'submission_date': [],
-    'quiz_name': [],
-    'quiz_score': [],
-    'quiz_date': [],
-    'quiz_scheduled_date': []
-}
-
-# Sample students across different grades
-students = [
+
+from data_schema import STUDENT_DATA_SCHEMA
+
+# The demo roster: (student_id, name, grade, section)
+DEMO_STUDENTS = [
     # Grade 8, Section A
     ('S001', 'Aarav Kumar', 8, 'A'),
     ('S002', 'Priya Sharma', 8, 'A'),
@@ -38,71 +46,280 @@ students = [
     ('S013', 'Meera Iyer', 10, 'A'),
 ]
 
-# Homework assignments
-homeworks = [
+DEMO_HOMEWORKS = [
     'Math Chapter 5 Exercise',
     'Science Lab Report',
     'English Essay on Climate Change',
     'History Project on Independence',
 ]
 
-# Quiz information
-quizzes = [
-    ('Math Quiz 1', datetime.now() - timedelta(days=5)),
-    ('Science Quiz 2', datetime.now() - timedelta(days=3)),
-    ('English Quiz 1', datetime.now() - timedelta(days=7)),
-]
+# Past quizzes as (name, days from today); upcoming quizzes only appear as dates
+DEMO_QUIZZES = [('Math Quiz 1', -5), ('Science Quiz 2', -3), ('English Quiz 1', -7)]
+DEMO_UPCOMING_DAYS = [3, 5, 8]
 
-# Upcoming quizzes
-upcoming_quizzes = [
-    ('Math Quiz 2', datetime.now() + timedelta(days=3)),
-    ('Science Quiz 3', datetime.now() + timedelta(days=5)),
-    ('History Quiz 1', datetime.now() + timedelta(days=8)),
-]
+FIRST_NAMES = ['Aarav', 'Priya', 'Rohan', 'Ananya', 'Arjun', 'Diya', 'Kabir', 'Ishaan', 'Sanya', 'Vihaan',
+               'Aisha', 'Raj', 'Meera', 'Kavya', 'Aditya', 'Neha', 'Vikram', 'Tara', 'Dev', 'Riya']
+LAST_NAMES = ['Kumar', 'Sharma', 'Patel', 'Singh', 'Reddy', 'Gupta', 'Mehta', 'Verma', 'Joshi', 'Desai',
+              'Khan', 'Malhotra', 'Iyer', 'Nair', 'Rao', 'Bose', 'Chopra', 'Das', 'Pillai', 'Menon']
+SUBJECTS = ['Math', 'Science', 'English', 'History', 'Geography', 'Computer Science']
+
+SUBMISSION_RATE = 2 / 3
+
+# Rows generated (and written) per step
+DEFAULT_CHUNK_ROWS = 500_000
+
+
+class Roster:
+    """Students in grade/section order, materialized one slice at a time."""
+
+    def __init__(self, grades=None, sections=None, students_per_section=None):
+        if students_per_section is None:
+            self.demo = True
+            self.count = len(DEMO_STUDENTS)
+        else:
+            self.demo = False
+            self.grades = list(grades)
+            self.sections = list(sections)
+            self.per_section = students_per_section
+            self.count = len(self.grades) * len(self.sections) * students_per_section
+
+    def slice(self, start, stop):
+        """Return (ids, names, grades, sections) arrays for students start..stop-1."""
+        if self.demo:
+            ids, names, grades, sections = zip(*DEMO_STUDENTS[start:stop])
+            return np.array(ids), np.array(names), np.array(grades), np.array(sections)
 
-# Generate data for each student
-for student_id, name, grade, section in students:
-    for hw in homeworks:
-        # Randomly assign submission status
-        import random
-        submitted = random.choice([True, True, False])  # 66% submission rate
-        
-        data['student_id'].append(student_id)
-        data['student_name'].append(name)
-        data['grade'].append(grade)
-        data['class_section'].append(section)
-        data['homework_title'].append(hw)
-        data['submission_status'].append('Submitted' if submitted else 'Not Submitted')
-        data['submission_date'].append(
-            (datetime.now() - timedelta(days=random.randint(1, 7))).strftime('%Y-%m-%d')
-            if submitted else 'N/A'
+        index = np.arange(start, stop)
+        ids = np.char.add('S', np.char.zfill((index + 1).astype(str), max(3, len(str(self.count)))))
+
+        # Unique names: first/last name pairs, numbered once the pairs run out
+        pairs = len(FIRST_NAMES) * len(LAST_NAMES)
+        names = np.char.add(
+            np.char.add(np.array(FIRST_NAMES)[index % len(FIRST_NAMES)], ' '),
+            np.array(LAST_NAMES)[(index // len(FIRST_NAMES)) % len(LAST_NAMES)]
         )
-        
-        # Quiz data for past quizzes
-        quiz_name, quiz_date = random.choice(quizzes)
-        data['quiz_name'].append(quiz_name)
-        data['quiz_score'].append(random.randint(60, 100) if submitted else 'N/A')
-        data['quiz_date'].append(quiz_date.strftime('%Y-%m-%d'))
-        
-        # Upcoming quiz
-        upcoming_quiz, scheduled_date = random.choice(upcoming_quizzes)
-        data['quiz_scheduled_date'].append(scheduled_date.strftime('%Y-%m-%d'))
-
-# Create DataFrame
-df = pd.DataFrame(data)
-
-# Save as CSV
-df.to_csv('student_data.csv', index=False)
-print("✅ Created student_data.csv")
-
-# Also save as JSON for alternative format
-df.to_json('student_data.json', orient='records', indent=2)
-print("✅ Created student_data.json")
-
-# Display summary
-print(f"\n📊 Dataset Summary:")
-print(f"Total records: {len(df)}")
-print(f"Grades: {sorted(df['grade'].unique())}")
-print(f"Total students: {df['student_name'].nunique()}")
-print(f"\nFirst few rows:")
-print(df.head())
\ No newline at end of file
+        numbered = index >= pairs
+        if numbered.any():
+            names = names.astype(object)
+            names[numbered] = names[numbered] + ' ' + (index[numbered] // pairs + 1).astype(str)
+
+        section_index = index // self.per_section
+        grades = np.array(self.grades)[section_index // len(self.sections)]
+        sections = np.array(self.sections)[section_index % len(self.sections)]
+        return ids, names, grades, sections
+
+
+def make_titles(count, kind, demo):
+    """`count` homework or quiz names (the demo names first)."""
+    titles = list(demo[:count])
+    n = 1
+    while len(titles) < count:
+        for subject in SUBJECTS:
+            title = f"{subject} {kind} {n}"
+            if title not in titles and len(titles) < count:
+                titles.append(title)
+        n += 1
+    return titles
+
+
+def generate_chunks(roster, homeworks=4, quizzes=3, upcoming_quizzes=3, seed=None,
+                    today=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Yield DataFrames of student records, one chunk of students at a time.
+
+    Every student gets one row per homework, with a random submission
+    status (2/3 submitted), a past quiz (scored 60-100 if submitted) and an
+    upcoming quiz. The same seed and `today` always give the same data.
+    """
+    rng = np.random.default_rng(seed)
+    today = np.datetime64(today or date.today(), 'D')
+
+    homework_titles = make_titles(homeworks, 'Assignment', DEMO_HOMEWORKS)
+
+    quiz_names = make_titles(quizzes, 'Quiz', [name for name, _ in DEMO_QUIZZES])
+    extra = max(quizzes - len(DEMO_QUIZZES), 0)
+    quiz_offsets = [days for _, days in DEMO_QUIZZES][:quizzes] + list(-rng.integers(1, 15, extra))
+    quiz_dates = today + np.array(quiz_offsets, dtype='timedelta64[D]')
+
+    extra = max(upcoming_quizzes - len(DEMO_UPCOMING_DAYS), 0)
+    upcoming_offsets = DEMO_UPCOMING_DAYS[:upcoming_quizzes] + list(rng.integers(1, 15, extra))
+    scheduled_dates = today + np.array(upcoming_offsets, dtype='timedelta64[D]')
+
+    students_per_chunk = max(chunk_rows // homeworks, 1)
+    for start in range(0, roster.count, students_per_chunk):
+        ids, names, grades, sections = roster.slice(start, min(start + students_per_chunk, roster.count))
+        rows = len(ids) * homeworks
+        student = np.repeat(np.arange(len(ids)), homeworks)
+
+        submitted = rng.random(rows) < SUBMISSION_RATE
+        submission_date = today - rng.integers(1, 8, rows).astype('timedelta64[D]')
+        quiz = rng.integers(0, quizzes, rows)
+        scores = rng.integers(60, 101, rows)
+
+        yield pd.DataFrame({
+            'student_id': pd.Categorical.from_codes(student, ids),
+            'student_name': pd.Categorical.from_codes(student, names),
+            'grade': pd.array(grades[student], dtype='Int16'),
+            'class_section': pd.Categorical(sections[student]),
+            'homework_title': pd.Categorical.from_codes(np.tile(np.arange(homeworks), len(ids)), homework_titles),
+            'submission_status': pd.Categorical.from_codes(submitted.astype(int), ['Not Submitted', 'Submitted']),
+            'submission_date': pd.Series(submission_date.astype('datetime64[ns]')).where(submitted),
+            'quiz_name': pd.Categorical.from_codes(quiz, quiz_names),
+            'quiz_score': pd.Series(scores, dtype='Int16').where(submitted),
+            'quiz_date': quiz_dates[quiz].astype('datetime64[ns]'),
+            'quiz_scheduled_date': scheduled_dates[rng.integers(0, upcoming_quizzes, rows)].astype('datetime64[ns]'),
+        })
+
+
+def as_text(df):
+    """Records as the CSV/JSON files hold them: YYYY-MM-DD dates and 'N/A' for missing values."""
+    df = df.copy()
+    for column, dtype in STUDENT_DATA_SCHEMA.items():
+        if dtype.startswith('datetime'):
+            # Few distinct dates: format each once
+            codes, uniques = pd.factorize(df[column])
+            df[column] = pd.Categorical.from_codes(codes, uniques.strftime('%Y-%m-%d'))
+        df[column] = df[column].astype(object).where(df[column].notna(), 'N/A')
+    return df
+
+
+def _write_csv(chunk, path, header):
+    """
+    Write `chunk` to CSV ('N/A' for missing values).
+
+    Each column has few distinct values, so they are formatted once and
+    pyarrow's CSV writer, several times faster than to_csv, writes the
+    rows. Without pyarrow (or if a value would need quoting), to_csv is used.
+    """
+    mode = 'w' if header else 'a'
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+    except ImportError:
+        pa = None
+
+    columns = {}
+    for column in chunk.columns:
+        codes, uniques = pd.factorize(chunk[column])
+        uniques = pd.Index(uniques)
+        text = uniques.strftime('%Y-%m-%d') if isinstance(uniques, pd.DatetimeIndex) else uniques.astype(str)
+        text = list(text) + ['N/A']
+        columns[column] = (np.where(codes < 0, len(text) - 1, codes), text)
+
+    needs_quoting = any(c in value for _, text in columns.values() for value in text for c in ',"\n')
+    if pa is None or needs_quoting:
+        chunk.to_csv(path, mode=mode, header=header, index=False, na_rep='N/A', date_format='%Y-%m-%d')
+        return
+
+    table = pa.table({column: pa.array(text).take(pa.array(codes)) for column, (codes, text) in columns.items()})
+    with open(path, mode + 'b') as f:
+        if header:
+            f.write((','.join(chunk.columns) + '\n').encode())
+        pa_csv.write_csv(table, f, pa_csv.WriteOptions(include_header=False, quoting_style='none'))
+
+
+def _arrow_schema():
+    import pyarrow as pa
+    types = {'category': pa.dictionary(pa.int32(), pa.string()), 'Int16': pa.int16(),
+             'datetime64[ns]': pa.timestamp('ns')}
+    return pa.schema([(column, types[dtype]) for column, dtype in STUDENT_DATA_SCHEMA.items()])
+
+
+def write_chunks(chunks, path):
+    """
+    Stream chunks to `path`: .csv, .jsonl or .parquet (needs pyarrow).
+
+    Returns the number of rows written.
+    """
+    fmt = os.path.splitext(path)[1].lower()
+    if fmt not in ('.csv', '.jsonl', '.parquet'):
+        raise ValueError(f"Unsupported output '{path}' (expected .csv, .jsonl or .parquet)")
+
+    rows = 0
+    writer = None
+    try:
+        for i, chunk in enumerate(chunks):
+            if fmt == '.csv':
+                _write_csv(chunk, path, header=i == 0)
+            elif fmt == '.jsonl':
+                with open(path, 'w' if i == 0 else 'a') as f:
+                    as_text(chunk).to_json(f, orient='records', lines=True)
+            else:
+                from storage import _require_pyarrow
+                pa = _require_pyarrow()
+                import pyarrow.parquet as pq
+                schema = _arrow_schema()
+                if writer is None:
+                    writer = pq.ParquetWriter(path, schema)
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def create_demo_data(seed=None, today=None):
+    """Write the demo dataset to student_data.csv and student_data.json."""
+    df = pd.concat(generate_chunks(Roster(), seed=seed, today=today))
+
+    df.to_csv('student_data.csv', index=False, na_rep='N/A', date_format='%Y-%m-%d')
+    print("✅ Created student_data.csv")
+
+    # Also save as JSON for alternative format
+    as_text(df).to_json('student_data.json', orient='records', indent=2)
+    print("✅ Created student_data.json")
+
+    # Display summary
+    print(f"\n📊 Dataset Summary:")
+    print(f"Total records: {len(df)}")
+    print(f"Grades: {sorted(df['grade'].unique())}")
+    print(f"Total students: {df['student_name'].nunique()}")
+    print(f"\nFirst few rows:")
+    print(df.head())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate sample student data.")
+    parser.add_argument('--output', help="File to stream records to (.csv, .jsonl or .parquet); "
+                                         "without it, writes the demo student_data.csv/.json")
+    parser.add_argument('--rows', type=int, help="Approximate number of rows (sets --students-per-section)")
+    parser.add_argument('--grades', type=int, nargs='+', default=[8, 9, 10])
+    parser.add_argument('--sections', nargs='+', default=['A', 'B'])
+    parser.add_argument('--students-per-section', type=int)
+    parser.add_argument('--homeworks', type=int, default=4, help="Homework assignments per student")
+    parser.add_argument('--quizzes', type=int, default=3, help="Distinct past quizzes")
+    parser.add_argument('--upcoming-quizzes', type=int, default=3, help="Distinct upcoming quizzes")
+    parser.add_argument('--seed', type=int, help="Random seed (same seed and --today give the same data)")
+    parser.add_argument('--today', type=date.fromisoformat, help="Date the data is generated around (YYYY-MM-DD)")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help="Rows generated per step")
+    args = parser.parse_args()
+
+    if args.output is None:
+        create_demo_data(seed=args.seed, today=args.today)
+        return
+
+    per_section = args.students_per_section
+    if per_section is None:
+        target = args.rows or 10_000
+        per_section = math.ceil(target / (args.homeworks * len(args.grades) * len(args.sections)))
+    roster = Roster(args.grades, args.sections, per_section)
+
+    started = time.perf_counter()
+    rows = write_chunks(generate_chunks(
+        roster,
+        homeworks=args.homeworks,
+        quizzes=args.quizzes,
+        upcoming_quizzes=args.upcoming_quizzes,
+        seed=args.seed,
+        today=args.today,
+        chunk_rows=args.chunk_rows
+    ), args.output)
+    elapsed = time.perf_counter() - started
+
+    print(f"✅ Wrote {rows:,} records ({roster.count:,} students) to {args.output} "
+          f"in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s, {os.path.getsize(args.output) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
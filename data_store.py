@@ -0,0 +1,529 @@
+"""
+Shared, process-wide store for the student dataset.
+
+Every AdminQuerySystem used to parse student_data.csv on its own, so each
+Streamlit session (and every grade/class switch) paid for a full parse and
+held a private copy of the data. The store parses a file once per process,
+hands the same immutable snapshot to every admin and only reloads when the
+file on disk actually changes.
+"""
+
+import hashlib
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from aggregates import ScopeAggregates, partition_rollup
+from data_schema import RECORD_KEY, apply_schema, covering_scopes
+from prompt_builder import build_scope_summary
+from sql_source import SQLiteDataSource, is_sqlite_path
+from storage import CsvStorage, open_storage, write_storage
+from streaming_source import StreamingDataSource, should_stream
+
+# With copy-on-write, slices of the shared frame are lazy views: an admin
+# can never modify the shared data, and nothing is copied unless they try.
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+
+PARTITION_KEYS = ['grade', 'class_section']
+
+
+def frame_fingerprint(df):
+    """Content hash of a DataFrame (row order and values, not the index)."""
+    digest = hashlib.sha256()
+    digest.update(','.join(map(str, df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return digest.hexdigest()[:16]
+
+
+class Dataset:
+    """
+    Immutable, parsed snapshot of one data file.
+
+    Rows are stored grouped by (grade, class_section) so that every
+    partition is a contiguous block of the frame and an admin's slice is a
+    plain positional view instead of a boolean-mask scan.
+
+    Ingested records produce a new snapshot (see with_records); the old one
+    points to it through `successor` so systems holding it can move forward.
+    A snapshot made by an ingest shares its untouched partitions with the
+    old one and only stitches the full frame together if it is asked for.
+    """
+
+    def __init__(self, path, frame, mtime, size, file_hash, scope=(None, None), version=None,
+                 partitions=None, next_label=None):
+        self.path = path
+        self.mtime = mtime
+        self.size = size
+        self.file_hash = file_hash
+        self.scope = scope
+        self.version = version or file_hash[:16]
+        self.refcount = 0
+        self.successor = None
+        self._views = {}
+        self._memo = {}
+        self._memo_lock = threading.RLock()
+        if partitions is None:
+            self._build_partitions(frame)
+        else:
+            self._set_partitions(frame, partitions)
+        # Label for the next ingested row: labels stay unique across snapshots
+        if next_label is None:
+            next_label = max((int(block.index.max()) + 1 for block in self._blocks.values()), default=0)
+        self._next_label = next_label
+
+    def _set_partitions(self, frame, blocks):
+        """
+        Use `blocks` (in key order) as the partitions and record their row offsets.
+
+        `frame` is their concatenation, or None to build it on first use.
+        """
+        self._whole = frame
+        self._blocks = blocks
+        self.partitions = {}
+        start = 0
+        for key, block in blocks.items():
+            self.partitions[key] = (start, start + len(block))
+            start += len(block)
+
+    def _build_partitions(self, frame):
+        """Group rows by partition key and record each block's row offsets."""
+        if frame.empty:
+            self._set_partitions(frame, {})
+            return
+
+        # Positions of each partition's rows, in file order within a partition
+        indices = frame.groupby(PARTITION_KEYS, sort=True, dropna=False, observed=True).indices
+        order = np.concatenate(list(indices.values()))
+        frame = frame.take(order)
+
+        blocks = {}
+        start = 0
+        for key, positions in indices.items():
+            blocks[key] = frame.iloc[start:start + len(positions)]
+            start += len(positions)
+        self._set_partitions(frame, blocks)
+
+    @property
+    def _frame(self):
+        """Every row, in partition order (stitched from the blocks on first use)."""
+        if self._whole is None:
+            with self._memo_lock:
+                if self._whole is None:
+                    self._whole = pd.concat(list(self._blocks.values()))
+        return self._whole
+
+    def _empty(self):
+        """No rows, with the snapshot's columns and types."""
+        if self._whole is not None:
+            return self._whole.iloc[0:0]
+        return next(iter(self._blocks.values())).iloc[0:0]
+
+    @property
+    def frame(self):
+        """Read-only view of the full dataset (no data is copied)."""
+        return self._frame.copy(deep=False)
+
+    def __len__(self):
+        return sum(map(len, self._blocks.values()))
+
+    def partition_keys(self, grade=None, class_section=None):
+        """Return the (grade, class_section) partitions covered by a scope."""
+        return [
+            key for key in self.partitions
+            if (grade is None or key[0] == grade)
+            and (class_section is None or key[1] == class_section)
+        ]
+
+    def view(self, grade=None, class_section=None):
+        """Return a read-only view of the rows an admin is allowed to see."""
+        scope = (grade, class_section)
+        view = self._views.get(scope)
+        if view is None:
+            view = self._views[scope] = self._build_view(grade, class_section)
+        # A fresh frame object per caller, sharing the same column data
+        return view.copy(deep=False)
+
+    def memoize(self, key, builder):
+        """
+        Return a value derived from this snapshot, building it on first use.
+
+        Keys of the form (name, grade, class_section) are per-scope values:
+        with_records carries them over to the next snapshot for every scope
+        the ingested records don't touch.
+        """
+        with self._memo_lock:
+            if key not in self._memo:
+                self._memo[key] = builder()
+            return self._memo[key]
+
+    def scope_version(self, grade=None, class_section=None):
+        """Content hash of one admin scope; unchanged rows keep the same version."""
+        return self.memoize(
+            ('version', grade, class_section),
+            lambda: frame_fingerprint(self.view(grade, class_section)),
+        )
+
+    def aggregates(self, grade=None, class_section=None):
+        """ScopeAggregates for a scope, merged from its partitions' rollups."""
+        def build():
+            rollups = [self._partition_rollup(key) for key in self.partition_keys(grade, class_section)]
+            return ScopeAggregates(rollups or [partition_rollup(self._empty())])
+        return self.memoize(('aggregates', grade, class_section), build)
+
+    def _partition_rollup(self, key):
+        return self.memoize(('rollup', *key), lambda: partition_rollup(self._blocks[key]))
+
+    def scope_summary(self, grade=None, class_section=None):
+        """Pre-aggregates the prompt builder draws from, built once per scope."""
+        return self.memoize(
+            ('summary', grade, class_section),
+            lambda: build_scope_summary(self.aggregates(grade, class_section))
+        )
+
+    def with_records(self, batch, mode='append'):
+        """
+        Return (new snapshot, changed partitions) with `batch` applied.
+
+        'append' adds the rows; 'upsert' replaces rows with the same
+        RECORD_KEY (in any partition) and adds the rest. Rows outside this
+        snapshot's scope are ignored. Only the changed partitions are copied,
+        and per-scope memoized values of untouched scopes are reused. Added
+        rows get new index labels, so labels stay unique.
+        """
+        if mode not in ('append', 'upsert'):
+            raise ValueError(f"Unknown ingest mode '{mode}' (expected 'append' or 'upsert')")
+
+        blocks, batch = self._align(batch)
+        if mode == 'upsert':
+            batch = batch.drop_duplicates(RECORD_KEY, keep='last')
+
+        grade, class_section = self.scope
+        in_scope = pd.Series(True, index=batch.index)
+        if grade is not None:
+            in_scope &= batch['grade'] == grade
+        if class_section is not None:
+            in_scope &= batch['class_section'] == class_section
+        added = batch[in_scope.fillna(False).astype(bool)]
+        next_label = self._next_label + len(added)
+        added.index = pd.RangeIndex(self._next_label, next_label)
+
+        # Rows of each partition that an upserted record replaces
+        replaced = {}
+        if mode == 'upsert':
+            keys = pd.MultiIndex.from_frame(batch[RECORD_KEY])
+            for key, block in blocks.items():
+                mask = pd.MultiIndex.from_frame(block[RECORD_KEY]).isin(keys)
+                if mask.any():
+                    replaced[key] = mask
+
+        added_blocks = added.groupby(PARTITION_KEYS, observed=True, sort=False)
+        touched = set(added_blocks.indices) | set(replaced)
+
+        for key in sorted(touched):
+            block = blocks.get(key, added.iloc[0:0])
+            if key in replaced:
+                block = block[~replaced[key]]
+            if key in added_blocks.indices:
+                block = pd.concat([block, added_blocks.get_group(key)])
+            blocks[key] = block
+        blocks = {key: blocks[key] for key in sorted(blocks) if len(blocks[key])}
+
+        digest = hashlib.sha256(f"{self.version}:{mode}:".encode())
+        digest.update(frame_fingerprint(added).encode())
+        dataset = Dataset(
+            self.path, None if blocks else added.iloc[0:0],
+            self.mtime, self.size, self.file_hash, self.scope,
+            version=digest.hexdigest()[:16], partitions=blocks, next_label=next_label
+        )
+
+        # Values for scopes whose rows are unchanged stay valid
+        stale = covering_scopes(touched)
+        with self._memo_lock:
+            dataset._memo = {
+                key: value for key, value in self._memo.items()
+                if not (isinstance(key, tuple) and len(key) == 3 and key[1:] in stale)
+            }
+        return dataset, touched
+
+    def _align(self, batch):
+        """
+        Cast `batch` to this snapshot's columns and types, extending categories.
+
+        Returns (partition blocks, batch); the blocks are only copied when
+        the batch brings a new category.
+        """
+        empty = self._empty()
+        batch = apply_schema(batch.reindex(columns=empty.columns))
+        missing = batch[PARTITION_KEYS + RECORD_KEY].isna().any(axis=1)
+        if missing.any():
+            raise ValueError(f"{int(missing.sum())} ingested record(s) lack grade, class_section, "
+                             f"student_id or homework_title")
+
+        frame_types, batch_types = {}, {}
+        for column, dtype in empty.dtypes.items():
+            if isinstance(dtype, pd.CategoricalDtype):
+                categories = dtype.categories
+                new = pd.Index(batch[column].dropna().unique().astype(str)).difference(categories)
+                if len(new):
+                    dtype = pd.CategoricalDtype(categories.append(new))
+                    frame_types[column] = dtype
+            batch_types[column] = dtype
+
+        blocks = {key: block.astype(frame_types) if frame_types else block
+                  for key, block in self._blocks.items()}
+        return blocks, batch.astype(batch_types)
+
+    def _build_view(self, grade, class_section):
+        if grade is None and class_section is None:
+            return self._frame
+
+        keys = self.partition_keys(grade, class_section)
+
+        if not keys:
+            return self._empty()
+        if len(keys) == 1:
+            return self._blocks[keys[0]]
+
+        # Partitions are sorted by grade first, so a single grade is one
+        # contiguous block of the full frame: a zero-copy slice.
+        if grade is not None and self._whole is not None:
+            return self._whole.iloc[self.partitions[keys[0]][0]:self.partitions[keys[-1]][1]]
+
+        # 'All' grades for one class (or a grade after an ingest) spans several
+        # blocks; stitch them once per dataset version and serve the memoized
+        # result afterwards.
+        return pd.concat([self._blocks[key] for key in keys])
+
+class DatasetStore:
+    """
+    Reference-counted cache of parsed datasets, keyed by file path.
+
+    A file is re-parsed only when its mtime/size changed *and* its content
+    hash differs from the loaded snapshot (a `touch` does not trigger a
+    reload). Systems still holding an older snapshot keep it alive until they
+    release it.
+
+    For storage formats that support predicate pushdown (Parquet, Arrow),
+    each admin scope is loaded and cached separately, so an admin only ever
+    reads their own partition of the file. SQLite databases are not loaded at
+    all: every system shares one SQLiteDataSource that queries on demand.
+    Files larger than memory are never loaded either: a StreamingDataSource
+    folds them chunk by chunk into aggregates (see streaming_source.py).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._current = {}
+        self._retired = set()
+
+    def acquire(self, path='student_data.csv', grade=None, class_section=None):
+        """
+        Return the up-to-date snapshot for `path` and take a reference on it.
+
+        `grade`/`class_section` are a hint: pushdown-capable formats load only
+        that scope, CSV loads (and shares) the whole file.
+        """
+        if is_sqlite_path(path):
+            return self._acquire_sqlite(path)
+        if should_stream(path):
+            return self._acquire_streaming(path)
+
+        storage = open_storage(path)
+        scope = (grade, class_section) if storage.supports_pushdown else (None, None)
+        key = (os.path.abspath(path), *scope)
+
+        with self._lock:
+            dataset = self._current.get(key)
+            stat = os.stat(key[0])
+
+            if dataset is None or (dataset.mtime, dataset.size) != (stat.st_mtime, stat.st_size):
+                dataset = self._refresh(key, storage, dataset, stat)
+
+            dataset.refcount += 1
+            return dataset
+
+    def _acquire_sqlite(self, path):
+        key = (os.path.abspath(path), None, None)
+        with self._lock:
+            source = self._current.get(key)
+            if source is None:
+                source = self._current[key] = SQLiteDataSource(path)
+                print(f"🗃️ Opened {os.path.basename(path)} ({len(source)} records, version {source.version})")
+            source.refcount += 1
+            return source
+
+    def _acquire_streaming(self, path):
+        key = (os.path.abspath(path), None, None)
+        with self._lock:
+            source = self._current.get(key)
+            stat = os.stat(key[0])
+            if source is None or (source.mtime, source.size) != (stat.st_mtime, stat.st_size):
+                new_source = StreamingDataSource(path)
+                if source is not None and source.file_hash == new_source.file_hash:
+                    # Same content, only the timestamp moved
+                    source.mtime, source.size = stat.st_mtime, stat.st_size
+                else:
+                    print(f"🌊 Streaming {os.path.basename(path)} ({stat.st_size / 2**20:.0f} MB, "
+                          f"version {new_source.version}) in chunks of {new_source.chunksize:,} rows")
+                    if source is not None:
+                        if source.refcount > 0:
+                            self._retired.add(source)
+                        source.successor = new_source
+                    source = self._current[key] = new_source
+            source.refcount += 1
+            return source
+
+    def release(self, dataset):
+        """Drop a reference taken with acquire()."""
+        with self._lock:
+            dataset.refcount = max(dataset.refcount - 1, 0)
+            if dataset.refcount == 0:
+                self._retired.discard(dataset)
+
+    def _refresh(self, key, storage, dataset, stat):
+        file_hash = storage.fingerprint()
+
+        if dataset is not None and dataset.file_hash == file_hash:
+            # Same content, only the timestamp moved
+            dataset.mtime, dataset.size = stat.st_mtime, stat.st_size
+            return dataset
+
+        path, grade, class_section = key
+        frame = storage.read(grade, class_section)
+        new_dataset = Dataset(path, frame, stat.st_mtime, stat.st_size, file_hash, (grade, class_section))
+        scope = '' if key[1:] == (None, None) else f", grade {grade or 'All'} / class {class_section or 'All'}"
+        print(f"📂 Loaded {os.path.basename(path)} ({len(frame)} records{scope}, version {new_dataset.version})")
+
+        if dataset is not None and dataset.refcount > 0:
+            self._retired.add(dataset)
+        self._current[key] = new_dataset
+        return new_dataset
+
+    def ingest(self, path, records, mode='append', persist=False):
+        """
+        Apply a batch of records to the loaded data for `path`, without a reload.
+
+        Every loaded snapshot of the file (one per scope for Parquet/Arrow) is
+        replaced by an updated one, and systems holding the old snapshot move
+        to it on their next query. With `persist`, the file is updated too
+        (appended to for CSV, rewritten otherwise) so a restart sees the
+        records; otherwise they live in memory until the file changes on disk.
+
+        Args:
+            path: Data file the records belong to
+            records: DataFrame of student records (raw strings or typed)
+            mode: 'append' or 'upsert' (replace records with the same student_id/homework_title)
+            persist: Also write the records to the file
+
+        Returns:
+            Set of (grade, class_section) admin scopes whose data changed
+        """
+        if is_sqlite_path(path):
+            source = self._acquire_sqlite(path)
+            try:
+                return covering_scopes(source.ingest(records, mode))
+            finally:
+                self.release(source)
+
+        if should_stream(path):
+            return self._ingest_streaming(path, records, mode, persist)
+
+        abspath = os.path.abspath(path)
+        with self._lock:
+            if not any(key[0] == abspath for key in self._current):
+                # Nothing loaded yet: load the file so there is something to update
+                self.release(self.acquire(path))
+
+            touched = set()
+            updated = {}
+            for key, dataset in list(self._current.items()):
+                if key[0] != abspath:
+                    continue
+                new_dataset, changed = dataset.with_records(records, mode)
+                touched |= changed
+                updated[key] = new_dataset
+
+            if persist:
+                self._persist(path, records, mode, updated)
+
+            for key, new_dataset in updated.items():
+                old = self._current[key]
+                if old.refcount > 0:
+                    self._retired.add(old)
+                old.successor = new_dataset
+                self._current[key] = new_dataset
+
+        print(f"📥 Ingested {len(records)} record(s) into {os.path.basename(path)} "
+              f"({mode}, {len(touched)} partition(s) changed)")
+        return covering_scopes(touched)
+
+    def _ingest_streaming(self, path, records, mode, persist):
+        """Streamed files are never held in memory, so records can only be appended to the file."""
+        if not (persist and mode == 'append' and type(open_storage(path)) is CsvStorage):
+            raise ValueError(f"{os.path.basename(path)} is streamed from disk: only persisted appends "
+                             "to a CSV file can be ingested (or load it into SQLite)")
+        batch = apply_schema(records.reindex(columns=list(pd.read_csv(path, nrows=0).columns)))
+        with self._lock:
+            batch.to_csv(path, mode='a', header=False, index=False, na_rep='N/A', date_format='%Y-%m-%d')
+            # Systems move to the new file version on their next query
+            self.release(self._acquire_streaming(path))
+
+        touched = {(int(grade), class_section) for grade, class_section
+                   in batch[['grade', 'class_section']].drop_duplicates().itertuples(index=False)}
+        print(f"📥 Appended {len(records)} record(s) to {os.path.basename(path)} "
+              f"({len(touched)} partition(s) changed)")
+        return covering_scopes(touched)
+
+    def _persist(self, path, records, mode, updated):
+        """Write ingested records to `path` and mark the new snapshots as matching it."""
+        storage = open_storage(path)
+        full = updated.get((os.path.abspath(path), None, None))
+
+        if type(storage) is CsvStorage and mode == 'append':
+            # Same columns, order and formatting as the file
+            batch = apply_schema(records.reindex(columns=full.frame.columns))
+            batch.to_csv(path, mode='a', header=False, index=False, na_rep='N/A', date_format='%Y-%m-%d')
+        else:
+            if full is None:
+                stat = os.stat(path)
+                full, _ = Dataset(path, storage.read(), stat.st_mtime, stat.st_size,
+                                  storage.fingerprint()).with_records(records, mode)
+            write_storage(full.frame, path)
+
+        stat = os.stat(path)
+        file_hash = storage.fingerprint()
+        for dataset in updated.values():
+            dataset.mtime, dataset.size, dataset.file_hash = stat.st_mtime, stat.st_size, file_hash
+
+    def stats(self):
+        """Return loaded datasets and how many systems reference each of them."""
+        with self._lock:
+            return {
+                'current': [
+                    {'path': path, 'grade': grade, 'class': class_section,
+                     'version': ds.version, 'records': len(ds), 'refcount': ds.refcount}
+                    for (path, grade, class_section), ds in self._current.items()
+                ],
+                'retired': [
+                    {'path': ds.path, 'version': ds.version, 'refcount': ds.refcount}
+                    for ds in self._retired
+                ],
+            }
+
+    def clear(self):
+        """Forget every loaded dataset (the next acquire() re-parses)."""
+        with self._lock:
+            self._current.clear()
+            self._retired.clear()
+
+
+_default_store = DatasetStore()
+
+
+def get_dataset_store():
+    """Return the process-wide dataset store."""
+    return _default_store
@@ -0,0 +1,138 @@
+"""
+Offline stand-in for google.generativeai.GenerativeModel.
+
+Answers immediately (or after a configurable latency) without network access
+and counts prompt/output tokens, so the query pipeline can be benchmarked and
+demoed without an API key or quota:
+
+    system = AdminQuerySystem(api_key='offline', model_resolver=FakeModelResolver())
+"""
+
+import asyncio
+import threading
+import time
+
+from model_resolver import ResolvedModel
+from prompt_builder import estimate_tokens
+
+DEFAULT_REPLY = """Based on the student data provided:
+
+- The records in your scope have been reviewed.
+- Students with pending homework or low quiz scores may need extra attention.
+
+(This answer was generated offline by the benchmark model.)"""
+
+# Reply to query-plan prompts (see query_plan.py): the scope's average quiz score
+DEFAULT_PLAN = '{"title": "Average quiz score", "aggregations": [{"column": "quiz_score", "func": "mean", "as": "average"}]}'
+
+
+class UsageMetadata:
+    """Token counts attached to a response, like Gemini's usage_metadata."""
+
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+
+class FakeResponse:
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class TokenCount:
+    def __init__(self, total_tokens):
+        self.total_tokens = total_tokens
+
+
+class FakeGenerativeModel:
+    """
+    Drop-in for genai.GenerativeModel with simulated latency and token accounting.
+
+    A call takes `latency` seconds plus the output tokens at
+    `tokens_per_second` (if set). Totals over all calls are kept in
+    `calls`, `prompt_tokens` and `output_tokens`.
+    """
+
+    def __init__(self, model_name='fake-gemini', latency=0.0, tokens_per_second=None,
+                 reply=DEFAULT_REPLY, plan_reply=DEFAULT_PLAN, chunk_tokens=16):
+        self.model_name = model_name
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.reply = reply
+        self.plan_reply = plan_reply
+        self.chunk_tokens = chunk_tokens
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Zero the call and token counters."""
+        with self._lock:
+            self.calls = 0
+            self.prompt_tokens = 0
+            self.output_tokens = 0
+
+    def _respond(self, prompt):
+        text = self.plan_reply if 'JSON query plan' in prompt else self.reply
+        usage = UsageMetadata(estimate_tokens(prompt), estimate_tokens(text))
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += usage.prompt_token_count
+            self.output_tokens += usage.candidates_token_count
+        delay = self.latency
+        if self.tokens_per_second:
+            delay += usage.candidates_token_count / self.tokens_per_second
+        return text, usage, delay
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        text, usage, delay = self._respond(prompt)
+        if not stream:
+            time.sleep(delay)
+            return FakeResponse(text, usage)
+        return self._stream(text, usage, delay)
+
+    def _stream(self, text, usage, delay):
+        size = self.chunk_tokens * 4
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        for chunk in chunks:
+            time.sleep(delay / len(chunks))
+            yield FakeResponse(chunk, usage)
+
+    async def generate_content_async(self, prompt, **kwargs):
+        text, usage, delay = self._respond(prompt)
+        await asyncio.sleep(delay)
+        return FakeResponse(text, usage)
+
+    def count_tokens(self, prompt):
+        return TokenCount(estimate_tokens(prompt))
+
+    def start_chat(self, history=None):
+        return FakeChatSession(self, history)
+
+
+class FakeChatSession:
+    """Chat on a FakeGenerativeModel: each message is charged for the whole history, like Gemini."""
+
+    def __init__(self, model, history=None):
+        self.model = model
+        self.history = list(history or [])
+
+    def send_message(self, content, stream=False, **kwargs):
+        prompt = '\n'.join(part for message in self.history for part in message['parts'])
+        response = self.model.generate_content(f"{prompt}\n{content}", stream=stream)
+        self.history.append({'role': 'user', 'parts': [content]})
+        if not stream:
+            self.history.append({'role': 'model', 'parts': [response.text]})
+        return response
+
+
+class FakeModelResolver:
+    """ModelResolver stand-in that always hands out one FakeGenerativeModel."""
+
+    def __init__(self, model=None, input_token_limit=32768):
+        self.model = model or FakeGenerativeModel()
+        self.input_token_limit = input_token_limit
+
+    def resolve(self, api_key, force_refresh=False):
+        return ResolvedModel(self.model.model_name, self.input_token_limit, self.model)
@@ -0,0 +1,158 @@
+"""
+Incremental ingestion of new homework submissions and quiz scores.
+
+New records are applied to the already loaded dataset instead of rewriting
+student_data.csv and rebuilding every AdminQuerySystem: only the changed
+grade/class partitions are rebuilt, running systems pick the records up on
+their next query, and only the affected scopes' cached answers are dropped.
+
+Inside the app process, call ingest_records() or start a
+DropFolderWatcher; the Streamlit app starts one when INGEST_DIR is set:
+    INGEST_DIR=incoming streamlit run streamlit_app_gemini.py
+
+A watched folder is polled for .csv/.json/.parquet/.arrow batch files; each
+one is ingested and moved to incoming/processed/ (or incoming/failed/).
+
+From the command line (a separate process) the records can only reach the
+app through the data file, so they are always written to it:
+    python ingest.py new_scores.csv --mode upsert
+    python ingest.py --watch incoming/
+"""
+
+import argparse
+import os
+import shutil
+import threading
+import time
+
+from convert_data import read_source
+from data_store import get_dataset_store
+from response_cache import default_cache, scope_key
+
+BATCH_SUFFIXES = ('.csv', '.json', '.parquet', '.pq', '.arrow', '.feather', '.ipc')
+
+
+def ingest_records(records, data_path=None, mode='append', persist=False, answer_cache=default_cache):
+    """
+    Apply a batch of records to the shared dataset.
+
+    Args:
+        records: DataFrame of student records
+        data_path: Data file they belong to (default: $STUDENT_DATA_PATH or student_data.csv)
+        mode: 'append', or 'upsert' to replace records with the same student_id/homework_title
+        persist: Also write the records to the data file
+        answer_cache: ResponseCache to drop stale answers from (None to skip)
+
+    Returns:
+        Set of (grade, class_section) admin scopes whose data changed
+    """
+    data_path = data_path or os.getenv('STUDENT_DATA_PATH', 'student_data.csv')
+    scopes = get_dataset_store().ingest(data_path, records, mode=mode, persist=persist)
+
+    if answer_cache is not None:
+        for grade, class_section in scopes:
+            answer_cache.invalidate(scope_key(grade, class_section, data_path))
+    return scopes
+
+
+def ingest_file(path, **kwargs):
+    """Read a batch file (any format convert_data can read) and ingest it."""
+    return ingest_records(read_source(path), **kwargs)
+
+
+class DropFolderWatcher:
+    """
+    Poll a folder for batch files and ingest each one.
+
+    A file is picked up once its size has stayed the same for one poll, so
+    half-copied files are not read.
+    """
+
+    def __init__(self, folder, interval=5.0, **ingest_kwargs):
+        self.folder = folder
+        self.interval = interval
+        self.ingest_kwargs = ingest_kwargs
+        self._sizes = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def poll(self):
+        """Ingest every settled batch file; return how many were processed."""
+        processed = 0
+        for name in sorted(os.listdir(self.folder)):
+            path = os.path.join(self.folder, name)
+            if not (os.path.isfile(path) and name.lower().endswith(BATCH_SUFFIXES)):
+                continue
+
+            size = os.path.getsize(path)
+            if self._sizes.get(path) != size:
+                self._sizes[path] = size
+                continue
+            del self._sizes[path]
+
+            try:
+                ingest_file(path, **self.ingest_kwargs)
+                self._move(path, 'processed')
+                processed += 1
+            except Exception as e:
+                print(f"❌ Could not ingest {name}: {e}")
+                self._move(path, 'failed')
+        return processed
+
+    def _move(self, path, subfolder):
+        target = os.path.join(self.folder, subfolder)
+        os.makedirs(target, exist_ok=True)
+        shutil.move(path, os.path.join(target, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.path.basename(path)}"))
+
+    def run(self):
+        """Poll until stop() is called."""
+        print(f"👀 Watching {self.folder} for new records (every {self.interval:g}s)")
+        while not self._stop.is_set():
+            self.poll()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Poll in a background thread (e.g. next to the Streamlit app)."""
+        os.makedirs(self.folder, exist_ok=True)
+        self._thread = threading.Thread(target=self.run, name='ingest-watcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest new student records without a full reload.")
+    parser.add_argument('files', nargs='*', help="Batch files to ingest (.csv, .json, .parquet, .arrow)")
+    parser.add_argument('--watch', metavar='FOLDER', help="Poll FOLDER for batch files instead")
+    parser.add_argument('--interval', type=float, default=5.0, help="Seconds between polls")
+    parser.add_argument('--data', default=os.getenv('STUDENT_DATA_PATH', 'student_data.csv'),
+                        help="Data file the records belong to")
+    parser.add_argument('--mode', choices=['append', 'upsert'], default='append',
+                        help="upsert replaces records with the same student_id and homework_title")
+    args = parser.parse_args()
+
+    options = {'data_path': args.data, 'mode': args.mode, 'persist': True}
+
+    if args.watch:
+        os.makedirs(args.watch, exist_ok=True)
+        try:
+            DropFolderWatcher(args.watch, args.interval, **options).run()
+        except KeyboardInterrupt:
+            pass
+        return
+
+    if not args.files:
+        parser.error("give batch files to ingest, or --watch FOLDER")
+
+    for path in args.files:
+        scopes = ingest_file(path, **options)
+        changed = ', '.join(sorted(f"{g}-{c}" for g, c in scopes if g is not None and c is not None))
+        print(f"✅ {os.path.basename(path)}: updated {changed or 'nothing'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+"""
+Local, deterministic answers for common admin questions.
+
+Questions like "which students haven't submitted their homework?" are plain
+pandas aggregations. Answering them here gives exact results in milliseconds
+and saves a Gemini request (the free tier only allows 15 per minute);
+anything the templates don't recognise still goes to the LLM.
+
+A question naming a student, homework or quiz ("average score on Math Quiz
+1?") is answered for that entity only, and only by templates that know what
+it means for them; a partly named one ("quiz 1", "math", a first name) or a
+follow-up pointing back at an earlier answer ("which of them...") goes to
+the LLM, which has the context to resolve it.
+"""
+
+import re
+from datetime import date, timedelta
+
+import pandas as pd
+
+from aggregates import LOW_SCORE_THRESHOLD
+from analytics import at_risk, feature_table, top_k
+from retrieval import RetrievalIndex, tokenize
+
+# Words that occur in homework and quiz names without naming one
+GENERIC_WORDS = {'quiz', 'quizze', 'homework', 'assignment', 'score', 'student'}
+
+# Pronouns that point back at an earlier answer ("which of them scored below 70?")
+FOLLOW_UP = re.compile(r"\b(?:them|they|those|these|he|she|him|her|his|it)\b", re.IGNORECASE)
+
+# How a named entity is worded after the scope, e.g. "Average quiz score in Math Quiz 1"
+ENTITY_LABELS = {'student_name': 'for', 'homework_title': 'on', 'quiz_name': 'in'}
+
+# Students listed one per line in an answer; the header keeps the exact totals
+MAX_LISTED_STUDENTS = 50
+
+
+class QueryTemplate:
+    """A named handler plus the compiled patterns that select it."""
+
+    def __init__(self, name, patterns, handler, entities=()):
+        self.name = name
+        self.patterns = [re.compile(p, re.IGNORECASE) for p in patterns]
+        self.handler = handler
+        self.entities = set(entities)
+
+    def match(self, question):
+        for pattern in self.patterns:
+            match = pattern.search(question)
+            if match:
+                return match
+        return None
+
+
+class LocalQueryEngine:
+    """Registry of query templates, tried in registration order."""
+
+    def __init__(self):
+        self.templates = []
+
+    def register(self, name, *patterns, entities=()):
+        """
+        Decorator registering `handler(df, match, scope_label)` for `patterns`.
+
+        `entities` are the columns ('student_name', 'homework_title',
+        'quiz_name') whose named values the handler can be narrowed to; a
+        question naming any other entity goes to the LLM.
+        """
+        def decorator(handler):
+            self.templates.append(QueryTemplate(name, patterns, handler, entities))
+            return handler
+        return decorator
+
+    def match(self, question):
+        """Return (template, match) for the first matching template, or (None, None)."""
+        for template in self.templates:
+            match = template.match(question)
+            if match:
+                return template, match
+        return None, None
+
+    def answer(self, question, df, index=None):
+        """
+        Answer `question` from `df` if a template matches.
+
+        `index` is a RetrievalIndex over the same scope (e.g. the memoized
+        retrieval.scope_index) used to find the entities the question names;
+        one is built from `df` when not given.
+
+        Returns the answer text, or None when the question should go to the LLM
+        (no template matched, `df` is only a sample of the scope, or the
+        matching handler declined it).
+        """
+        template, match = self.match(question)
+        if template is None or FOLLOW_UP.search(question):
+            return None
+        if df.attrs.get('sample_of'):
+            # Only a sample of a streamed scope is loaded; the LLM answers
+            # from the summary's exact aggregates instead
+            return None
+
+        named = _named_entities(index if index is not None else RetrievalIndex(df), question)
+        if named is None or set(named) - template.entities:
+            return None
+
+        scoped, scope_label = _narrow_scope(df, question)
+        for column, values in named.items():
+            scoped = scoped[scoped[column].isin(values)]
+            scope_label += f" {ENTITY_LABELS[column]} {' and '.join(map(str, values))}"
+        if scoped.empty and not df.empty:
+            return f"🔒 No records{scope_label} in your access scope."
+
+        return template.handler(scoped, match, scope_label)
+
+
+# Default engine used by AdminQuerySystem
+default_engine = LocalQueryEngine()
+
+
+def _narrow_scope(df, question):
+    """
+    Apply a grade/section named in the question (e.g. "for Grade 8").
+
+    `df` is already role-filtered, so this can only narrow the admin's data,
+    never widen it.
+    """
+    labels = []
+
+    grade = re.search(r'\bgrade\s*(\d+)\b', question, re.IGNORECASE)
+    if grade:
+        df = df[df['grade'] == int(grade.group(1))]
+        labels.append(f"Grade {grade.group(1)}")
+
+    section = re.search(r'\b(?i:section|class)\s+([A-Z])\b', question)
+    if section:
+        df = df[df['class_section'] == section.group(1)]
+        labels.append(f"Section {section.group(1)}")
+
+    return df, (' in ' + ', '.join(labels)) if labels else ''
+
+
+def _named_entities(index, question):
+    """
+    {column: [values]} for the students, homework and quizzes `question` names in full.
+
+    Returns None when it only partly names one ("quiz 1", "math", a first
+    name): the template can't tell which rows are meant.
+    """
+    lowered = question.lower()
+    named = {}
+    for column, values in index.mentions(question).items():
+        exact = [value for value in values if re.search(rf'\b{re.escape(str(value).lower())}\b', lowered)]
+        if not exact:
+            return None
+        named[column] = exact
+
+    named_tokens = {token for values in named.values() for value in values for token in tokenize(value)}
+    for token in tokenize(question):
+        if token in GENERIC_WORDS or token in named_tokens or token.isdigit():
+            continue
+        if token in index.postings:
+            return None
+    return named
+
+
+def _quiz_scores(df):
+    """Rows with a quiz score ('N/A' entries are loaded as <NA>)."""
+    return df[df['quiz_score'].notna()]
+
+
+def _more_students(lines, total):
+    """End a per-student list cut at MAX_LISTED_STUDENTS with how many were left out."""
+    if total > MAX_LISTED_STUDENTS:
+        lines.append(f"- …and {total - MAX_LISTED_STUDENTS} more")
+    return "\n".join(lines)
+
+
+def _format_score(value):
+    return f"{value:.0f}" if float(value).is_integer() else f"{value:.1f}"
+
+
+@default_engine.register(
+    'not_submitted',
+    r"\b(?:haven'?t|have not|hasn'?t|has not|didn'?t|did not|not yet|yet to)\b.*\bsubmit",
+    r"\bnot submitted\b",
+    r"\b(?:missing|pending|unsubmitted|incomplete)\b.*\b(?:homework|assignments?)\b",
+    entities=('student_name', 'homework_title'),
+)
+def _not_submitted(df, match, scope_label):
+    pending = df[df['submission_status'] == 'Not Submitted']
+
+    if pending.empty:
+        return f"✅ Every student{scope_label} has submitted all of their homework."
+
+    names = pending.groupby('student_name', sort=True, observed=True).size().index
+    listed = pending[pending['student_name'].isin(names[:MAX_LISTED_STUDENTS])]
+    by_student = listed.groupby('student_name', sort=True, observed=True)['homework_title'].apply(list)
+    lines = [
+        f"**{len(names)} student(s){scope_label} have homework not submitted** "
+        f"({len(pending)} of {len(df)} assignments pending):",
+        "",
+    ]
+    for name, titles in by_student.items():
+        lines.append(f"- **{name}**: {', '.join(titles)}")
+    return _more_students(lines, len(names))
+
+
+@default_engine.register(
+    'score_threshold',
+    r"\b(below|under|less than|lower than|above|over|more than|higher than)\s+(\d+(?:\.\d+)?)",
+    entities=('student_name', 'quiz_name'),
+)
+def _score_threshold(df, match, scope_label):
+    if not re.search(r'\b(?:scor|quiz|mark)', match.string, re.IGNORECASE):
+        return None
+
+    op, threshold = match.group(1).lower(), float(match.group(2))
+    below = op in ('below', 'under', 'less than', 'lower than')
+
+    scores = _quiz_scores(df)
+    hits = scores[scores['quiz_score'] < threshold] if below else scores[scores['quiz_score'] > threshold]
+    direction = 'below' if below else 'above'
+
+    if hits.empty:
+        return f"No students{scope_label} scored {direction} {_format_score(threshold)} in quizzes."
+
+    names = hits.groupby('student_name', sort=True, observed=True).size().index
+    listed = hits[hits['student_name'].isin(names[:MAX_LISTED_STUDENTS])].sort_values(['student_name', 'quiz_score'])
+    lines = [
+        f"**{len(names)} student(s){scope_label} scored {direction} "
+        f"{_format_score(threshold)}** ({len(hits)} quiz result(s)):",
+        "",
+    ]
+    for name, group in listed.groupby('student_name', sort=True, observed=True):
+        results = ', '.join(
+            f"{quiz}: {_format_score(score)}"
+            for quiz, score in zip(group['quiz_name'], group['quiz_score'])
+        )
+        lines.append(f"- **{name}** — {results}")
+    return _more_students(lines, len(names))
+
+
+# Feature-table columns a ranking question can be about, with how to word them
+RANKING_METRICS = [
+    (r'submi|homework|assignment', 'submission_rate', 'submission rate', '{:.0f}%'),
+    (r'improv|trend|progress', 'quiz_trend', 'quiz trend', '{:+.1f} pts/week'),
+    (r'', 'mean_quiz', 'average quiz score', '{:.1f}'),
+]
+
+
+@default_engine.register(
+    'student_ranking',
+    r"\b(top|best|highest|strongest|bottom|worst|lowest|weakest)\s+(\d+\s+)?(?:students?|performers?)\b",
+    r"\b(?:most|least)\s+(improv)\w*\s+(\d+\s+)?students?\b",
+)
+def _student_ranking(df, match, scope_label):
+    word = match.group(1).lower()
+    k = int(match.group(2) or 5)
+    for pattern, column, label, fmt in RANKING_METRICS:
+        if re.search(pattern, match.string, re.IGNORECASE):
+            break
+    largest = word in ('top', 'best', 'highest', 'strongest', 'improv') and 'least' not in match.string.lower()
+
+    features = feature_table(df)
+    picked = top_k(features, column, k=k, largest=largest)
+    if picked.empty:
+        return f"There is no {label} data{scope_label} to rank students by."
+
+    lines = [f"**{'Top' if largest else 'Bottom'} {len(picked)} student(s){scope_label} by {label}:**", ""]
+    for position, (name, value) in enumerate(zip(picked['student_name'], picked[column]), start=1):
+        lines.append(f"{position}. {name} — {fmt.format(value)}")
+    return "\n".join(lines)
+
+
+@default_engine.register(
+    'at_risk',
+    r"\bat[- ]risk\b",
+    r"\b(?:struggling|falling behind)\b",
+    r"\bneeds?\s+(?:attention|help|support)\b",
+    entities=('student_name',),
+)
+def _at_risk(df, match, scope_label):
+    flagged = at_risk(feature_table(df))
+    if flagged.empty:
+        return f"✅ No students{scope_label} look at risk right now."
+
+    lines = [
+        f"**{len(flagged)} student(s){scope_label} may need attention** "
+        f"(missing homework, quiz average below {LOW_SCORE_THRESHOLD} or falling quiz scores):",
+        "",
+    ]
+    for name, risk, reasons in zip(flagged['student_name'], flagged['risk'], flagged['reasons']):
+        lines.append(f"- **{name}** (risk {risk:.0f}/100) — {reasons}")
+    return "\n".join(lines)
+
+
+@default_engine.register(
+    'average_quiz_score',
+    r"\b(?:average|mean|avg)\b.*\b(?:quiz|score)",
+    r"\b(?:quiz|score)\w*\b.*\b(?:average|mean|avg)\b",
+    entities=('student_name', 'quiz_name'),
+)
+def _average_quiz_score(df, match, scope_label):
+    scores = _quiz_scores(df)
+
+    if scores.empty:
+        return f"There are no recorded quiz scores{scope_label} yet."
+
+    per_student = scores.groupby('student_name', sort=True, observed=True)['quiz_score'].mean()
+    lines = [
+        f"**Average quiz score{scope_label}: {scores['quiz_score'].mean():.1f}** "
+        f"(from {len(scores)} scored quizzes, {len(per_student)} students)",
+        "",
+        "Per student:",
+    ]
+    for name, avg in per_student.sort_values(ascending=False).head(MAX_LISTED_STUDENTS).items():
+        lines.append(f"- {name}: {avg:.1f}")
+    return _more_students(lines, len(per_student))
+
+
+@default_engine.register(
+    'upcoming_quizzes',
+    r"\b(?:upcoming|scheduled|future)\b.*\bquiz",
+    r"\bquiz\w*\b.*\b(?:upcoming|scheduled|next week|coming up)\b",
+    entities=('student_name',),
+)
+def _upcoming_quizzes(df, match, scope_label):
+    today = pd.Timestamp(date.today())
+    scheduled = df['quiz_scheduled_date']
+    window = scheduled >= today
+    period = ''
+
+    if re.search(r'next\s+(?:week|7\s+days)', match.string, re.IGNORECASE):
+        window &= scheduled < today + timedelta(days=7)
+        period = ' in the next 7 days'
+
+    upcoming = df[window]
+
+    if upcoming.empty:
+        return f"No quizzes are scheduled{scope_label}{period}."
+
+    per_date = upcoming.groupby('quiz_scheduled_date', sort=True)['student_name'].nunique()
+    lines = [f"**Upcoming quizzes{scope_label}{period}:**", ""]
+    for when, students in per_date.items():
+        days = (when - today).days
+        lines.append(f"- {when:%A, %d %b %Y} (in {days} day(s)) — {students} student(s)")
+    return "\n".join(lines)
@@ -0,0 +1,170 @@
+"""
+Cached Gemini model discovery.
+
+Picking a model means calling genai.list_models(), a network round trip.
+The resolver does it at most once per TTL: the choice is kept in-process
+(with one shared GenerativeModel per API key and model name) and in a small JSON file so
+restarts skip it too. Set GEMINI_MODEL to skip discovery altogether.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+import google.generativeai as genai
+
+# Models in order of preference
+PREFERRED_MODELS = [
+    'gemini-1.5-pro-latest',
+    'gemini-1.5-pro',
+    'gemini-1.5-flash-latest',
+    'gemini-1.5-flash',
+    'gemini-pro',
+    'models/gemini-pro',
+    'models/gemini-1.5-flash',
+    'models/gemini-1.5-pro'
+]
+
+FALLBACK_MODEL = 'gemini-pro'
+
+
+def is_model_not_found(error):
+    """True when a Gemini call failed because the model no longer exists."""
+    return getattr(error, 'code', None) == 404
+
+
+class ResolvedModel:
+    """A chosen model name, its input token limit and the shared client object."""
+
+    def __init__(self, name, input_token_limit, model):
+        self.name = name
+        self.input_token_limit = input_token_limit
+        self.model = model
+
+
+class ModelResolver:
+    """Resolve (and remember) the best available model for an API key."""
+
+    def __init__(self, cache_path='.gemini_model_cache.json', ttl=86400, override=None):
+        """
+        Args:
+            cache_path: JSON file persisting choices across restarts (None for memory only)
+            ttl: Seconds before a choice is re-checked with list_models()
+            override: Model name to use without discovery
+        """
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.override = override
+        self._lock = threading.Lock()
+        self._choices = self._load()
+        self._models = {}
+
+    @classmethod
+    def from_env(cls):
+        """Resolver configured by GEMINI_MODEL, GEMINI_MODEL_CACHE and GEMINI_MODEL_CACHE_TTL."""
+        return cls(
+            cache_path=os.getenv('GEMINI_MODEL_CACHE', '.gemini_model_cache.json'),
+            ttl=float(os.getenv('GEMINI_MODEL_CACHE_TTL', 86400)),
+            override=os.getenv('GEMINI_MODEL') or None
+        )
+
+    def resolve(self, api_key, force_refresh=False):
+        """
+        Return the ResolvedModel for `api_key`.
+
+        genai must already be configured with `api_key`. `force_refresh`
+        discards the remembered choice (e.g. after a model-not-found error).
+        """
+        key = hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+        with self._lock:
+            choice = self._choices.get(key)
+            if choice is not None and self.override and choice['name'] != self.override:
+                # GEMINI_MODEL wins over a model remembered before it was set
+                choice = None
+            fresh = choice is not None and time.time() - choice['resolved_at'] < self.ttl
+
+            if force_refresh or not fresh:
+                choice = self._discover()
+                if choice['name'] != FALLBACK_MODEL or choice['input_token_limit']:
+                    self._choices[key] = choice
+                    self._save()
+
+            # A GenerativeModel takes its client (and so its key) on first use:
+            # share one per (key, model), never across keys
+            name = choice['name']
+            if (key, name) not in self._models or force_refresh:
+                self._models[key, name] = genai.GenerativeModel(name)
+
+            return ResolvedModel(name, choice['input_token_limit'], self._models[key, name])
+
+    def _discover(self):
+        if self.override:
+            print(f"✅ Using configured model: {self.override}")
+            return self._choice(self.override, self._token_limit(self.override))
+
+        print("🔍 Finding best available Gemini model...")
+        try:
+            token_limits = {}
+            for model in genai.list_models():
+                if 'generateContent' in model.supported_generation_methods:
+                    token_limits[model.name] = getattr(model, 'input_token_limit', None)
+
+            print(f"📋 Found {len(token_limits)} available models")
+
+            for preferred in PREFERRED_MODELS:
+                for available in token_limits:
+                    if preferred in available:
+                        print(f"✅ Using model: {available}")
+                        return self._choice(available, token_limits[available])
+
+            # If no preferred model found, use the first available
+            if token_limits:
+                name = next(iter(token_limits))
+                print(f"✅ Using model: {name}")
+                return self._choice(name, token_limits[name])
+
+        except Exception as e:
+            print(f"⚠️ Error listing models: {e}")
+
+        # Fallback to gemini-pro (most common); not persisted, so the
+        # next system retries discovery
+        print(f"⚠️ Using fallback model: {FALLBACK_MODEL}")
+        return self._choice(FALLBACK_MODEL, None)
+
+    @staticmethod
+    def _choice(name, input_token_limit):
+        return {'name': name, 'input_token_limit': input_token_limit, 'resolved_at': time.time()}
+
+    @staticmethod
+    def _token_limit(name):
+        try:
+            return genai.get_model(name if name.startswith('models/') else f'models/{name}').input_token_limit
+        except Exception:
+            return None
+
+    def _load(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        if not self.cache_path:
+            return
+        try:
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self._choices, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"⚠️ Could not save model cache: {e}")
+
+
+# Default resolver used by AdminQuerySystem
+default_resolver = ModelResolver.from_env()
@@ -0,0 +1,224 @@
+"""
+Token-budgeted prompt assembly for Gemini.
+
+The prompt used to inline the same 20 sample rows and the first 30 homework
+and quiz records as indented JSON, whatever the question was. The builder
+below fills a token budget instead: fixed instructions first, then scope-wide
+pre-aggregates, then the rows most relevant to the question, all encoded as
+compact CSV.
+"""
+
+import re
+
+import pandas as pd
+
+from analytics import risk_scores, static_features
+from retrieval import RetrievalIndex
+
+# Rough Gemini tokenizer ratio for English text and CSV
+CHARS_PER_TOKEN = 4
+
+# Cap on candidate rows rendered before budget trimming
+MAX_CANDIDATE_ROWS = 5000
+
+HOMEWORK_COLUMNS = ['student_name', 'homework_title', 'submission_status', 'submission_date']
+QUIZ_COLUMNS = ['student_name', 'quiz_name', 'quiz_score', 'quiz_date', 'quiz_scheduled_date']
+
+HOMEWORK_TOPIC = re.compile(r'homework|assignment|submi|pending|project|essay|report|exercise', re.IGNORECASE)
+QUIZ_TOPIC = re.compile(r'quiz|score|mark|test|exam|perform|average|scored', re.IGNORECASE)
+
+STUDENT_STATS_TITLE = ('PER-STUDENT STATISTICS, most at-risk first (submitted/pending homework, '
+                       'quiz average and minimum, quiz_trend in points per week)')
+
+INSTRUCTIONS = """INSTRUCTIONS:
+1. Answer the question clearly and concisely
+2. List specific student names when relevant
+3. For "not submitted" queries, look for submission_status = 'Not Submitted'
+4. For quiz scores, ignore entries with 'N/A' values
+5. Use the per-student statistics for averages and counts; they cover every student in scope
+6. Use bullet points or numbered lists for clarity when listing multiple items
+7. Be specific with numbers and percentages
+8. If the rows shown are not enough to answer exactly, say so"""
+
+
+def estimate_tokens(text):
+    """Approximate token count of `text`."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def build_scope_summary(aggregates):
+    """Scope-wide pre-aggregates the builder draws from, read off a ScopeAggregates."""
+    students = aggregates.students
+    # Students most at risk first, so they survive budget trimming
+    order = risk_scores(static_features(aggregates)).sort_values(ascending=False, kind='stable').index
+    student_stats = students.loc[order, [
+        'student_name', 'grade', 'class_section', 'submitted', 'pending', 'avg_quiz', 'min_quiz', 'quiz_trend'
+    ]].round(1)
+
+    return {
+        'total_students': aggregates.total_students,
+        'total_records': aggregates.total_records,
+        'submission_rate': aggregates.submission_rate,
+        'average_quiz_score': aggregates.average_quiz_score,
+        'student_stats': student_stats,
+        'entities': aggregates.entities,
+    }
+
+
+def _to_csv(df):
+    return df.to_csv(index=False, na_rep='N/A', float_format='%g', date_format='%Y-%m-%d').strip()
+
+
+class PromptBuilder:
+    """Assemble a prompt that fits `token_budget` tokens."""
+
+    def __init__(self, token_budget=8000):
+        self.token_budget = token_budget
+
+    def build(self, question, df, summary, index=None):
+        """
+        Args:
+            question: The admin's question
+            df: The admin's records
+            summary: Scope pre-aggregates from build_scope_summary
+            index: RetrievalIndex over `df` (built here when not given)
+        """
+        header = f"""You are a helpful AI assistant analyzing student data for a school administrator.
+
+Your task: Answer the following question based on the provided student data.
+
+QUESTION: {question}
+"""
+        overview = _overview(summary)
+        footer = f"\n{INSTRUCTIONS}\n\nProvide a clear, helpful answer now:"
+
+        remaining = self.token_budget - estimate_tokens(header + overview + footer)
+        sections = [header, overview]
+
+        index = index if index is not None else RetrievalIndex(df)
+        mentions = index.mentions(question)
+
+        # Per-item figures from a sample of a streamed scope's rows would be wrong
+        sampled = bool(index.frame.attrs.get('sample_of'))
+        items = index.entity_stats(mentions if not sampled else {})
+        if remaining > 0 and not items.empty:
+            section, used = self._csv_section('HOMEWORK AND QUIZZES IN THE QUESTION', items, remaining)
+            sections.append(section)
+            remaining -= used
+
+        stats = summary['student_stats']
+        if 'student_name' in mentions:
+            # Named students first so they survive trimming
+            named = stats['student_name'].isin(mentions['student_name'])
+            stats = pd.concat([stats[named], stats[~named]])
+
+        if remaining > 0:
+            # Leave room for the rows of the entities the question names
+            section, used = self._csv_section(
+                STUDENT_STATS_TITLE, stats, remaining // 2 if mentions else remaining
+            )
+            sections.append(section)
+            remaining -= used
+
+        if remaining > 0:
+            rows = self._relevant_rows(question, df, index, mentions)
+            if not rows.empty:
+                title = 'RELEVANT RECORDS (A SAMPLE)' if sampled else 'RELEVANT RECORDS'
+                section, used = self._csv_section(title, rows, remaining)
+                sections.append(section)
+                remaining -= used
+
+        sections.append(footer)
+        return ''.join(sections)
+
+    def _relevant_rows(self, question, df, index, mentions):
+        """Rows naming the most mentioned entities first, restricted to the columns the question is about."""
+        # The index's frame holds the same rows as `df` (possibly from an earlier
+        # snapshot of an unchanged scope), so take every row from it
+        df = index.frame
+        rows = df.head(MAX_CANDIDATE_ROWS)
+        if mentions:
+            # Rows matching every named entity rank above rows matching just one
+            matched = index.top_rows(question, k=MAX_CANDIDATE_ROWS)
+            rows = pd.concat([matched, rows[~rows.index.isin(matched.index)]]).head(MAX_CANDIDATE_ROWS)
+
+        wants_homework = bool(HOMEWORK_TOPIC.search(question))
+        wants_quiz = bool(QUIZ_TOPIC.search(question))
+        return rows[_record_columns(df, wants_homework or not wants_quiz, wants_quiz or not wants_homework)]
+
+    def build_context(self, df, summary):
+        """
+        Data context for a chat session (see chat_session.py): the overview,
+        per-student statistics and as many records as fit, with no question.
+        """
+        header = """You are a helpful AI assistant analyzing student data for a school administrator.
+
+The administrator will ask several questions in a row. Answer each one from the student data
+below and the conversation so far; follow-up questions may refer to earlier answers.
+"""
+        footer = f"\n{INSTRUCTIONS}\n"
+        remaining = self.token_budget - estimate_tokens(header + _overview(summary) + footer)
+        sections = [header, _overview(summary)]
+
+        if remaining > 0:
+            section, used = self._csv_section(
+                STUDENT_STATS_TITLE, summary['student_stats'], remaining
+            )
+            sections.append(section)
+            remaining -= used
+
+        if remaining > 0:
+            rows = df.head(MAX_CANDIDATE_ROWS)[_record_columns(df, True, True)]
+            section, used = self._csv_section('RECORDS', rows, remaining)
+            sections.append(section)
+
+        sections.append(footer)
+        return ''.join(sections)
+
+    def _csv_section(self, title, df, budget):
+        """Render `df` as CSV under `title`, keeping as many rows as fit `budget` tokens."""
+        # Every row costs at least one token, so no more than `budget` rows can fit
+        lines = _to_csv(df.head(max(budget, 0))).split('\n')
+        heading = f"\n{title} (CSV):\n"
+        used = estimate_tokens(heading) + estimate_tokens(lines[0])
+        kept = [lines[0]]
+
+        for line in lines[1:]:
+            cost = estimate_tokens(line)
+            if used + cost > budget:
+                break
+            kept.append(line)
+            used += cost
+
+        omitted = len(df) - (len(kept) - 1)
+        note = f"\n({omitted} more rows omitted)\n" if omitted else "\n"
+        return heading + '\n'.join(kept) + note, used
+
+
+def _overview(summary):
+    return f"""
+SCOPE OVERVIEW:
+- Total Students: {summary['total_students']}
+- Total Records: {summary['total_records']}
+- Submission Rate: {summary['submission_rate']:.1f}%
+- Average Quiz Score: {_format_mean(summary['average_quiz_score'])}
+"""
+
+
+def _record_columns(df, homework, quiz):
+    """Record columns to show for homework and/or quiz questions."""
+    columns = []
+    if homework:
+        columns += HOMEWORK_COLUMNS
+    if quiz:
+        columns += [c for c in QUIZ_COLUMNS if c not in columns]
+
+    # Grade/section only carry information when the scope spans several
+    for column in ('class_section', 'grade'):
+        if df[column].nunique() > 1:
+            columns.insert(1, column)
+    return columns
+
+
+def _format_mean(value):
+    return 'N/A' if pd.isna(value) else f"{value:.1f}"
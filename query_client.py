@@ -0,0 +1,139 @@
+"""
+Thin client for query_service.py.
+
+Offers the parts of AdminQuerySystem the Streamlit app uses (query,
+query_stream, get_access_info, get_data_summary, get_aggregates,
+get_student_features, filtered_data), answered by the HTTP service instead of
+in-process. Uses only the standard library, so the UI doesn't need FastAPI
+installed.
+
+    system = QueryServiceClient('http://localhost:8000', admin_grade=8, admin_class='A')
+"""
+
+import codecs
+import io
+import json
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date, timedelta
+
+import pandas as pd
+
+from data_schema import apply_schema
+
+
+class QueryServiceError(Exception):
+    """The query service refused or failed a request."""
+
+
+class RemoteAggregates:
+    """The quick stats of one scope, as returned by the service's /summary."""
+
+    def __init__(self, payload):
+        self.total_students = payload['total_students']
+        self.total_records = payload['total_records']
+        self.submission_rate = payload['submission_rate']
+        average = payload['average_quiz_score']
+        self.average_quiz_score = float('nan') if average is None else average
+        self.students_below_threshold = payload['students_below_threshold']
+        self._upcoming = payload['upcoming_quizzes']
+
+    def upcoming_quizzes(self, days=None, today=None):
+        """Series of student counts per scheduled quiz date from today (within `days`, if given)."""
+        upcoming = pd.Series(self._upcoming, dtype='int64')
+        upcoming.index = pd.to_datetime(upcoming.index)
+        today = pd.Timestamp(today or date.today())
+        window = upcoming.index >= today
+        if days is not None:
+            window &= upcoming.index < today + timedelta(days=days)
+        return upcoming[window].sort_index()
+
+
+class QueryServiceClient:
+    """AdminQuerySystem look-alike backed by the query service."""
+
+    # No local traces: the service traces the queries it runs
+    tracer = None
+
+    def __init__(self, base_url, admin_grade=None, admin_class=None, token=None, timeout=180):
+        """
+        Args:
+            base_url: Service URL, e.g. http://localhost:8000
+            admin_grade: Grade to query (None for all the token allows)
+            admin_class: Class section to query (None for all the token allows)
+            token: Access token, if the service requires one
+            timeout: Seconds to wait for a response
+        """
+        self.base_url = base_url.rstrip('/')
+        self.admin_grade = admin_grade
+        self.admin_class = admin_class
+        self.token = token
+        self.timeout = timeout
+        self._filtered_data = None
+
+    def _request(self, path, body=None):
+        params = {key: value for key, value in
+                  (('grade', self.admin_grade), ('class_section', self.admin_class)) if value is not None}
+        url = f"{self.base_url}{path}?{urllib.parse.urlencode(params)}"
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f"Bearer {self.token}"
+        data = None if body is None else json.dumps(body).encode('utf-8')
+        request = urllib.request.Request(url, data=data, headers=headers, method='GET' if body is None else 'POST')
+        try:
+            return urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            try:
+                detail = json.loads(e.read()).get('detail', e.reason)
+            except ValueError:
+                detail = e.reason
+            raise QueryServiceError(f"{e.code}: {detail}") from None
+        except urllib.error.URLError as e:
+            raise QueryServiceError(f"Query service unreachable at {self.base_url}: {e.reason}") from None
+
+    def _get_json(self, path):
+        with self._request(path) as response:
+            return json.loads(response.read())
+
+    def query(self, question, mode=None):
+        with self._request('/query', {'question': question, 'mode': mode}) as response:
+            return json.loads(response.read())['answer']
+
+    def query_stream(self, question, mode=None):
+        """Yield the answer in chunks as the service streams it."""
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        with self._request('/query_stream', {'question': question, 'mode': mode}) as response:
+            while chunk := response.read1(4096):
+                text = decoder.decode(chunk)
+                if text:
+                    yield text
+        if tail := decoder.decode(b'', final=True):
+            yield tail
+
+    def get_access_info(self):
+        return self._get_json('/access_info')
+
+    def get_data_summary(self):
+        return self._get_json('/summary')['summary']
+
+    def get_aggregates(self):
+        return RemoteAggregates(self._get_json('/summary'))
+
+    def get_student_features(self, today=None):
+        """Per-student feature table (next quizzes are counted from the service's today)."""
+        with self._request('/features') as response:
+            features = pd.read_csv(io.BytesIO(response.read()), parse_dates=['next_quiz_date'])
+        features['days_to_next_quiz'] = features['days_to_next_quiz'].astype('Int64')
+        return features
+
+    @property
+    def filtered_data(self):
+        """Records this admin may see, downloaded on first use."""
+        if self._filtered_data is None:
+            with self._request('/records') as response:
+                self._filtered_data = apply_schema(pd.read_csv(io.BytesIO(response.read())))
+        return self._filtered_data
+
+    def close(self):
+        self._filtered_data = None
@@ -0,0 +1,159 @@
+"""
+Persistent log of answered queries, for replay and regression testing.
+
+AdminQuerySystem appends one JSON record per query (question, scope, data
+version, prompt hash, latency, answer, ...) to a JSONL file. Records go
+through a bounded in-memory queue and are written by a background thread,
+so logging never blocks a query; if the writer falls behind, new records are
+dropped (and counted) instead of growing memory. The file is rotated by size
+like logging.handlers.RotatingFileHandler (query_log.jsonl.1, .2, ...).
+
+Records hold the full question and answer text, student names and scores
+included, so the log is off unless QUERY_LOG_PATH names the file to write
+(e.g. QUERY_LOG_PATH=logs/query_log.jsonl). See replay_queries.py to re-run
+logged traffic.
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import queue
+import threading
+
+DEFAULT_PATH = os.path.join('logs', 'query_log.jsonl')
+
+
+def prompt_hash(prompt):
+    """Short, stable fingerprint of a prompt (prompts themselves aren't logged)."""
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:16]
+
+
+class QueryLog:
+    """Rotating JSONL log written asynchronously from a bounded queue."""
+
+    def __init__(self, path=DEFAULT_PATH, max_bytes=10_000_000, backups=5, max_queue=10_000):
+        """
+        Args:
+            path: JSONL file to append to
+            max_bytes: Rotate once the file reaches this size (0 to never rotate)
+            backups: Rotated files to keep
+            max_queue: Records buffered in memory before new ones are dropped
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._writer = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """The log described by QUERY_LOG_PATH, or None if it is unset or 'off'."""
+        path = os.getenv('QUERY_LOG_PATH', '')
+        if path.lower() in ('', 'off', 'none', '0'):
+            return None
+        return cls(path)
+
+    def record(self, record):
+        """Queue one record (a JSON-serializable dict) for writing; never blocks."""
+        self._start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1:
+                print(f"⚠️ Query log writer is falling behind, dropping records ({self.path})")
+
+    def flush(self):
+        """Wait until every queued record has been written."""
+        if self._writer is not None:
+            self._queue.join()
+
+    def close(self):
+        """Write what is queued and stop the writer thread."""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            self._queue.put(None)
+            writer.join()
+
+    def _start(self):
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    folder = os.path.dirname(self.path)
+                    if folder:
+                        os.makedirs(folder, exist_ok=True)
+                    self._writer = threading.Thread(target=self._run, name='query-log-writer', daemon=True)
+                    self._writer.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Write everything that is already queued in one go
+            while len(batch) < 1000:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            records = [r for r in batch if r is not None]
+            try:
+                if records:
+                    self._write(records)
+            except Exception as e:
+                print(f"⚠️ Could not write the query log: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if len(records) < len(batch):
+                return
+
+    def _write(self, records):
+        lines = ''.join(json.dumps(r, default=str) + '\n' for r in records)
+        if self.max_bytes and os.path.exists(self.path) and \
+           os.path.getsize(self.path) + len(lines) > self.max_bytes:
+            self._rotate()
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+
+    def _rotate(self):
+        if self.backups <= 0:
+            os.remove(self.path)
+            return
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f'{self.path}.{i}'):
+                os.replace(f'{self.path}.{i}', f'{self.path}.{i + 1}')
+        os.replace(self.path, f'{self.path}.1')
+
+
+def read_log(path, include_rotated=True):
+    """
+    Yield the records of a query log, oldest first.
+
+    Args:
+        path: The log file
+        include_rotated: Also read the rotated files (path.N ... path.1) first
+    """
+    paths = [path]
+    if include_rotated:
+        i = 1
+        while os.path.exists(f'{path}.{i}'):
+            paths.insert(0, f'{path}.{i}')
+            i += 1
+
+    for name in paths:
+        if not os.path.exists(name):
+            continue
+        with open(name, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+# Default log used by AdminQuerySystem (None unless QUERY_LOG_PATH is set)
+default_query_log = QueryLog.from_env()
+if default_query_log is not None:
+    atexit.register(default_query_log.close)
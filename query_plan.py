@@ -0,0 +1,264 @@
+"""
+Query-plan mode: Gemini writes the query, pandas runs it.
+
+Instead of sending data samples and asking the model to compute averages
+from them, the model only sees the schema and returns a small JSON query
+plan. The plan is validated against a fixed vocabulary (known columns,
+comparison operators, aggregate functions; no code) and executed locally on
+the admin's role-filtered rows, so the prompt stays the same size however
+much data there is and the model never decides what data an admin can see.
+"""
+
+import json
+import re
+from datetime import date
+
+import pandas as pd
+
+from data_schema import DATE_COLUMNS, STUDENT_DATA_SCHEMA
+
+FILTER_OPS = {
+    '==': lambda s, v: s == v,
+    '!=': lambda s, v: s != v,
+    '<': lambda s, v: s < v,
+    '<=': lambda s, v: s <= v,
+    '>': lambda s, v: s > v,
+    '>=': lambda s, v: s >= v,
+    'in': lambda s, v: s.isin(v),
+    'not_in': lambda s, v: ~s.isin(v),
+    'contains': lambda s, v: s.astype(str).str.contains(str(v), case=False, regex=False),
+    'is_null': lambda s, v: s.isna(),
+    'not_null': lambda s, v: s.notna(),
+}
+
+AGGREGATIONS = {'count', 'nunique', 'mean', 'sum', 'min', 'max'}
+
+MAX_LIMIT = 500
+
+# Rows shown in the formatted answer
+DISPLAY_ROWS = 50
+
+ALIAS = re.compile(r'^[a-z_][a-z0-9_]{0,40}$')
+
+
+class PlanError(ValueError):
+    """The model's plan is malformed or uses something outside the allowed vocabulary."""
+
+
+def build_plan_prompt(question, df):
+    """Prompt asking for a JSON plan; contains the schema and small value lists only."""
+    columns = []
+    for column, dtype in STUDENT_DATA_SCHEMA.items():
+        line = f"- {column} ({'date YYYY-MM-DD' if column in DATE_COLUMNS else dtype})"
+        if dtype == 'category' and column != 'student_id' and df[column].nunique() <= 20:
+            values = ', '.join(sorted(map(str, df[column].dropna().unique())))
+            line += f": {values}"
+        columns.append(line)
+
+    return f"""You translate a school administrator's question into a JSON query plan over a table of student records.
+Each row is one homework assignment for one student, with that student's quiz result.
+Missing quiz scores and submission dates are null.
+
+TODAY: {date.today():%Y-%m-%d}
+
+COLUMNS:
+{chr(10).join(columns)}
+
+PLAN FORMAT (all keys optional):
+{{
+  "title": "short description of the result",
+  "filters": [{{"column": "<column>", "op": "<op>", "value": <value>}}],
+  "group_by": ["<column>", ...],
+  "aggregations": [{{"column": "<column>", "func": "<func>", "as": "<result_name>"}}],
+  "columns": ["<column>", ...],
+  "distinct": false,
+  "sort": [{{"column": "<column or result_name>", "descending": false}}],
+  "limit": 20
+}}
+ops: {', '.join(FILTER_OPS)} ("in"/"not_in" take a list; "is_null"/"not_null" take no value)
+funcs: {', '.join(sorted(AGGREGATIONS))}
+Filters are combined with AND. Use "aggregations" with "group_by" for per-group numbers, without it for one overall number.
+Use "columns" (optionally with "distinct") to list rows. limit is at most {MAX_LIMIT}.
+
+QUESTION: {question}
+
+Reply with the JSON plan only."""
+
+
+def parse_plan(text):
+    """Extract the JSON object from the model's reply (tolerating ``` fences)."""
+    match = re.search(r'\{.*\}', text, re.DOTALL)
+    if not match:
+        raise PlanError("the model did not return a JSON plan")
+    try:
+        plan = json.loads(match.group(0))
+    except ValueError as e:
+        raise PlanError(f"the plan is not valid JSON ({e})") from None
+    if not isinstance(plan, dict):
+        raise PlanError("the plan must be a JSON object")
+    return plan
+
+
+def _check_column(column, allowed):
+    if not isinstance(column, str) or column not in allowed:
+        raise PlanError(f"unknown column '{column}'")
+    return column
+
+
+def _entries(plan, key, of=dict):
+    """The list under `key` (empty if missing), checking every entry is an `of`."""
+    entries = plan.get(key) or []
+    if not isinstance(entries, list):
+        raise PlanError(f"'{key}' must be a list")
+    for entry in entries:
+        if not isinstance(entry, of):
+            kind = 'objects' if of is dict else 'column names'
+            raise PlanError(f"'{key}' entries must be {kind}, got {entry!r}")
+    return entries
+
+
+def validate_plan(plan):
+    """Return a normalized copy of `plan`, or raise PlanError."""
+    unknown = set(plan) - {'title', 'filters', 'group_by', 'aggregations', 'columns', 'distinct', 'sort', 'limit'}
+    if unknown:
+        raise PlanError(f"unknown plan keys: {', '.join(sorted(unknown))}")
+
+    columns = set(STUDENT_DATA_SCHEMA)
+    filters = []
+    for f in _entries(plan, 'filters'):
+        op = f.get('op')
+        if not isinstance(op, str) or op not in FILTER_OPS:
+            raise PlanError(f"operator '{op}' is not allowed")
+        value = f.get('value')
+        if op in ('in', 'not_in') and not isinstance(value, list):
+            raise PlanError(f"'{op}' needs a list value")
+        if isinstance(value, (dict, list)) and op not in ('in', 'not_in'):
+            raise PlanError(f"'{op}' needs a single value")
+        filters.append({'column': _check_column(f.get('column'), columns), 'op': op, 'value': value})
+
+    group_by = [_check_column(c, columns) for c in _entries(plan, 'group_by', str)]
+
+    aggregations = []
+    for a in _entries(plan, 'aggregations'):
+        func = a.get('func')
+        if not isinstance(func, str) or func not in AGGREGATIONS:
+            raise PlanError(f"aggregation '{func}' is not allowed")
+        column = _check_column(a.get('column'), columns)
+        alias = a.get('as') or f"{func}_{column}"
+        if not isinstance(alias, str) or not ALIAS.match(alias):
+            raise PlanError(f"invalid result name '{alias}'")
+        aggregations.append({'column': column, 'func': func, 'as': alias})
+
+    output = set(group_by) | {a['as'] for a in aggregations} if aggregations else columns
+    sort = [
+        {'column': _check_column(s.get('column'), output), 'descending': bool(s.get('descending'))}
+        for s in _entries(plan, 'sort')
+    ]
+
+    try:
+        limit = min(int(plan.get('limit') or MAX_LIMIT), MAX_LIMIT)
+    except (TypeError, ValueError):
+        raise PlanError("limit must be a number") from None
+
+    return {
+        'title': str(plan.get('title') or 'Result'),
+        'filters': filters,
+        'group_by': group_by,
+        'aggregations': aggregations,
+        'columns': [_check_column(c, columns) for c in _entries(plan, 'columns', str)],
+        'distinct': bool(plan.get('distinct')),
+        'sort': sort,
+        'limit': max(limit, 1),
+    }
+
+
+def _coerce(column, value):
+    if value is None:
+        return value
+    if column in DATE_COLUMNS:
+        convert = pd.Timestamp
+    elif STUDENT_DATA_SCHEMA[column].startswith('Int'):
+        convert = float
+    else:
+        convert = str
+    try:
+        return [convert(v) for v in value] if isinstance(value, list) else convert(value)
+    except (TypeError, ValueError):
+        raise PlanError(f"value {value!r} does not fit column '{column}'") from None
+
+
+def execute_plan(plan, df):
+    """
+    Run a validated plan against `df`.
+
+    `df` must already be role-filtered: the executor only ever narrows it,
+    so a plan can't reach rows the admin is not allowed to see.
+    """
+    mask = pd.Series(True, index=df.index)
+    for f in plan['filters']:
+        condition = FILTER_OPS[f['op']](df[f['column']], _coerce(f['column'], f['value']))
+        mask &= condition.fillna(False).astype(bool)
+    rows = df[mask]
+
+    if plan['aggregations']:
+        named = {a['as']: (a['column'], a['func']) for a in plan['aggregations']}
+        if plan['group_by']:
+            result = rows.groupby(plan['group_by'], observed=True, sort=True).agg(**named).reset_index()
+        else:
+            result = pd.DataFrame([{
+                alias: getattr(rows[column], func)() for alias, (column, func) in named.items()
+            }])
+    else:
+        result = rows[plan['columns'] or list(STUDENT_DATA_SCHEMA)]
+        if plan['distinct']:
+            result = result.drop_duplicates()
+
+    if plan['sort']:
+        result = result.sort_values(
+            [s['column'] for s in plan['sort']],
+            ascending=[not s['descending'] for s in plan['sort']],
+            kind='stable'
+        )
+
+    return result.head(plan['limit']), int(mask.sum())
+
+
+def _format_value(value):
+    if pd.isna(value):
+        return 'N/A'
+    if isinstance(value, pd.Timestamp):
+        return f"{value:%Y-%m-%d}"
+    if isinstance(value, float):
+        return f"{value:.0f}" if value.is_integer() else f"{value:.1f}"
+    return str(value)
+
+
+def format_result(plan, result, matched):
+    """Markdown answer for an executed plan."""
+    lines = [f"**{plan['title']}**", ""]
+
+    if result.empty:
+        lines.append("No matching records in your access scope.")
+    elif len(result) == 1 and len(result.columns) == 1:
+        lines.append(f"**{_format_value(result.iloc[0, 0])}**")
+    else:
+        shown = result.head(DISPLAY_ROWS)
+        lines.append('| ' + ' | '.join(map(str, shown.columns)) + ' |')
+        lines.append('|' + ' --- |' * len(shown.columns))
+        for row in shown.itertuples(index=False):
+            lines.append('| ' + ' | '.join(_format_value(v) for v in row) + ' |')
+        if len(result) > DISPLAY_ROWS:
+            lines.append(f"\n…and {len(result) - DISPLAY_ROWS} more rows.")
+
+    lines.append(f"\n_Computed locally from {matched} matching record(s)._")
+    return "\n".join(lines)
+
+
+def answer_from_plan(text, df):
+    """Parse, validate and run the model's reply; return the formatted answer."""
+    plan = validate_plan(parse_plan(text))
+    try:
+        result, matched = execute_plan(plan, df)
+    except (TypeError, ValueError, KeyError) as e:
+        raise PlanError(f"the plan could not be executed ({e})") from None
+    return format_result(plan, result, matched)
@@ -0,0 +1,309 @@
+"""
+HTTP query service: one shared dataset, model and rate limiter for every user.
+
+Serves AdminQuerySystem over an async HTTP API so the Streamlit app (or any
+other client, see query_client.py) doesn't need its own DataFrame, model
+handle or API key. The API key stays on the server, and role scopes are
+enforced here: with QUERY_SERVICE_TOKENS set, every request needs a bearer
+token and may only query inside the token's scope.
+
+Identical questions from the same scope that arrive while one is already
+being answered share that answer instead of making another Gemini call.
+
+Endpoints (grade / class_section are query parameters, omitted for 'All'):
+    POST /query          {"question": ..., "mode": ...}  -> {"answer": ..., "coalesced": ...}
+    POST /query_stream   same body, answer streamed as plain text
+    GET  /access_info
+    GET  /summary        data summary text and quick stats
+    GET  /records        the scope's rows as CSV
+    GET  /features       the per-student feature table as CSV (see analytics.py)
+    GET  /health
+
+QUERY_SERVICE_TOKENS is a JSON object (or the path of a JSON file) mapping
+tokens to scopes, e.g. {"s3cret": {"grade": 8, "class_section": "A"}}; a
+missing grade/class_section allows all of them.
+
+Usage:
+    pip install fastapi uvicorn
+    python query_service.py --port 8000
+    python query_service.py --fake       # offline, with the fake Gemini model
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import threading
+from datetime import date
+
+import pandas as pd
+from dotenv import load_dotenv
+from fastapi import Depends, FastAPI, Header, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+
+from ai_query_system_gemini import QUERY_MODES, AdminQuerySystem
+from model_resolver import default_resolver
+from rate_limit import GeminiRateLimiter
+
+load_dotenv()
+
+
+class QueryRequest(BaseModel):
+    question: str
+    mode: str | None = None
+
+
+class Coalescer:
+    """Share one in-flight call between identical concurrent requests."""
+
+    def __init__(self):
+        self._inflight = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def run(self, key, make_call):
+        """
+        Await `make_call()`, or the call already running for `key`.
+
+        Returns (result, coalesced). The shared call is shielded, so a
+        client hanging up doesn't cancel it for the others.
+        """
+        task = self._inflight.get(key)
+        coalesced = task is not None
+        if coalesced:
+            self.coalesced += 1
+        else:
+            self.calls += 1
+            task = asyncio.ensure_future(make_call())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task), coalesced
+
+
+def load_tokens(value=None):
+    """Token -> (grade, class_section) map from QUERY_SERVICE_TOKENS, or None if unset."""
+    value = value if value is not None else os.getenv('QUERY_SERVICE_TOKENS')
+    if not value:
+        return None
+    if not value.lstrip().startswith('{'):
+        with open(value) as f:
+            value = f.read()
+    return {token: token_scope(scope) for token, scope in json.loads(value).items()}
+
+
+def token_scope(scope):
+    """A token's JSON scope -> (grade, class_section), typed like parse_scope's."""
+    grade, class_section = scope.get('grade'), scope.get('class_section')
+    # A grade written as "8" must still equal the requested grade 8
+    return (None if grade in (None, '', 'All') else int(grade),
+            None if class_section in (None, '', 'All') else str(class_section))
+
+
+async def iterate_in_thread(make_iterator):
+    """
+    Run a sync generator on one worker thread and yield its chunks here.
+
+    Starlette would pull each chunk on whichever pool thread is free, in a
+    fresh copy of the context, so a query's trace set on the first chunk
+    would be gone for the rest. A client hanging up doesn't stop the
+    generator: the answer is still finished, cached and traced.
+    """
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue()
+    done = object()
+
+    def produce():
+        try:
+            for chunk in make_iterator():
+                loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+        finally:
+            loop.call_soon_threadsafe(chunks.put_nowait, done)
+
+    producer = loop.run_in_executor(None, produce)
+    while (chunk := await chunks.get()) is not done:
+        yield chunk
+    await producer
+
+
+def parse_scope(grade, class_section):
+    """Query parameters -> (grade, class_section), with 'All' or missing meaning None."""
+    if grade in (None, '', 'All'):
+        grade = None
+    else:
+        try:
+            grade = int(grade)
+        except ValueError:
+            raise HTTPException(400, f"Invalid grade: {grade}") from None
+    if class_section in ('', 'All'):
+        class_section = None
+    return grade, class_section
+
+
+def create_app(api_key=None, data_path=None, model_resolver=default_resolver, tokens=None,
+               limiter=None, deadline=120, **system_kwargs):
+    """
+    Build the service.
+
+    Args:
+        api_key: Gemini API key (default: $GEMINI_API_KEY)
+        data_path: Student data file (default: $STUDENT_DATA_PATH or student_data.csv)
+        model_resolver: ModelResolver shared by every scope
+        tokens: Token -> (grade, class_section) map (default: $QUERY_SERVICE_TOKENS;
+            None leaves the service open, with the scope chosen by the client)
+        limiter: GeminiRateLimiter shared by every request (default: from env)
+        deadline: Seconds allowed per query, retries included
+        system_kwargs: Passed on to every AdminQuerySystem
+    """
+    tokens = tokens if tokens is not None else load_tokens()
+    limiter = limiter or GeminiRateLimiter.from_env()
+    systems = {}
+    systems_lock = threading.Lock()
+    coalescer = Coalescer()
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        yield
+        for system in systems.values():
+            system.close()
+        systems.clear()
+
+    app = FastAPI(title="Dumroo AI Admin Query Service", lifespan=lifespan)
+    app.state.systems = systems
+    app.state.coalescer = coalescer
+
+    if tokens is None:
+        print("⚠️ QUERY_SERVICE_TOKENS is not set: any client may query any scope")
+
+    def admin_scope(grade: str | None = Query(None), class_section: str | None = Query(None),
+              authorization: str | None = Header(None)):
+        """The requested scope, checked against the caller's token."""
+        requested = parse_scope(grade, class_section)
+        if tokens is None:
+            return requested
+
+        token = (authorization or '').removeprefix('Bearer ').strip()
+        if token not in tokens:
+            raise HTTPException(401, "Missing or unknown access token")
+        granted = []
+        # The token's grade/class apply unless the token allows all of them
+        for allowed, wanted in zip(tokens[token], requested):
+            if allowed is not None and wanted is not None and wanted != allowed:
+                raise HTTPException(403, f"Token is not allowed to access grade {requested[0] or 'All'}, "
+                                         f"class {requested[1] or 'All'}")
+            granted.append(allowed if allowed is not None else wanted)
+        return tuple(granted)
+
+    def system_for(scope):
+        # One system per scope, shared by every client; they all share the dataset
+        with systems_lock:
+            if scope not in systems:
+                systems[scope] = AdminQuerySystem(api_key=api_key, admin_grade=scope[0], admin_class=scope[1],
+                                                  data_path=data_path, model_resolver=model_resolver,
+                                                  **system_kwargs)
+            return systems[scope]
+
+    def check_mode(mode):
+        if mode is not None and mode not in QUERY_MODES:
+            raise HTTPException(400, f"mode must be one of: {', '.join(QUERY_MODES)}")
+
+    @app.get('/health')
+    def health():
+        health = {'status': 'ok', 'scopes': len(systems),
+                  'calls': coalescer.calls, 'coalesced': coalescer.coalesced}
+        # Per-backend latency and error stats when serving from a ClientPool
+        pool = getattr(model_resolver, 'pool', None)
+        if pool is not None:
+            health['backends'] = pool.stats()
+        return health
+
+    @app.post('/query')
+    async def query(request: QueryRequest, scope=Depends(admin_scope)):
+        check_mode(request.mode)
+        # The first query of a scope loads its data and resolves the model
+        system = await run_in_threadpool(system_for, scope)
+        key = (scope, request.mode or system.query_mode, ' '.join(request.question.lower().split()))
+        answer, coalesced = await coalescer.run(
+            key, lambda: system.aquery(request.question, limiter=limiter, deadline=deadline, mode=request.mode)
+        )
+        return {'answer': answer, 'coalesced': coalesced}
+
+    @app.post('/query_stream')
+    async def query_stream(request: QueryRequest, scope=Depends(admin_scope)):
+        check_mode(request.mode)
+        system = await run_in_threadpool(system_for, scope)
+        return StreamingResponse(iterate_in_thread(lambda: system.query_stream(request.question, mode=request.mode)),
+                                 media_type='text/plain; charset=utf-8')
+
+    @app.get('/access_info')
+    def access_info(scope=Depends(admin_scope)):
+        return system_for(scope).get_access_info()
+
+    @app.get('/summary')
+    def summary(scope=Depends(admin_scope)):
+        system = system_for(scope)
+        stats = system.get_aggregates()
+        average = stats.average_quiz_score
+        return {
+            'summary': system.get_data_summary(),
+            'total_students': stats.total_students,
+            'total_records': stats.total_records,
+            'submission_rate': stats.submission_rate,
+            'average_quiz_score': None if pd.isna(average) else average,
+            'students_below_threshold': stats.students_below_threshold,
+            'upcoming_quizzes': {when.date().isoformat(): int(students)
+                                 for when, students in stats.upcoming_quizzes(today=date.today()).items()},
+        }
+
+    @app.get('/records', response_class=PlainTextResponse)
+    def records(scope=Depends(admin_scope)):
+        df = system_for(scope).filtered_data
+        return PlainTextResponse(df.to_csv(index=False, date_format='%Y-%m-%d'), media_type='text/csv')
+
+    @app.get('/features', response_class=PlainTextResponse)
+    def features(scope=Depends(admin_scope)):
+        df = system_for(scope).get_student_features(today=date.today())
+        return PlainTextResponse(df.to_csv(index=False, date_format='%Y-%m-%d'), media_type='text/csv')
+
+    return app
+
+
+def pool_key():
+    """The key genai.configure gets when a pool is used (each backend calls with its own)."""
+    return os.getenv('GEMINI_API_KEY') or os.getenv('GEMINI_API_KEYS').split(',')[0].strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve admin queries over HTTP.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--data', default=None, help="Student data file (CSV, Parquet, Arrow or SQLite)")
+    parser.add_argument('--fake', action='store_true', help="Answer with the offline fake Gemini model")
+    parser.add_argument('--latency', type=float, default=0.0, help="Simulated Gemini latency with --fake")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    if args.fake:
+        from fake_model import FakeGenerativeModel, FakeModelResolver
+        app = create_app(api_key='offline', data_path=args.data,
+                         model_resolver=FakeModelResolver(FakeGenerativeModel(latency=args.latency)))
+    elif os.getenv('GEMINI_API_KEYS'):
+        # Several keys: spread the load over a pool of (key, model) backends
+        from client_pool import ClientPool, PoolResolver
+        pool = ClientPool.from_env()
+        app = create_app(api_key=pool_key(), data_path=args.data, model_resolver=PoolResolver(pool))
+    else:
+        if not os.getenv('GEMINI_API_KEY'):
+            print("❌ Please set GEMINI_API_KEY in your .env file")
+            return
+        app = create_app(data_path=args.data)
+
+    print(f"🌐 Query service on http://{args.host}:{args.port}")
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Client-side rate limiting and retries for Gemini calls.
+
+The free tier allows 15 requests per minute and 1,500 per day. Batch jobs
+that fire many queries at once should wait for a token here instead of
+collecting 429 errors, and retry the transient failures that still happen.
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+
+# HTTP statuses worth retrying: rate limited or a transient server error
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Classic token bucket: `capacity` burst, refilled at `rate` tokens per second."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self):
+        """Take a token if one is available; otherwise return the seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """Block until a token is available."""
+        while (wait := self._take()) > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """Wait (without blocking the event loop) until a token is available."""
+        while (wait := self._take()) > 0:
+            await asyncio.sleep(wait)
+
+
+class GeminiRateLimiter:
+    """Requests-per-minute and requests-per-day limits, enforced together."""
+
+    def __init__(self, rpm=15, rpd=1500):
+        self.rpm = rpm
+        self.rpd = rpd
+        self._minute = TokenBucket(rpm / 60, rpm)
+        self._day = TokenBucket(rpd / 86400, rpd)
+
+    @classmethod
+    def from_env(cls):
+        """Limits from GEMINI_RPM / GEMINI_RPD (free-tier defaults)."""
+        return cls(int(os.getenv('GEMINI_RPM', 15)), int(os.getenv('GEMINI_RPD', 1500)))
+
+    def acquire(self):
+        self._day.acquire()
+        self._minute.acquire()
+
+    async def acquire_async(self):
+        await self._day.acquire_async()
+        await self._minute.acquire_async()
+
+
+def is_retryable(error):
+    """True for rate-limit and transient server errors from the Gemini client."""
+    return getattr(error, 'code', None) in RETRYABLE_STATUS
+
+
+def backoff_delay(attempt, base=1.0, cap=30.0):
+    """Full-jitter exponential backoff for retry number `attempt` (0-based)."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+async def call_with_retries(make_call, limiter=None, retries=3, base_delay=1.0):
+    """
+    Await `make_call()` with rate limiting and jittered retries.
+
+    Args:
+        make_call: Zero-argument function returning a fresh awaitable per attempt
+        limiter: Optional GeminiRateLimiter; a token is taken before every attempt
+        retries: Retries after the first attempt for 429/5xx errors
+        base_delay: Initial backoff in seconds
+    """
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            await limiter.acquire_async()
+        try:
+            return await make_call()
+        except Exception as e:
+            if attempt == retries or not is_retryable(e):
+                raise
+            await asyncio.sleep(backoff_delay(attempt, base_delay))
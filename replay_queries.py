@@ -0,0 +1,172 @@
+"""
+Replay logged queries (see query_log.py) for regression and load testing.
+
+Re-runs captured traffic against a chosen backend at a chosen concurrency and
+compares the new answers with the logged ones:
+
+    live    the real Gemini API, no answer cache
+    cached  the real Gemini API behind the shared answer cache
+    local   the local engine only; questions it can't answer are skipped
+    fake    FakeGenerativeModel (offline, optional simulated latency)
+
+Usage:
+    python replay_queries.py logs/query_log.jsonl --backend fake --concurrency 16
+    python replay_queries.py logs/query_log.jsonl --backend local --output replay.jsonl
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+from ai_query_system_gemini import AdminQuerySystem
+from fake_model import FakeGenerativeModel, FakeModelResolver
+from query_log import DEFAULT_PATH, read_log
+from rate_limit import GeminiRateLimiter
+from response_cache import default_cache
+
+load_dotenv()
+
+BACKENDS = ('live', 'cached', 'local', 'fake')
+
+
+def make_system(backend, grade, class_section, data_path, latency=0.0):
+    """An AdminQuerySystem for one scope, wired to `backend` (replays are never logged)."""
+    kwargs = dict(admin_grade=grade, admin_class=class_section, data_path=data_path, query_log=None)
+    if backend in ('local', 'fake'):
+        # No Gemini traffic: an API key is still required by the constructor
+        return AdminQuerySystem(api_key='offline', answer_cache=None,
+                                model_resolver=FakeModelResolver(FakeGenerativeModel(latency=latency)),
+                                **kwargs)
+    return AdminQuerySystem(answer_cache=default_cache if backend == 'cached' else None, **kwargs)
+
+
+async def replay(records, backend='fake', concurrency=4, data_path=None, latency=0.0,
+                 limiter=None, deadline=120):
+    """
+    Re-run logged queries and compare the answers.
+
+    Args:
+        records: Logged query records (dicts from read_log)
+        backend: One of BACKENDS
+        concurrency: Maximum queries in flight
+        data_path: Data file to query (default: the one each record was logged against)
+        latency: Simulated Gemini latency for the fake backend (seconds)
+        limiter: GeminiRateLimiter for the live/cached backends (default: from env)
+        deadline: Seconds allowed per query
+
+    Returns:
+        List of result dicts, in the same order as `records`
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"backend must be one of: {', '.join(BACKENDS)}")
+    if backend in ('live', 'cached'):
+        limiter = limiter or GeminiRateLimiter.from_env()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    # One system per (scope, data file), shared by every question for it
+    systems = {}
+    for record in records:
+        key = (record['grade'], record['class_section'], data_path or record.get('data_path'))
+        if key not in systems:
+            systems[key] = make_system(backend, *key, latency=latency)
+
+    async def run(record):
+        key = (record['grade'], record['class_section'], data_path or record.get('data_path'))
+        system = systems[key]
+        async with semaphore:
+            started = time.perf_counter()
+            if backend == 'local':
+                answer = system.local_engine.answer(record['question'], system.filtered_data,
+                                                    system._scope_index())
+            else:
+                answer = await system.aquery(record['question'], limiter=limiter, deadline=deadline,
+                                             mode=record.get('mode'))
+            seconds = time.perf_counter() - started
+
+        return {
+            'question': record['question'],
+            'grade': record['grade'],
+            'class_section': record['class_section'],
+            'answer': answer,
+            'logged_answer': record.get('answer'),
+            'same_answer': answer == record.get('answer'),
+            'same_data': system.dataset.scope_version(*key[:2]) == record.get('data_version'),
+            'latency_ms': round(seconds * 1000, 3),
+            'logged_latency_ms': record.get('latency_ms'),
+        }
+
+    try:
+        return await asyncio.gather(*(run(record) for record in records))
+    finally:
+        for system in systems.values():
+            system.close()
+
+
+def summarize(results, seconds):
+    """Print how the replay compares with the logged traffic."""
+    answered = [r for r in results if r['answer'] is not None]
+    latencies = np.array([r['latency_ms'] for r in answered]) if answered else np.zeros(1)
+    logged = np.array([r['logged_latency_ms'] for r in answered if r['logged_latency_ms'] is not None])
+    failed = sum(r['answer'].startswith('❌') for r in answered)
+    same_data = [r for r in answered if r['same_data']]
+
+    print(f"\n🔁 Replayed {len(answered)} queries in {seconds:.1f}s ({len(answered) / max(seconds, 1e-9):.1f} queries/s)")
+    if len(answered) < len(results):
+        print(f"  ⏭️ {len(results) - len(answered)} not answerable by this backend")
+    print(f"  ⏱️ Latency p50 {np.percentile(latencies, 50):.1f} ms, p95 {np.percentile(latencies, 95):.1f} ms")
+    if logged.size:
+        print(f"  📼 Logged   p50 {np.percentile(logged, 50):.1f} ms, p95 {np.percentile(logged, 95):.1f} ms")
+    print(f"  ✅ Same answer: {sum(r['same_answer'] for r in same_data)}/{len(same_data)} on unchanged data"
+          f" ({len(answered) - len(same_data)} logged against other data versions)")
+    if failed:
+        print(f"  ❌ {failed} failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay logged queries against a backend.")
+    parser.add_argument('log', nargs='?', default=os.getenv('QUERY_LOG_PATH', DEFAULT_PATH),
+                        help="Query log to replay (rotated files are included)")
+    parser.add_argument('--backend', choices=BACKENDS, default='fake', help="Where answers come from")
+    parser.add_argument('--concurrency', type=int, default=4, help="Queries in flight")
+    parser.add_argument('--data', help="Data file to query (default: the one each query was logged against)")
+    parser.add_argument('--latency', type=float, default=0.0, help="Simulated Gemini latency for --backend fake")
+    parser.add_argument('--limit', type=int, help="Replay only the first N queries")
+    parser.add_argument('--output', help="JSONL file to write the results to")
+    args = parser.parse_args()
+
+    if args.backend in ('live', 'cached') and not os.getenv('GEMINI_API_KEY'):
+        print("❌ Please set GEMINI_API_KEY in your .env file")
+        return
+
+    records = list(read_log(args.log))
+    chat_turns = sum(record.get('mode') == 'chat' for record in records)
+    if chat_turns:
+        # A chat turn only makes sense after the rest of its conversation
+        print(f"⏭️ Skipping {chat_turns} chat turns")
+        records = [record for record in records if record.get('mode') != 'chat']
+    records = records[:args.limit]
+    if not records:
+        print(f"❌ No logged queries in {args.log}")
+        return
+    print(f"📼 Replaying {len(records)} queries against the {args.backend} backend "
+          f"(concurrency {args.concurrency})")
+
+    started = time.perf_counter()
+    results = asyncio.run(replay(records, backend=args.backend, concurrency=args.concurrency,
+                                 data_path=args.data, latency=args.latency))
+    summarize(results, time.perf_counter() - started)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            for result in results:
+                f.write(json.dumps(result) + '\n')
+        print(f"💾 Wrote {len(results)} results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Answer cache for Gemini responses.
+
+The same question asked again from the same admin scope, over unchanged
+data, gets the same answer back without another API call. Entries are keyed
+by (normalized question, data file and scope, data version) and carry a
+TTL; the least recently used entries are evicted once the cache is full.
+Answers for other data versions are left to expire: a file switched back
+to an earlier version can still use them.
+
+Two backends are provided: an in-process LRU (the default) and a SQLite
+file that several Streamlit worker processes can share. Set
+ANSWER_CACHE_PATH to use the SQLite backend and ANSWER_CACHE_TTL to change
+the TTL (seconds).
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_question(question):
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    question = re.sub(r'\s+', ' ', question.strip().lower())
+    return question.rstrip(' ?!.')
+
+
+def scope_key(grade, class_section, data_path=None):
+    """Stable string for an admin scope ('*' stands for 'All'), of one data file if given."""
+    scope = f"{'*' if grade is None else grade}|{'*' if class_section is None else class_section}"
+    if data_path is None:
+        return scope
+    return f"{os.path.abspath(data_path)}|{scope}"
+
+
+class MemoryCacheBackend:
+    """In-process LRU backend."""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def purge_scope(self, scope, keep_version):
+        """Drop entries for `scope` computed from any other data version."""
+        with self._lock:
+            stale = [
+                key for key, entry in self._entries.items()
+                if entry['scope'] == scope and entry['data_version'] != keep_version
+            ]
+            for key in stale:
+                del self._entries[key]
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """SQLite backend, safe to share between processes."""
+
+    def __init__(self, path='.answer_cache.sqlite', max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS answers ('
+                ' key TEXT PRIMARY KEY, scope TEXT, data_version TEXT,'
+                ' answer TEXT, created_at REAL, accessed_at REAL)'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS answers_scope ON answers (scope)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS answers_accessed ON answers (accessed_at)')
+
+    def get(self, key):
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                'SELECT scope, data_version, answer, created_at FROM answers WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute('UPDATE answers SET accessed_at = ? WHERE key = ?', (time.time(), key))
+        scope, data_version, answer, created_at = row
+        return {'scope': scope, 'data_version': data_version, 'answer': answer, 'created_at': created_at}
+
+    def set(self, key, entry):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?)',
+                (key, entry['scope'], entry['data_version'], entry['answer'],
+                 entry['created_at'], time.time())
+            )
+            self._conn.execute(
+                'DELETE FROM answers WHERE key IN ('
+                ' SELECT key FROM answers ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+
+    def delete(self, key):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM answers WHERE key = ?', (key,))
+
+    def purge_scope(self, scope, keep_version):
+        """Drop entries for `scope` computed from any other data version."""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                'DELETE FROM answers WHERE scope = ? AND data_version IS NOT ?', (scope, keep_version)
+            )
+            return cursor.rowcount
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM answers')
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM answers').fetchone()[0]
+
+
+class ResponseCache:
+    """TTL cache of answers in front of a pluggable backend."""
+
+    def __init__(self, backend=None, ttl=3600):
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidated = 0
+
+    @classmethod
+    def from_env(cls):
+        """Build the cache described by ANSWER_CACHE_PATH / ANSWER_CACHE_TTL."""
+        path = os.getenv('ANSWER_CACHE_PATH')
+        backend = SQLiteCacheBackend(path) if path else MemoryCacheBackend()
+        return cls(backend, ttl=float(os.getenv('ANSWER_CACHE_TTL', 3600)))
+
+    @staticmethod
+    def make_key(question, scope, data_version):
+        raw = f"{normalize_question(question)}\x00{scope}\x00{data_version}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, question, scope, data_version):
+        """Return the cached answer, or None on a miss."""
+        key = self.make_key(question, scope, data_version)
+        entry = self.backend.get(key)
+
+        if entry is not None and time.time() - entry['created_at'] > self.ttl:
+            self.backend.delete(key)
+            self.expired += 1
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return entry['answer']
+
+    def put(self, question, scope, data_version, answer):
+        """Store an answer (other data versions' answers stay until they expire or are evicted)."""
+        self.backend.set(self.make_key(question, scope, data_version), {
+            'scope': scope,
+            'data_version': data_version,
+            'answer': answer,
+            'created_at': time.time(),
+        })
+
+    def invalidate(self, scope):
+        """Drop every answer for `scope` (e.g. after new records were ingested)."""
+        dropped = self.backend.purge_scope(scope, None)
+        self.invalidated += dropped
+        return dropped
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+            'invalidated': self.invalidated,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self.backend),
+        }
+
+
+# Default cache used by AdminQuerySystem
+default_cache = ResponseCache.from_env()
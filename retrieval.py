@@ -0,0 +1,233 @@
+"""
+Question-relevant record retrieval.
+
+The prompt builder used to find the students, homework and quizzes a
+question names by scanning every entity name for every question, then
+scoring every row with isin(). The index below is built once per scope and
+data version (memoized with the scope's other derived values): an inverted
+index from name tokens to distinct student names, homework titles and quiz
+names, each mapped to its rows through the column's category codes. A
+question is answered with the entities it names, their rows ranked by how
+many of them they match, and small per-entity aggregates, so the prompt
+carries the right rows however large the dataset is.
+
+Local embeddings can widen the match to paraphrases ("the essay about the
+environment" -> "English Essay on Climate Change"): set
+RETRIEVAL_EMBEDDING_MODEL to a sentence-transformers model name
+(pip install sentence-transformers).
+
+    index = scope_index(system.dataset, grade=8, class_section='A')
+    index.mentions("How is Aarav doing on the science lab report?")
+    index.top_rows("How is Aarav doing on the science lab report?", k=50)
+"""
+
+import math
+import os
+import re
+import threading
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+INDEXED_COLUMNS = ['student_name', 'homework_title', 'quiz_name']
+
+# Words too common in questions to say which entity is meant
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'by', 'did', 'do', 'does', 'for', 'from', 'has', 'have', 'how', 'in', 'is',
+    'it', 'me', 'my', 'of', 'on', 'or', 'show', 'the', 'their', 'to', 'was', 'what', 'which', 'who', 'with',
+}
+
+# Share of an entity's (IDF-weighted) name a question must contain to name it
+MIN_COVERAGE = 0.5
+
+# Cosine similarity at which an embedding match counts as a mention
+EMBEDDING_MATCH = 0.6
+
+
+def tokenize(text):
+    """Lower-case word tokens of `text`, without stopwords and with plural 's' removed."""
+    tokens = []
+    for word in re.findall(r'[a-z0-9]+', str(text).lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+class RetrievalIndex:
+    """Inverted index over the student, homework and quiz names of one scope's rows."""
+
+    def __init__(self, df, embedder=None):
+        """
+        Args:
+            df: The scope's records (the index keeps a reference, not a copy)
+            embedder: Optional callable mapping a list of texts to an array of embeddings
+        """
+        self.frame = df
+        self.embedder = embedder
+        self.values = {}
+        self.codes = {}
+        self._ids = {}
+        self._weights = {}
+        self._embeddings = {}
+        self._last = (None, None)
+
+        value_tokens, postings = {}, defaultdict(lambda: defaultdict(list))
+        for column in INDEXED_COLUMNS:
+            column_data = df[column]
+            if isinstance(column_data.dtype, pd.CategoricalDtype):
+                codes = column_data.cat.codes.to_numpy()
+                values = column_data.cat.categories
+            else:
+                codes, values = pd.factorize(column_data)
+            # Categories absent from this scope are never matched
+            present = np.bincount(codes[codes >= 0], minlength=len(values)) > 0
+            self.codes[column] = codes
+            self.values[column] = list(values)
+            self._ids[column] = {value: value_id for value_id, value in enumerate(values)}
+            value_tokens[column] = [set(tokenize(value)) if seen else set() for value, seen in zip(values, present)]
+            for value_id, tokens in enumerate(value_tokens[column]):
+                for token in tokens:
+                    postings[token][column].append(value_id)
+
+        # token -> {column: ids of the values containing it}, weighted by rarity
+        entities = sum(bool(tokens) for column in INDEXED_COLUMNS for tokens in value_tokens[column])
+        self.postings = {token: {column: np.array(ids) for column, ids in hits.items()}
+                         for token, hits in postings.items()}
+        self.idf = {token: math.log(1 + entities / sum(len(ids) for ids in hits.values()))
+                    for token, hits in self.postings.items()}
+        for column in INDEXED_COLUMNS:
+            self._weights[column] = np.array([sum(self.idf[token] for token in tokens)
+                                              for tokens in value_tokens[column]])
+
+        if embedder is not None:
+            for column in INDEXED_COLUMNS:
+                self._embeddings[column] = _normalize(embedder([str(value) for value in self.values[column]]))
+
+    def __len__(self):
+        return len(self.frame)
+
+    def _value_scores(self, question):
+        """{column: array of match scores per distinct value} for `question`."""
+        last_question, last_scores = self._last
+        if question == last_question:
+            return last_scores
+
+        lowered = question.lower()
+        asked = set(tokenize(question))
+        scores = {}
+        for column in INDEXED_COLUMNS:
+            weight = np.zeros(len(self.values[column]))
+            for token in asked:
+                ids = self.postings.get(token, {}).get(column)
+                if ids is not None:
+                    weight[ids] += self.idf[token]
+            coverage = np.divide(weight, self._weights[column], out=np.zeros_like(weight),
+                                 where=self._weights[column] > 0)
+            column_scores = np.where(coverage >= MIN_COVERAGE, np.minimum(coverage, 0.99), 0.0)
+            if column == 'student_name':
+                # A first or last name on its own names a student ("How is Aarav doing?")
+                column_scores[weight > 0] = np.minimum(coverage[weight > 0], 0.99)
+            for value_id in np.flatnonzero(coverage > 0.999):
+                if str(self.values[column][value_id]).lower() in lowered:
+                    column_scores[value_id] = 1.0
+            if column != 'student_name' and (column_scores == 1.0).any():
+                # "Math Quiz 1" named in full outranks "English Quiz 1" sharing two of its words
+                column_scores[column_scores < 1.0] = 0.0
+            scores[column] = column_scores
+
+        if self.embedder is not None and asked:
+            query = _normalize(self.embedder([question]))[0]
+            for column in INDEXED_COLUMNS:
+                similarity = self._embeddings[column] @ query
+                close = (similarity >= EMBEDDING_MATCH) & (scores[column] == 0)
+                scores[column][close] = similarity[close]
+
+        # Prompt building asks for mentions and rows of the same question in turn
+        self._last = (question, scores)
+        return scores
+
+    def mentions(self, question):
+        """Return {column: [values]} for the students/homework/quizzes a question names."""
+        mentions = {}
+        for column, scores in self._value_scores(question).items():
+            value_ids = np.flatnonzero(scores)
+            if value_ids.size:
+                ranked = value_ids[np.argsort(-scores[value_ids], kind='stable')]
+                mentions[column] = [self.values[column][value_id] for value_id in ranked]
+        return mentions
+
+    def row_scores(self, question):
+        """Relevance of every row: the summed scores of the entities it matches."""
+        total = np.zeros(len(self.frame))
+        for column, scores in self._value_scores(question).items():
+            codes = self.codes[column]
+            total += np.where(codes >= 0, scores[codes], 0.0)
+        return total
+
+    def top_rows(self, question, k=None):
+        """The (at most `k`) rows matching the question's entities, most relevant first."""
+        scores = self.row_scores(question)
+        hits = np.flatnonzero(scores)
+        if k is not None and hits.size > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        # Best first; rows with equal scores keep their order in the data
+        hits = hits[np.lexsort((hits, -scores[hits]))]
+        return self.frame.iloc[hits]
+
+    def entity_stats(self, mentions):
+        """Homework and quiz aggregates for the entities in `mentions` (student stats are in the summary)."""
+        rows = []
+        for column in ('homework_title', 'quiz_name'):
+            for value in mentions.get(column, []):
+                records = self.frame.iloc[np.flatnonzero(self.codes[column] == self._ids[column][value])]
+                if column == 'homework_title':
+                    status = records['submission_status']
+                    rows.append({'item': value, 'type': 'homework', 'students': records['student_name'].nunique(),
+                                 'submitted': int((status == 'Submitted').sum()),
+                                 'pending': int((status == 'Not Submitted').sum())})
+                else:
+                    scores = records['quiz_score'].astype('float64')
+                    rows.append({'item': value, 'type': 'quiz', 'students': records['student_name'].nunique(),
+                                 'avg_quiz': round(scores.mean(), 1), 'min_quiz': scores.min()})
+        return pd.DataFrame(rows, columns=['item', 'type', 'students', 'submitted', 'pending', 'avg_quiz', 'min_quiz'])
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype='float64')
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def embedder_from_env():
+    """The sentence-transformers embedder named by RETRIEVAL_EMBEDDING_MODEL, or None (loaded once)."""
+    global _embedder
+    name = os.getenv('RETRIEVAL_EMBEDDING_MODEL')
+    if not name:
+        return None
+    with _embedder_lock:
+        if _embedder is None:
+            try:
+                from sentence_transformers import SentenceTransformer
+            except ImportError:
+                raise ImportError(
+                    "RETRIEVAL_EMBEDDING_MODEL needs sentence-transformers: pip install sentence-transformers"
+                ) from None
+            model = SentenceTransformer(name)
+            _embedder = lambda texts: model.encode(texts, show_progress_bar=False)
+        return _embedder
+
+
+def scope_index(source, grade=None, class_section=None):
+    """RetrievalIndex for a scope of a Dataset or SQLiteDataSource, built once per data version."""
+    return source.memoize(
+        ('retrieval', grade, class_section),
+        lambda: RetrievalIndex(source.view(grade, class_section), embedder=embedder_from_env()),
+    )
@@ -0,0 +1,289 @@
+"""
+SQLite-backed data source.
+
+Keeps the student records in an embedded SQLite database instead of a
+DataFrame per worker. Role filters and the per-student homework/quiz
+rollups behind the scope aggregates run as indexed SQL, and rows are only pulled into
+pandas for the admin's own scope, when something actually needs them.
+
+Usage:
+    python sql_source.py student_data.csv student_data.sqlite
+    STUDENT_DATA_PATH=student_data.sqlite streamlit run streamlit_app_gemini.py
+"""
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+from aggregates import LOW_SCORE_THRESHOLD, TREND_EPOCH, ScopeAggregates
+from data_schema import DATE_COLUMNS, RECORD_KEY, STUDENT_DATA_SCHEMA, apply_schema, covering_scopes
+from prompt_builder import build_scope_summary
+
+SQLITE_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+
+SQL_TYPES = {'Int16': 'INTEGER', 'category': 'TEXT', 'datetime64[ns]': 'TEXT'}
+
+INDEXES = {
+    'records_scope': ['grade', 'class_section'],
+    'records_student': ['student_id'],
+    'records_status': ['submission_status'],
+}
+
+
+# Mirrors aggregates.partition_rollup: trend sums over rows with both a score and a quiz date
+_TREND_DAY = f"(julianday(quiz_date) - julianday('{TREND_EPOCH:%Y-%m-%d}'))"
+_TREND_ROW = 'quiz_score IS NOT NULL AND quiz_date IS NOT NULL'
+_TREND_SUMS = ', '.join(
+    f'COALESCE(SUM(CASE WHEN {_TREND_ROW} THEN {expression} END), 0) AS {name}'
+    for name, expression in (
+        ('trend_n', '1'),
+        ('trend_t', _TREND_DAY),
+        ('trend_s', 'quiz_score'),
+        ('trend_tt', f'{_TREND_DAY} * {_TREND_DAY}'),
+        ('trend_ts', f'{_TREND_DAY} * quiz_score'),
+    )
+)
+
+
+def is_sqlite_path(path):
+    return str(path).lower().endswith(SQLITE_SUFFIXES)
+
+
+def _scope_where(grade, class_section):
+    clauses, params = [], []
+    if grade is not None:
+        clauses.append('grade = ?')
+        params.append(int(grade))
+    if class_section is not None:
+        clauses.append('class_section = ?')
+        params.append(class_section)
+    return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+
+class SQLiteDataSource:
+    """
+    Student records in SQLite, with the same read interface as data_store.Dataset.
+
+    Queries always see the current database contents; `version` changes
+    whenever the table is re-imported, and each (grade, class_section)
+    partition also gets a new stamp when ingest() changes its rows, so caches
+    keyed on scope_version() stay correct without invalidating other scopes.
+    """
+
+    # Systems only move between snapshots of in-memory Datasets
+    successor = None
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.refcount = 0
+        self._lock = threading.RLock()
+        self._memo = {}
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._create_schema()
+
+    def _create_schema(self):
+        columns = ', '.join(f'{name} {SQL_TYPES[dtype]}' for name, dtype in STUDENT_DATA_SCHEMA.items())
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(f'CREATE TABLE IF NOT EXISTS records ({columns})')
+            for name, index_columns in INDEXES.items():
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON records ({', '.join(index_columns)})")
+            self._conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    @property
+    def version(self):
+        row = self._query("SELECT value FROM meta WHERE key = 'version'")
+        return row[0][0] if row else 'empty'
+
+    def __len__(self):
+        return self._query('SELECT COUNT(*) FROM records')[0][0]
+
+    def import_frame(self, df, replace=True):
+        """Load a typed student DataFrame into the database."""
+        version = hashlib.sha256(f"{self.version}:{len(df)}:{time.time()}".encode()).hexdigest()[:16]
+        with self._lock, self._conn:
+            if replace:
+                self._conn.execute('DELETE FROM records')
+                self._conn.execute("DELETE FROM meta WHERE key LIKE 'partition:%'")
+            self._insert(df)
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (version,))
+            self._memo.clear()
+
+    def _insert(self, df):
+        columns = [c for c in STUDENT_DATA_SCHEMA if c in df.columns]
+        values = []
+        for column in columns:
+            if column in DATE_COLUMNS:
+                convert = lambda v: v.strftime('%Y-%m-%d')
+            elif STUDENT_DATA_SCHEMA[column].startswith('Int'):
+                convert = int
+            else:
+                convert = str
+            values.append([None if pd.isna(v) else convert(v) for v in df[column]])
+
+        self._conn.executemany(
+            f"INSERT INTO records ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            zip(*values)
+        )
+
+    def ingest(self, df, mode='append'):
+        """
+        Add records ('append') or replace those with the same RECORD_KEY ('upsert').
+
+        Returns the (grade, class_section) partitions that changed; only
+        scopes covering them get a new scope_version().
+        """
+        if mode not in ('append', 'upsert'):
+            raise ValueError(f"Unknown ingest mode '{mode}' (expected 'append' or 'upsert')")
+
+        df = apply_schema(df)
+        if mode == 'upsert':
+            df = df.drop_duplicates(RECORD_KEY, keep='last')
+
+        touched = {(int(g), c) for g, c in df[['grade', 'class_section']].drop_duplicates().itertuples(index=False)}
+        match = ' AND '.join(f'{column} = ?' for column in RECORD_KEY)
+        keys = [tuple(map(str, key)) for key in df[RECORD_KEY].itertuples(index=False)]
+
+        with self._lock, self._conn:
+            if mode == 'upsert':
+                for key in keys:
+                    touched.update(self._conn.execute(
+                        f'SELECT DISTINCT grade, class_section FROM records WHERE {match}', key
+                    ).fetchall())
+                self._conn.executemany(f'DELETE FROM records WHERE {match}', keys)
+            self._insert(df)
+
+            stamp = hashlib.sha256(f"{self.version}:{len(df)}:{time.time()}".encode()).hexdigest()[:16]
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                [(f'partition:{grade}:{class_section}', stamp) for grade, class_section in touched]
+            )
+
+            stale = covering_scopes(touched)
+            self._memo = {
+                key: value for key, value in self._memo.items()
+                if not (isinstance(key, tuple) and len(key) == 3 and key[1:] in stale)
+            }
+
+        return touched
+
+    @property
+    def frame(self):
+        """Every record as a DataFrame (loads the whole table)."""
+        return self.view()
+
+    def view(self, grade=None, class_section=None):
+        """
+        Rows in an admin's scope, selected with the (grade, class_section) index.
+
+        Loaded once per scope and partition stamps, then shared: every caller
+        gets a shallow copy of the same frame.
+        """
+        def load():
+            where, params = _scope_where(grade, class_section)
+            with self._lock:
+                df = pd.read_sql_query(f'SELECT * FROM records{where} ORDER BY rowid', self._conn, params=params)
+            return apply_schema(df)
+        return self.memoize(('view', grade, class_section), load).copy(deep=False)
+
+    @property
+    def partitions(self):
+        rows = self._query('SELECT DISTINCT grade, class_section FROM records ORDER BY grade, class_section')
+        return {tuple(row): None for row in rows}
+
+    def memoize(self, key, builder):
+        """
+        Cache a derived value until its data changes.
+
+        (name, grade, class_section) keys are checked against the scope's
+        partition stamps, other keys against the table version, so an import
+        or ingest by another process is picked up on the next call too.
+        """
+        if isinstance(key, tuple) and len(key) == 3:
+            stamp = self.scope_version(key[1], key[2])
+        else:
+            stamp = self.version
+        with self._lock:
+            cached = self._memo.get(key)
+            if cached is None or cached[0] != stamp:
+                cached = self._memo[key] = (stamp, builder())
+            return cached[1]
+
+    def scope_version(self, grade=None, class_section=None):
+        stamps = []
+        for key, stamp in self._query("SELECT key, value FROM meta WHERE key LIKE 'partition:%' ORDER BY key"):
+            _, stamp_grade, stamp_class = key.split(':', 2)
+            if grade is not None and stamp_grade != str(int(grade)):
+                continue
+            if class_section is not None and stamp_class != class_section:
+                continue
+            stamps.append(f"{key}={stamp}")
+        raw = '|'.join([self.version, str(grade), str(class_section), *stamps])
+        return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+    def aggregates(self, grade=None, class_section=None):
+        """ScopeAggregates for a scope, with the per-student rollup computed in SQL."""
+        return self.memoize(('aggregates', grade, class_section),
+                            lambda: ScopeAggregates([self._rollup(grade, class_section)]))
+
+    def _rollup(self, grade, class_section):
+        where, params = _scope_where(grade, class_section)
+
+        with self._lock:
+            students = pd.read_sql_query(
+                'SELECT grade, class_section, student_name, COUNT(*) AS records,'
+                " COALESCE(SUM(submission_status = 'Submitted'), 0) AS submitted,"
+                ' COUNT(quiz_score) AS quiz_count, COALESCE(SUM(quiz_score), 0) AS quiz_sum,'
+                ' MIN(quiz_score) AS quiz_min, MAX(quiz_score) AS quiz_max,'
+                ' COALESCE(SUM(quiz_score < ?), 0) AS below_threshold,'
+                f' {_TREND_SUMS}'
+                f' FROM records{where} GROUP BY grade, class_section, student_name'
+                ' ORDER BY grade, class_section, student_name',
+                self._conn, params=[LOW_SCORE_THRESHOLD, *params]
+            )
+            scheduled = pd.read_sql_query(
+                f'SELECT DISTINCT quiz_scheduled_date, student_name FROM records{where}'
+                f"{' AND' if where else ' WHERE'} quiz_scheduled_date IS NOT NULL",
+                self._conn, params=params, parse_dates=['quiz_scheduled_date']
+            )
+
+        entities = {}
+        for column in ('student_name', 'homework_title', 'quiz_name'):
+            rows = self._query(
+                f'SELECT DISTINCT {column} FROM records{where}'
+                f"{' AND' if where else ' WHERE'} {column} IS NOT NULL", params
+            )
+            entities[column] = [row[0] for row in rows]
+
+        return {'students': students, 'entities': entities, 'scheduled': scheduled}
+
+    def scope_summary(self, grade=None, class_section=None):
+        """Same pre-aggregates as Dataset.scope_summary, from SQL rollups."""
+        return self.memoize(('summary', grade, class_section),
+                            lambda: build_scope_summary(self.aggregates(grade, class_section)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import student data into a SQLite database.")
+    parser.add_argument('source', help="Input file (.csv, .json, .parquet or .arrow)")
+    parser.add_argument('target', help="SQLite database to (re)create")
+    args = parser.parse_args()
+
+    from convert_data import read_source
+
+    source = SQLiteDataSource(args.target)
+    source.import_frame(read_source(args.source))
+    print(f"✅ Imported {len(source)} records into {args.target} (version {source.version})")
+
+
+if __name__ == "__main__":
+    main()
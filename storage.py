@@ -0,0 +1,197 @@
+"""
+Storage backends for the student dataset.
+
+CSV is parsed in full on every load. For larger, district-scale data the
+same records can be kept as Parquet or Arrow IPC (see convert_data.py):
+both are memory-mapped, keep the column types, and push the admin's
+grade/class filter down into the reader so only that partition is loaded.
+
+Every backend can also stream the file in chunks (iter_chunks), filtered to
+an admin's scope as it is read, for data larger than memory (see
+streaming_source.py).
+
+Parquet and Arrow support needs pyarrow (pip install pyarrow).
+"""
+
+import hashlib
+import os
+
+import pandas as pd
+
+from data_schema import load_student_data
+
+# Bytes read per step when hashing a file
+HASH_CHUNK_SIZE = 1 << 20
+
+# Rows per chunk when streaming a file
+DEFAULT_CHUNK_ROWS = 100_000
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Parquet/Arrow storage needs pyarrow: pip install pyarrow") from None
+    return pyarrow
+
+
+def _to_pandas(table):
+    """Arrow table to pandas, keeping int16 columns nullable (Int16) as in STUDENT_DATA_SCHEMA."""
+    pa = _require_pyarrow()
+    return table.to_pandas(types_mapper={pa.int16(): pd.Int16Dtype()}.get)
+
+
+def _scope_filters(grade, class_section):
+    filters = []
+    if grade is not None:
+        filters.append(('grade', '==', grade))
+    if class_section is not None:
+        filters.append(('class_section', '==', class_section))
+    return filters
+
+
+def _scope_expression(grade, class_section):
+    """The scope filter as a pyarrow compute expression (None for every row)."""
+    import pyarrow.compute as pc
+
+    condition = None
+    for column, _, value in _scope_filters(grade, class_section):
+        term = pc.field(column) == value
+        condition = term if condition is None else condition & term
+    return condition
+
+
+class CsvStorage:
+    """Plain CSV file, parsed in full with the typed schema."""
+
+    supports_pushdown = False
+
+    def __init__(self, path):
+        self.path = path
+
+    def fingerprint(self):
+        """Content hash of the file, read in chunks."""
+        digest = hashlib.sha256()
+        with open(self.path, 'rb') as f:
+            while chunk := f.read(HASH_CHUNK_SIZE):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def read(self, grade=None, class_section=None):
+        """Load the whole file (CSV cannot skip rows, so the scope is ignored)."""
+        return load_student_data(self.path)
+
+    def iter_chunks(self, grade=None, class_section=None, chunksize=DEFAULT_CHUNK_ROWS):
+        """Yield the scope's rows as typed frames of up to `chunksize` rows, filtered while reading."""
+        for chunk in load_student_data(self.path, chunksize=chunksize):
+            for column, _, value in _scope_filters(grade, class_section):
+                chunk = chunk[chunk[column] == value]
+            if not chunk.empty:
+                yield chunk
+
+
+class ParquetStorage(CsvStorage):
+    """Parquet file, memory-mapped, with row-group pruning on grade/class_section."""
+
+    supports_pushdown = True
+
+    def fingerprint(self):
+        # The footer holds every row group's size and min/max statistics, but
+        # a changed value inside a row group's range can leave it as it was:
+        # the modification time tells those rewrites apart without hashing
+        # the whole file.
+        stat = os.stat(self.path)
+        with open(self.path, 'rb') as f:
+            f.seek(max(stat.st_size - 65536, 0))
+            footer = f.read()
+        return hashlib.sha256(footer + f"{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()
+
+    def read(self, grade=None, class_section=None):
+        _require_pyarrow()
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(
+            self.path,
+            memory_map=True,
+            filters=_scope_filters(grade, class_section) or None
+        )
+        return _to_pandas(table)
+
+    def iter_chunks(self, grade=None, class_section=None, chunksize=DEFAULT_CHUNK_ROWS):
+        _require_pyarrow()
+        import pyarrow.dataset as ds
+
+        batches = ds.dataset(self.path, format='parquet').to_batches(
+            filter=_scope_expression(grade, class_section), batch_size=chunksize
+        )
+        for batch in batches:
+            if batch.num_rows:
+                yield _to_pandas(batch)
+
+
+class ArrowStorage(CsvStorage):
+    """Arrow IPC (Feather v2) file, memory-mapped and filtered without copying."""
+
+    supports_pushdown = True
+
+    def read(self, grade=None, class_section=None):
+        pa = _require_pyarrow()
+
+        with pa.memory_map(self.path) as source:
+            table = pa.ipc.open_file(source).read_all()
+
+        condition = _scope_expression(grade, class_section)
+        if condition is not None:
+            table = table.filter(condition)
+
+        return _to_pandas(table)
+
+    def iter_chunks(self, grade=None, class_section=None, chunksize=DEFAULT_CHUNK_ROWS):
+        pa = _require_pyarrow()
+
+        condition = _scope_expression(grade, class_section)
+        with pa.memory_map(self.path) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                table = pa.Table.from_batches([reader.get_batch(i)])
+                if condition is not None:
+                    table = table.filter(condition)
+                for batch in table.to_batches(max_chunksize=chunksize):
+                    if batch.num_rows:
+                        yield _to_pandas(batch)
+
+
+STORAGE_BY_SUFFIX = {
+    '.csv': CsvStorage,
+    '.parquet': ParquetStorage,
+    '.pq': ParquetStorage,
+    '.arrow': ArrowStorage,
+    '.feather': ArrowStorage,
+    '.ipc': ArrowStorage,
+}
+
+
+def open_storage(path):
+    """Return the storage backend for `path`, chosen by file extension."""
+    suffix = os.path.splitext(path)[1].lower()
+    try:
+        return STORAGE_BY_SUFFIX[suffix](path)
+    except KeyError:
+        raise ValueError(
+            f"Unsupported data file '{path}' (expected one of: {', '.join(STORAGE_BY_SUFFIX)})"
+        ) from None
+
+
+def write_storage(df, path):
+    """Write `df` in the format implied by `path`, sorted by grade/class for pruning."""
+    df = df.sort_values(['grade', 'class_section'], kind='stable')
+    storage = open_storage(path)
+
+    if isinstance(storage, ParquetStorage):
+        _require_pyarrow()
+        df.to_parquet(path, index=False, row_group_size=max(len(df) // 64, 10_000))
+    elif isinstance(storage, ArrowStorage):
+        _require_pyarrow()
+        df.reset_index(drop=True).to_feather(path)
+    else:
+        df.to_csv(path, index=False, na_rep='N/A', date_format='%Y-%m-%d')
@@ -0,0 +1,166 @@
+"""
+Out-of-core data source for student files larger than memory.
+
+A Dataset holds the whole file as one DataFrame. StreamingDataSource never
+does: it reads the file in chunks (CSV with read_csv(chunksize=...), Parquet
+and Arrow as record batches, see storage.iter_chunks), drops the rows outside
+the admin's scope while reading, and folds each chunk into the per-partition
+rollups of aggregates.py. Peak memory is one chunk plus one row per student,
+whatever the file size, and the scope's aggregates, access info and prompt
+summary come from those rollups. Rows are only read for row-level answers
+(the local engine, prompt records, the Streamlit preview) and are never kept
+by the source: a scope larger than STREAMING_VIEW_ROWS comes back as a
+uniform sample, which the local engine declines, so those questions are
+answered from the folded aggregates instead.
+
+It has the read interface of data_store.Dataset, and DatasetStore.acquire()
+picks it for files above STREAMING_MIN_MB (default 1024) or with
+STREAMING_DATA=1.
+
+    source = StreamingDataSource('district.csv')
+    source.aggregates(grade=8, class_section='A').total_students
+"""
+
+import hashlib
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from aggregates import ScopeAggregates, merge_rollups, partition_rollup
+from data_schema import STUDENT_DATA_SCHEMA, apply_schema
+from prompt_builder import build_scope_summary
+from storage import DEFAULT_CHUNK_ROWS, open_storage
+
+# Chunk rollups are folded into the running rollup this many at a time
+FOLD_EVERY = 8
+
+# Scopes with more records than this are viewed as a sample of about this many rows
+DEFAULT_VIEW_ROWS = 200_000
+
+
+def should_stream(path):
+    """Whether `path` is large enough (or STREAMING_DATA asks) to be streamed rather than loaded."""
+    flag = os.getenv('STREAMING_DATA', '').lower()
+    if flag in ('1', 'true', 'yes'):
+        return True
+    if flag in ('0', 'false', 'no'):
+        return False
+    return os.path.getsize(path) >= float(os.getenv('STREAMING_MIN_MB', '1024')) * 2**20
+
+
+def _empty_frame():
+    return apply_schema(pd.DataFrame({column: pd.Series(dtype=object) for column in STUDENT_DATA_SCHEMA}))
+
+
+class StreamingDataSource:
+    """Student records scanned from a file in chunks, with the same read interface as data_store.Dataset."""
+
+    # A new file version gets a new source, see DatasetStore.acquire
+    successor = None
+
+    def __init__(self, path, chunksize=DEFAULT_CHUNK_ROWS, view_rows=None):
+        """
+        Args:
+            path: CSV, Parquet or Arrow file
+            chunksize: Rows read per chunk
+            view_rows: Largest scope view() returns in full (default:
+                $STREAMING_VIEW_ROWS or DEFAULT_VIEW_ROWS)
+        """
+        self.path = path
+        self.storage = open_storage(path)
+        self.chunksize = chunksize
+        self.view_rows = view_rows or int(os.getenv('STREAMING_VIEW_ROWS', DEFAULT_VIEW_ROWS))
+        stat = os.stat(path)
+        self.mtime, self.size = stat.st_mtime, stat.st_size
+        self.file_hash = self.storage.fingerprint()
+        self.version = self.file_hash[:16]
+        self.refcount = 0
+        self._memo = {}
+        self._lock = threading.RLock()
+
+    def memoize(self, key, builder):
+        """Cache a derived value for the lifetime of this file version."""
+        with self._lock:
+            if key not in self._memo:
+                self._memo[key] = builder()
+            return self._memo[key]
+
+    def chunks(self, grade=None, class_section=None):
+        """Yield the scope's rows chunk by chunk."""
+        yield from self.storage.iter_chunks(grade, class_section, chunksize=self.chunksize)
+
+    def _scan(self, grade, class_section):
+        """One pass over the scope: {(grade, class_section): rollup} plus the number of records."""
+        pending, rollups, records = {}, {}, 0
+        for chunk in self.chunks(grade, class_section):
+            records += len(chunk)
+            for key, rows in chunk.groupby(['grade', 'class_section'], sort=False, observed=True):
+                key = (int(key[0]), key[1])
+                pending.setdefault(key, []).append(partition_rollup(rows))
+                if len(pending[key]) >= FOLD_EVERY:
+                    rollups[key] = merge_rollups(([rollups[key]] if key in rollups else []) + pending.pop(key))
+        for key, parts in pending.items():
+            rollups[key] = merge_rollups(([rollups[key]] if key in rollups else []) + parts)
+        return dict(sorted(rollups.items())), records
+
+    def _rollups(self, grade=None, class_section=None):
+        return self.memoize(('rollups', grade, class_section), lambda: self._scan(grade, class_section))
+
+    def __len__(self):
+        return self._rollups()[1]
+
+    @property
+    def partitions(self):
+        return {key: None for key in self._rollups()[0]}
+
+    def aggregates(self, grade=None, class_section=None):
+        """ScopeAggregates for a scope, folded chunk by chunk from the file."""
+        def build():
+            rollups = list(self._rollups(grade, class_section)[0].values())
+            return ScopeAggregates(rollups or [partition_rollup(_empty_frame())])
+        return self.memoize(('aggregates', grade, class_section), build)
+
+    def scope_summary(self, grade=None, class_section=None):
+        """Pre-aggregates the prompt builder draws from, built once per scope."""
+        return self.memoize(
+            ('summary', grade, class_section),
+            lambda: build_scope_summary(self.aggregates(grade, class_section))
+        )
+
+    def scope_version(self, grade=None, class_section=None):
+        raw = f"{self.version}|{grade}|{class_section}"
+        return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+    def _read(self, grade, class_section, fraction=None):
+        """The scope's rows (or a `fraction` of them, in file order) in one frame."""
+        rng = np.random.default_rng(0)
+        chunks = [chunk if fraction is None else chunk[rng.random(len(chunk)) < fraction]
+                  for chunk in self.chunks(grade, class_section)]
+        if not chunks:
+            return _empty_frame()
+        # Chunks carry their own categories; re-type the joined frame once
+        return pd.concat(chunks, ignore_index=True).astype(
+            {column: 'category' for column, dtype in STUDENT_DATA_SCHEMA.items() if dtype == 'category'}
+        )
+
+    def view(self, grade=None, class_section=None):
+        """
+        Rows in an admin's scope, read while streaming (the source keeps no rows).
+
+        A scope with more than `view_rows` records comes back as a uniform
+        sample of about that many rows, with attrs['sample_of'] set to the
+        scope's record count.
+        """
+        records = self._rollups(grade, class_section)[1]
+        if records <= self.view_rows:
+            return self._read(grade, class_section)
+        df = self._read(grade, class_section, fraction=self.view_rows / records)
+        df.attrs['sample_of'] = records
+        return df
+
+    @property
+    def frame(self):
+        """Every record as a DataFrame (loads the whole file)."""
+        return self._read(None, None)
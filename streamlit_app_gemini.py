@@ -1,6 +1,11 @@
 import streamlit as st
 import pandas as pd
 from ai_query_system_gemini import AdminQuerySystem
+from chat_session import ChatSession
+from aggregates import LOW_SCORE_THRESHOLD
+from analytics import at_risk
+from ingest import DropFolderWatcher
+from query_client import QueryServiceClient
 import os
 
 # Page configuration
@@ -10,6 +15,15 @@ st.set_page_config(
     layout="wide"
 )
 
+@st.cache_resource
+def start_ingest_watcher(folder):
+    """One drop-folder watcher per server process, shared by every session."""
+    return DropFolderWatcher(folder, persist=True).start()
+
+# Pick up new records dropped into INGEST_DIR without restarting the app
+if os.getenv('INGEST_DIR'):
+    start_ingest_watcher(os.getenv('INGEST_DIR'))
+
 # Title and description
 st.title("🎓 Dumroo AI Admin Panel (Powered by Gemini)")
 st.markdown("Ask questions about student data in plain English! 🚀 **FREE Gemini API**")
@@ -17,16 +31,30 @@ st.markdown("Ask questions about student data in plain English! 🚀 **FREE Gemi
 # Sidebar for admin configuration
 st.sidebar.header("👤 Admin Access Control")
 
-# API Key input with instructions
-st.sidebar.markdown("### 🔑 Gemini API Key")
-st.sidebar.info("Get your FREE API key at: https://aistudio.google.com/app/apikey")
+# With QUERY_SERVICE_URL set, queries go to the shared query service
+# (query_service.py), which holds the data, the model and the API key
+service_url = os.getenv('QUERY_SERVICE_URL')
 
-api_key = st.sidebar.text_input(
-    "Enter your Gemini API Key",
-    type="password",
-    value=os.getenv('GEMINI_API_KEY', ''),
-    help="Free tier: 15 requests/min, 1500 requests/day"
-)
+if service_url:
+    st.sidebar.markdown("### 🌐 Query Service")
+    st.sidebar.info(f"Queries are answered by {service_url}")
+    api_key = st.sidebar.text_input(
+        "Access token",
+        type="password",
+        value=os.getenv('QUERY_SERVICE_TOKEN', ''),
+        help="Leave empty if the service doesn't require one"
+    ) or None
+else:
+    # API Key input with instructions
+    st.sidebar.markdown("### 🔑 Gemini API Key")
+    st.sidebar.info("Get your FREE API key at: https://aistudio.google.com/app/apikey")
+
+    api_key = st.sidebar.text_input(
+        "Enter your Gemini API Key",
+        type="password",
+        value=os.getenv('GEMINI_API_KEY', ''),
+        help="Free tier: 15 requests/min, 1500 requests/day"
+    )
 
 # Grade and class selection
 st.sidebar.markdown("### 🎯 Access Scope")
@@ -48,20 +76,36 @@ if 'messages' not in st.session_state:
 
 if 'system' not in st.session_state:
     st.session_state.system = None
+    st.session_state.chat = None
 
-# Initialize the system when API key is provided
-if api_key:
+# Initialize the system when API key is provided (or the query service is used)
+if api_key or service_url:
     try:
         if st.session_state.system is None or \
            st.session_state.get('grade') != admin_grade or \
-           st.session_state.get('class') != admin_class:
+           st.session_state.get('class_') != admin_class:
             
             with st.spinner("🔄 Initializing Gemini AI system..."):
-                st.session_state.system = AdminQuerySystem(
-                    api_key=api_key,
-                    admin_grade=admin_grade,
-                    admin_class=admin_class
-                )
+                if st.session_state.chat is not None:
+                    st.session_state.chat.close()
+                    st.session_state.chat = None
+                if st.session_state.system is not None:
+                    st.session_state.system.close()
+                if service_url:
+                    st.session_state.system = QueryServiceClient(
+                        service_url,
+                        admin_grade=admin_grade,
+                        admin_class=admin_class,
+                        token=api_key
+                    )
+                else:
+                    st.session_state.system = AdminQuerySystem(
+                        api_key=api_key,
+                        admin_grade=admin_grade,
+                        admin_class=admin_class
+                    )
+                    # Follow-up questions see the conversation so far
+                    st.session_state.chat = ChatSession(st.session_state.system)
                 st.session_state.grade = admin_grade
                 st.session_state.class_ = admin_class
             
@@ -85,6 +129,7 @@ if api_key:
     except Exception as e:
         st.sidebar.error(f"❌ Error: {str(e)}")
         st.session_state.system = None
+        st.session_state.chat = None
 else:
     st.sidebar.warning("⚠️ Please enter your Gemini API key to continue")
     st.sidebar.markdown("""
@@ -114,10 +159,8 @@ with col1:
         for query in example_queries:
             if st.button(f"📌 {query}", key=query, use_container_width=True):
                 if st.session_state.system:
-                    st.session_state.messages.append({"role": "user", "content": query})
-                    with st.spinner("🤔 Thinking..."):
-                        response = st.session_state.system.query(query)
-                        st.session_state.messages.append({"role": "assistant", "content": response})
+                    # Answered (and streamed) in the chat section below
+                    st.session_state.pending_query = query
                     st.rerun()
 
 with col2:
@@ -125,9 +168,11 @@ with col2:
     if st.session_state.system:
         df = st.session_state.system.filtered_data
         st.dataframe(df.head(10), height=300)
+        if df.attrs.get('sample_of'):
+            st.caption(f"Sample of {len(df):,} of {df.attrs['sample_of']:,} records (streamed file)")
         
         # Download button
-        csv = df.to_csv(index=False)
+        csv = df.to_csv(index=False, na_rep='N/A', date_format='%Y-%m-%d')
         st.download_button(
             label="📥 Download Data",
             data=csv,
@@ -137,14 +182,31 @@ with col2:
         
         # Quick stats
         st.markdown("### 📈 Quick Stats")
+        stats = st.session_state.system.get_aggregates()
         col_a, col_b = st.columns(2)
         with col_a:
-            st.metric("Total Students", df['student_name'].nunique())
+            st.metric("Total Students", stats.total_students)
+            average = stats.average_quiz_score
+            st.metric("Average Quiz Score", "N/A" if pd.isna(average) else f"{average:.1f}")
         with col_b:
-            submitted = (df['submission_status'] == 'Submitted').sum()
-            total = len(df)
-            rate = (submitted/total*100) if total > 0 else 0
-            st.metric("Submission Rate", f"{rate:.1f}%")
+            st.metric("Submission Rate", f"{stats.submission_rate:.1f}%")
+            st.metric(f"Scored Below {LOW_SCORE_THRESHOLD}", f"{stats.students_below_threshold} student(s)")
+        
+        upcoming = stats.upcoming_quizzes(days=7)
+        if not upcoming.empty:
+            st.caption("🗓️ Quizzes in the next 7 days: " + ", ".join(
+                f"{when:%a %d %b} ({students} students)" for when, students in upcoming.items()
+            ))
+        
+        # Per-student risk from the feature table (missing homework, low or falling scores)
+        flagged = at_risk(st.session_state.system.get_student_features())
+        st.metric("Needs Attention", f"{len(flagged)} student(s)")
+        if not flagged.empty:
+            st.dataframe(
+                flagged[['student_name', 'risk', 'reasons']].head(5),
+                hide_index=True,
+                use_container_width=True
+            )
 
 # Chat interface
 st.markdown("---")
@@ -159,27 +221,53 @@ if st.session_state.messages:
 # Clear chat button
 if st.session_state.messages and st.sidebar.button("🗑️ Clear Chat History"):
     st.session_state.messages = []
+    if st.session_state.chat is not None:
+        st.session_state.chat.reset()
     st.rerun()
 
+# Query metrics from the tracer (per-stage timings, tokens, cache hits)
+if st.session_state.system and st.session_state.system.tracer is not None and \
+   st.sidebar.checkbox("📈 Show query metrics", value=bool(os.getenv('SHOW_QUERY_METRICS'))):
+    metrics = st.session_state.system.tracer.stats()
+    st.sidebar.markdown("### 📈 Query Metrics")
+    if metrics['queries']:
+        st.sidebar.metric("Queries", metrics['queries'])
+        st.sidebar.metric("Latency p50 / p95", f"{metrics['p50_ms']:.0f} / {metrics['p95_ms']:.0f} ms")
+        st.sidebar.metric("Cache Hit Rate", f"{metrics['cache_hit_rate']:.0%}")
+        st.sidebar.metric("Tokens (prompt / response)",
+                          f"{metrics['prompt_tokens']:,} / {metrics['response_tokens']:,}")
+        if metrics['errors']:
+            st.sidebar.warning(f"⚠️ {metrics['errors']} failed queries")
+
+        last = metrics['last']
+        st.sidebar.caption(f"Last query: {last['total_ms']:.0f} ms via {last['source'] or 'error'}"
+                           f" ({last['model']})")
+        st.sidebar.bar_chart(pd.Series(last['stages_ms'], name="ms"))
+    else:
+        st.sidebar.caption("No queries yet.")
+
 # Chat input
 if st.session_state.system:
-    if prompt := st.chat_input("Type your question here... (e.g., 'Which students scored below 70?')"):
+    typed = st.chat_input("Type your question here... (e.g., 'Which students scored below 70?')")
+    if prompt := typed or st.session_state.pop('pending_query', None):
         # Add user message
         st.session_state.messages.append({"role": "user", "content": prompt})
         with st.chat_message("user"):
             st.markdown(prompt)
         
-        # Get AI response
+        # Stream the AI response as it is generated
         with st.chat_message("assistant"):
-            with st.spinner("🔍 Analyzing with Gemini..."):
-                try:
-                    response = st.session_state.system.query(prompt)
-                    st.markdown(response)
-                    st.session_state.messages.append({"role": "assistant", "content": response})
-                except Exception as e:
-                    error_msg = f"❌ Error: {str(e)}"
-                    st.error(error_msg)
-                    st.session_state.messages.append({"role": "assistant", "content": error_msg})
+            try:
+                if st.session_state.chat is not None:
+                    stream = st.session_state.chat.send_stream(prompt)
+                else:
+                    stream = st.session_state.system.query_stream(prompt)
+                response = st.write_stream(stream)
+                st.session_state.messages.append({"role": "assistant", "content": response})
+            except Exception as e:
+                error_msg = f"❌ Error: {str(e)}"
+                st.error(error_msg)
+                st.session_state.messages.append({"role": "assistant", "content": error_msg})
         
         st.rerun()
 else:
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the top of the repository, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def new_record():
+    """One student record, as an ingested batch would hold it, for grade 8 class A."""
+    return {
+        'student_id': 'S999', 'student_name': 'Test Student', 'grade': '8', 'class_section': 'A',
+        'homework_title': 'Science Lab Report', 'submission_status': 'Not Submitted', 'submission_date': 'N/A',
+        'quiz_name': 'Math Quiz 1', 'quiz_score': '41', 'quiz_date': '2025-11-06', 'quiz_scheduled_date': 'N/A',
+    }
@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from client_pool import Backend, CircuitBreaker, ClientPool, PoolExhaustedError
+
+
+class ApiError(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+class ScriptedModel:
+    """Raises the queued errors in turn, then answers 'ok'."""
+
+    model_name = 'models/scripted'
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+    async def generate_content_async(self, prompt, **kwargs):
+        if self.errors:
+            error = self.errors.pop(0)
+            if error == 'hang':
+                await asyncio.sleep(60)
+            raise error
+        return 'ok'
+
+
+def reopen_now(breaker):
+    """Make an open breaker's reset timeout run out."""
+    breaker.opened_at -= breaker.reset_timeout
+
+
+def pool_of(model, failure_threshold=2, **kwargs):
+    backend = Backend('scripted', model, failure_threshold=failure_threshold, reset_timeout=60.0)
+    return ClientPool([backend], **kwargs), backend
+
+
+def test_breaker_opens_after_threshold_then_allows_one_trial():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60.0)
+    breaker.on_failure()
+    assert breaker.state == 'closed'
+    breaker.on_failure()
+    assert breaker.state == 'open' and not breaker.allows()
+
+    reopen_now(breaker)
+    assert breaker.state == 'half-open' and breaker.allows()
+    breaker.on_start()
+    assert not breaker.allows()
+
+
+def test_failed_trial_reopens_and_successful_trial_closes():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60.0)
+    breaker.on_failure()
+    reopen_now(breaker)
+    breaker.on_start()
+    breaker.on_failure()
+    assert breaker.state == 'open'
+
+    reopen_now(breaker)
+    breaker.on_start()
+    breaker.on_success()
+    assert breaker.state == 'closed' and breaker.failures == 0
+
+
+def test_throttled_trial_is_released():
+    pool, backend = pool_of(ScriptedModel(ApiError(500), ApiError(500), ApiError(429)), throttle_cooldown=0.0)
+    for _ in range(2):
+        with pytest.raises(ApiError):
+            pool.generate_content('q')
+    reopen_now(backend.breaker)
+
+    with pytest.raises(ApiError):
+        pool.generate_content('q')
+    assert backend.throttled == 1
+    assert backend.breaker.state == 'half-open' and backend.available()
+    assert pool.generate_content('q') == 'ok'
+    assert backend.breaker.state == 'closed'
+
+
+def test_cancelled_trial_does_not_close_the_breaker():
+    pool, backend = pool_of(ScriptedModel(ApiError(500), ApiError(500), 'hang'))
+    for _ in range(2):
+        with pytest.raises(ApiError):
+            pool.generate_content('q')
+    reopen_now(backend.breaker)
+
+    async def cancel_trial():
+        task = asyncio.ensure_future(pool.generate_content_async('q'))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_trial())
+    assert backend.outstanding == 0 and backend.errors == 2
+    assert backend.breaker.state == 'half-open' and backend.available()
+
+
+def test_request_fails_over_to_the_next_backend():
+    broken = Backend('broken', ScriptedModel(ApiError(503)))
+    healthy = Backend('healthy', ScriptedModel())
+    pool = ClientPool([broken, healthy])
+    assert pool.generate_content('q') == 'ok'
+    assert (broken.errors, healthy.requests) == (1, 1)
+
+
+def test_open_backends_exhaust_the_pool():
+    pool, backend = pool_of(ScriptedModel(ApiError(500)), failure_threshold=1)
+    with pytest.raises(ApiError):
+        pool.generate_content('q')
+    with pytest.raises(PoolExhaustedError):
+        pool.generate_content('q')
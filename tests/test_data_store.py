@@ -0,0 +1,86 @@
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+from data_schema import load_student_data
+from data_store import DatasetStore
+from storage import open_storage, write_storage
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / 'students.csv')
+    shutil.copy('student_data.csv', path)
+    return path
+
+
+@pytest.fixture
+def store():
+    return DatasetStore()
+
+
+def rewrite(path, rows):
+    """Replace the file with its first `rows` records."""
+    pd.read_csv(path).head(rows).to_csv(path, index=False)
+
+
+def test_acquire_shares_one_snapshot_and_counts_references(store, path):
+    first = store.acquire(path)
+    second = store.acquire(path, grade=8, class_section='A')
+    assert first is second and first.refcount == 2
+
+    store.release(first)
+    store.release(second)
+    store.release(second)
+    assert first.refcount == 0
+
+
+def test_touch_does_not_reload(store, path):
+    dataset = store.acquire(path)
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime + 60, stat.st_mtime + 60))
+    assert store.acquire(path) is dataset
+    assert dataset.mtime == os.stat(path).st_mtime
+
+
+def test_changed_file_gives_a_new_snapshot_and_retires_the_held_one(store, path):
+    old = store.acquire(path)
+    rewrite(path, 10)
+    new = store.acquire(path)
+    assert new is not old and len(new) == 10 and len(old) == 52
+    assert [entry['version'] for entry in store.stats()['retired']] == [old.version]
+
+    store.release(old)
+    assert store.stats()['retired'] == []
+
+
+def test_unreferenced_snapshot_is_not_retired(store, path):
+    store.release(store.acquire(path))
+    rewrite(path, 10)
+    store.release(store.acquire(path))
+    assert store.stats()['retired'] == []
+
+
+def test_views_do_not_change_the_snapshot(store, path):
+    dataset = store.acquire(path)
+    view = dataset.view(8, 'A')
+    view['quiz_score'] = 0
+    assert (dataset.view(8, 'A')['quiz_score'] != 0).any()
+
+
+def test_parquet_change_before_the_footer_changes_the_fingerprint(tmp_path):
+    pytest.importorskip('pyarrow')
+    path = str(tmp_path / 'students.parquet')
+    write_storage(pd.concat([load_student_data('student_data.csv', report=False)] * 8000), path)
+    storage = open_storage(path)
+    before = storage.fingerprint()
+    stat = os.stat(path)
+    # A rewrite of the first data page: same size, same footer
+    with open(path, 'r+b') as f:
+        f.seek(100)
+        byte = f.read(1)
+        f.seek(100)
+        f.write(bytes([byte[0] ^ 1]))
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert os.path.getsize(path) > 65536 and storage.fingerprint() != before
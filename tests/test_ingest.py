@@ -0,0 +1,135 @@
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ai_query_system_gemini import AdminQuerySystem
+from data_schema import load_student_data
+from data_store import DatasetStore, get_dataset_store
+from fake_model import FakeModelResolver
+from retrieval import scope_index
+from sql_source import SQLiteDataSource
+
+def make_system(path, grade=8, class_section='A'):
+    return AdminQuerySystem(api_key='offline', admin_grade=grade, admin_class=class_section, data_path=path,
+                            answer_cache=None, model_resolver=FakeModelResolver(), tracer=None, query_log=None)
+
+
+def scope_state(system):
+    """What each cache layer of a system says about its scope."""
+    return {
+        'rows': len(system.filtered_data),
+        'records': system.get_access_info()['total_records'],
+        'students': system.get_aggregates().total_students,
+        'features': len(system.get_student_features()),
+        'local': system.local_engine.answer("Which students haven't submitted their homework?",
+                                            system.filtered_data),
+    }
+
+
+@pytest.fixture
+def sqlite_path(tmp_path):
+    path = str(tmp_path / 'students.sqlite')
+    SQLiteDataSource(path).import_frame(load_student_data('student_data.csv', report=False))
+    return path
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = str(tmp_path / 'students.csv')
+    shutil.copy('student_data.csv', path)
+    return path
+
+
+@pytest.fixture
+def store():
+    return DatasetStore()
+
+
+def assert_one_more_student(before, after):
+    assert after['rows'] == after['records'] == before['rows'] + 1
+    assert after['students'] == after['features'] == before['students'] + 1
+    assert after['local'] != before['local']
+
+
+def test_sqlite_ingest_is_seen_on_the_next_query(sqlite_path, new_record):
+    system = make_system(sqlite_path)
+    before = scope_state(system)
+    get_dataset_store().ingest(sqlite_path, pd.DataFrame([new_record]))
+    assert_one_more_student(before, scope_state(system))
+
+
+def test_sqlite_ingest_by_another_process_is_seen(sqlite_path, new_record):
+    system = make_system(sqlite_path)
+    before = scope_state(system)
+    # A second connection to the database stands in for another worker
+    SQLiteDataSource(sqlite_path).ingest(pd.DataFrame([new_record]))
+    assert_one_more_student(before, scope_state(system))
+
+
+def test_sqlite_ingest_leaves_other_scopes_cached(sqlite_path, new_record):
+    system = make_system(sqlite_path, grade=9, class_section=None)
+    aggregates = system.get_aggregates()
+    SQLiteDataSource(sqlite_path).ingest(pd.DataFrame([new_record]))
+    assert system.get_aggregates() is aggregates
+
+
+def test_csv_ingest_is_seen_on_the_next_query(csv_path, new_record):
+    system = make_system(csv_path)
+    before = scope_state(system)
+    get_dataset_store().ingest(csv_path, pd.DataFrame([new_record]))
+    assert_one_more_student(before, scope_state(system))
+
+
+def test_with_records_leaves_the_old_snapshot_untouched(store, csv_path, new_record):
+    dataset = store.acquire(csv_path)
+    untouched = dataset.aggregates(9)
+    touched = dataset.aggregates(8, 'A')
+
+    new, changed = dataset.with_records(pd.DataFrame([new_record]))
+    assert changed == {(8, 'A')}
+    assert len(new) == len(dataset) + 1
+    assert len(new.view(8, 'A')) == len(dataset.view(8, 'A')) + 1
+    # Per-scope values are reused only for scopes the batch doesn't touch
+    assert new.aggregates(9) is untouched
+    assert new.aggregates(8, 'A') is not touched
+    assert new.aggregates(8, 'A').total_records == touched.total_records + 1
+
+
+def test_upsert_replaces_records_with_the_same_key(store, csv_path):
+    dataset = store.acquire(csv_path)
+    record = dataset.view(8, 'A').iloc[[0]].assign(quiz_score=11)
+    new, _ = dataset.with_records(record, mode='upsert')
+    assert len(new) == len(dataset)
+    key = (new.frame['student_id'] == record['student_id'].iloc[0]) & \
+        (new.frame['homework_title'] == record['homework_title'].iloc[0])
+    assert new.frame.loc[key, 'quiz_score'].tolist() == [11]
+
+
+def test_ingest_points_held_snapshots_to_their_successor(store, csv_path, new_record):
+    old = store.acquire(csv_path)
+    scopes = store.ingest(csv_path, pd.DataFrame([new_record]))
+    assert scopes == {(8, 'A'), (8, None), (None, 'A'), (None, None)}
+    assert old.successor is not None and len(old.successor) == len(old) + 1
+    assert store.acquire(csv_path) is old.successor
+
+
+def test_ingested_rows_get_index_labels_of_their_own(store, csv_path, new_record):
+    dataset = store.acquire(csv_path)
+    new, _ = dataset.with_records(pd.DataFrame([new_record]))
+    newer, _ = new.with_records(pd.DataFrame([{**new_record, 'student_id': 'S998'}]))
+    assert newer.frame.index.is_unique and len(newer) == len(dataset) + 2
+
+    # Retrieval hands back rows by label: they must be the named student's only
+    view = newer.view(8, 'A')
+    matched = scope_index(newer, 8, 'A').top_rows("How is Test Student doing?")
+    assert set(view[view.index.isin(matched.index)]['student_name']) == {'Test Student'}
+
+
+def test_ingest_shares_the_untouched_partitions(store, csv_path):
+    dataset = store.acquire(csv_path)
+    new, _ = dataset.with_records(dataset.view(8, 'A').iloc[[0]].assign(quiz_score=11), mode='upsert')
+    assert np.shares_memory(new.view(9, 'A')['quiz_date'].to_numpy(), dataset.view(9, 'A')['quiz_date'].to_numpy())
+    assert not np.shares_memory(new.view(8, 'A')['quiz_date'].to_numpy(),
+                                dataset.view(8, 'A')['quiz_date'].to_numpy())
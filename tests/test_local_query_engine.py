@@ -0,0 +1,130 @@
+import shutil
+
+import pandas as pd
+import pytest
+
+import local_query_engine
+import retrieval
+from ai_query_system_gemini import AdminQuerySystem
+from data_schema import load_student_data
+from fake_model import FakeModelResolver
+from local_query_engine import default_engine
+from retrieval import RetrievalIndex
+
+
+@pytest.fixture(scope='module')
+def df():
+    df = load_student_data('student_data.csv', report=False)
+    # Move the schedule into the future so there are upcoming quizzes to find
+    shift = pd.Timestamp.today().normalize() - df['quiz_scheduled_date'].min() + pd.Timedelta(days=1)
+    df['quiz_scheduled_date'] = df['quiz_scheduled_date'] + shift
+    return df
+
+
+def answer(df, question):
+    return default_engine.answer(question, df)
+
+
+def test_not_submitted_for_the_scope(df):
+    text = answer(df, "Which students haven't submitted their homework?")
+    pending = df[df['submission_status'] == 'Not Submitted']
+    assert f"{pending['student_name'].nunique()} student(s) have homework not submitted" in text
+
+
+def test_not_submitted_for_one_homework(df):
+    text = answer(df, "Which students haven't submitted the Science Lab Report?")
+    pending = df[(df['submission_status'] == 'Not Submitted') & (df['homework_title'] == 'Science Lab Report')]
+    assert f"{len(pending)} student(s) on Science Lab Report" in text
+    assert 'English Essay' not in text
+
+
+def test_score_threshold_for_the_scope(df):
+    text = answer(df, "Who scored below 70?")
+    assert f"({int((df['quiz_score'] < 70).sum())} quiz result(s))" in text
+
+
+def test_score_threshold_for_one_quiz(df):
+    text = answer(df, "Who scored below 70 in Math Quiz 1?")
+    hits = df[(df['quiz_score'] < 70) & (df['quiz_name'] == 'Math Quiz 1')]
+    assert f"({len(hits)} quiz result(s))" in text
+    assert 'English Quiz 1' not in text
+
+
+def test_ranking_for_the_scope(df):
+    assert answer(df, "Who are the top 3 students?").startswith("**Top 3 student(s)")
+
+
+def test_ranking_naming_a_quiz_goes_to_the_llm(df):
+    assert answer(df, "Who are the top 3 students in Math Quiz 1?") is None
+
+
+def test_at_risk_for_the_scope(df):
+    assert "may need attention" in answer(df, "Which students are at risk?")
+
+
+def test_at_risk_for_one_student(df):
+    text = answer(df, "Is Aarav Kumar at risk?")
+    assert "student(s) for Aarav Kumar" in text
+    assert 'Arjun Reddy' not in text
+
+
+def test_average_for_the_scope(df):
+    text = answer(df, "What is the average quiz score?")
+    assert f"**Average quiz score: {df['quiz_score'].mean():.1f}**" in text
+
+
+def test_average_for_one_quiz(df):
+    text = answer(df, "What is the average score on Math Quiz 1?")
+    mean = df.loc[df['quiz_name'] == 'Math Quiz 1', 'quiz_score'].mean()
+    assert f"**Average quiz score in Math Quiz 1: {mean:.1f}**" in text
+
+
+def test_upcoming_quizzes_for_the_scope(df):
+    text = answer(df, "Which quizzes are scheduled?")
+    assert text.count("\n- ") == df['quiz_scheduled_date'].nunique()
+
+
+def test_upcoming_quizzes_for_one_student(df):
+    text = answer(df, "Which quizzes are scheduled for Aarav Kumar?")
+    dates = df.loc[df['student_name'] == 'Aarav Kumar', 'quiz_scheduled_date'].nunique()
+    assert text.startswith("**Upcoming quizzes for Aarav Kumar:**")
+    assert text.count("\n- ") == dates
+
+
+@pytest.mark.parametrize('question', [
+    "What's the average score on quiz 1?",
+    "Who scored below 70 in math?",
+    "Which quizzes are scheduled for Aarav?",
+    "Which of them scored below 70?",
+    "Which of those students haven't submitted their homework?",
+])
+def test_partly_named_entities_and_follow_ups_go_to_the_llm(df, question):
+    assert answer(df, question) is None
+
+
+def test_systems_reuse_their_scope_index(monkeypatch, tmp_path):
+    path = str(tmp_path / 'students.csv')
+    shutil.copy('student_data.csv', path)
+    builds = []
+    monkeypatch.setattr(retrieval, 'RetrievalIndex',
+                        lambda df, embedder=None: builds.append(len(df)) or RetrievalIndex(df, embedder))
+    systems = [AdminQuerySystem(api_key='offline', admin_grade=grade, admin_class=class_section, data_path=path,
+                                answer_cache=None, model_resolver=FakeModelResolver(), tracer=None, query_log=None)
+               for grade, class_section in [(8, 'A'), (None, None)]]
+    for _ in range(3):
+        for system in systems:
+            assert system.query("What is the average score on Math Quiz 1?").startswith("**Average quiz score")
+    assert len(builds) == 2
+
+
+@pytest.mark.parametrize('question, header', [
+    ("Which students haven't submitted their homework?", "student(s) have homework not submitted"),
+    ("Who scored below 90?", "student(s) scored below 90"),
+    ("What is the average quiz score?", "scored quizzes, 13 students"),
+])
+def test_long_student_lists_are_cut_with_the_totals_kept(df, monkeypatch, question, header):
+    monkeypatch.setattr(local_query_engine, 'MAX_LISTED_STUDENTS', 3)
+    text = answer(df, question)
+    listed = [line for line in text.split('\n') if line.startswith('- ')]
+    assert header in text
+    assert len(listed) == 4 and listed[-1].startswith('- …and ')
@@ -0,0 +1,27 @@
+import pytest
+
+from model_resolver import ModelResolver
+
+
+@pytest.fixture
+def resolver(monkeypatch):
+    # Discovery asks the API for the model's token limit; stay offline
+    monkeypatch.setattr(ModelResolver, '_token_limit', staticmethod(lambda name: 32768))
+    return ModelResolver(cache_path=None, override='gemini-1.5-flash')
+
+
+def test_models_are_shared_per_key_not_across_keys(resolver):
+    first = resolver.resolve('key-one')
+    again = resolver.resolve('key-one')
+    other = resolver.resolve('key-two')
+    assert first.model is again.model
+    assert other.model is not first.model
+    assert first.name == other.name == 'gemini-1.5-flash'
+
+
+def test_override_replaces_a_fresh_remembered_choice(monkeypatch):
+    monkeypatch.setattr(ModelResolver, '_token_limit', staticmethod(lambda name: 32768))
+    resolver = ModelResolver(cache_path=None, override='gemini-1.5-pro')
+    resolver.resolve('key-one')
+    resolver.override = 'gemini-1.5-flash'
+    assert resolver.resolve('key-one').name == 'gemini-1.5-flash'
@@ -0,0 +1,17 @@
+import pytest
+
+from query_log import QueryLog
+
+
+@pytest.mark.parametrize('value', [None, '', 'off'])
+def test_query_log_is_off_unless_a_path_is_set(monkeypatch, value):
+    if value is None:
+        monkeypatch.delenv('QUERY_LOG_PATH', raising=False)
+    else:
+        monkeypatch.setenv('QUERY_LOG_PATH', value)
+    assert QueryLog.from_env() is None
+
+
+def test_query_log_writes_to_the_configured_path(monkeypatch, tmp_path):
+    monkeypatch.setenv('QUERY_LOG_PATH', str(tmp_path / 'queries.jsonl'))
+    assert QueryLog.from_env().path == str(tmp_path / 'queries.jsonl')
@@ -0,0 +1,55 @@
+import pytest
+
+from data_schema import load_student_data
+from query_plan import PlanError, answer_from_plan, execute_plan, validate_plan
+
+
+@pytest.fixture(scope='module')
+def df():
+    return load_student_data('student_data.csv', report=False)
+
+
+@pytest.mark.parametrize('plan', [
+    {'filters': ['grade == 8']},
+    {'filters': {'column': 'grade', 'op': '==', 'value': 8}},
+    {'filters': [{'column': 'grade', 'op': ['=='], 'value': 8}]},
+    {'filters': [{'column': ['grade'], 'op': '==', 'value': 8}]},
+    {'aggregations': ['mean']},
+    {'aggregations': [{'column': 'quiz_score', 'func': {'mean': 1}}]},
+    {'aggregations': [{'column': 'quiz_score', 'func': 'mean', 'as': 3}]},
+    {'group_by': 'student_name'},
+    {'group_by': [{'column': 'student_name'}]},
+    {'columns': 'student_name'},
+    {'sort': 'quiz_score'},
+    {'sort': ['quiz_score']},
+    {'limit': 'lots'},
+    {'select': ['student_name']},
+])
+def test_malformed_plans_raise_plan_error(plan):
+    with pytest.raises(PlanError):
+        validate_plan(plan)
+
+
+def test_valid_plan_runs(df):
+    plan = validate_plan({
+        'filters': [{'column': 'quiz_score', 'op': '<', 'value': 70}],
+        'group_by': ['student_name'],
+        'aggregations': [{'column': 'quiz_score', 'func': 'count', 'as': 'low_scores'}],
+        'sort': [{'column': 'low_scores', 'descending': True}],
+    })
+    result, _ = execute_plan(plan, df)
+    assert list(result.columns) == ['student_name', 'low_scores']
+    assert result['low_scores'].sum() == (df['quiz_score'] < 70).sum()
+
+
+def test_sort_must_name_an_output_column():
+    with pytest.raises(PlanError):
+        validate_plan({'group_by': ['student_name'],
+                       'aggregations': [{'column': 'quiz_score', 'func': 'mean'}],
+                       'sort': [{'column': 'quiz_score'}]})
+
+
+def test_malformed_reply_is_a_plan_error_not_a_crash(df):
+    # query() falls back to summary mode on PlanError, any other exception reaches the admin
+    with pytest.raises(PlanError):
+        answer_from_plan('```json\n{"filters": ["grade == 8"], "sort": "quiz_score"}\n```', df)
@@ -0,0 +1,46 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from fake_model import FakeModelResolver
+from query_service import create_app, load_tokens
+from tracing import Tracer
+
+QUESTION = "Who needs extra attention?"
+
+
+@pytest.fixture
+def tracer():
+    return Tracer()
+
+
+def make_client(tracer, tokens=None):
+    app = create_app(api_key='offline', model_resolver=FakeModelResolver(), tokens=tokens,
+                     answer_cache=None, tracer=tracer, query_log=None)
+    return TestClient(app)
+
+
+def test_token_scopes_match_requests_whatever_their_json_types():
+    tokens = load_tokens('{"t8": {"grade": "8", "class_section": "A"}, "admin": {}}')
+    assert tokens == {'t8': (8, 'A'), 'admin': (None, None)}
+
+    with make_client(None, tokens) as client:
+        headers = {'Authorization': 'Bearer t8'}
+        assert client.get('/access_info', params={'grade': 8, 'class_section': 'A'}, headers=headers).status_code == 200
+        assert client.get('/access_info', params={'grade': 9}, headers=headers).status_code == 403
+
+
+def test_streamed_answer_is_traced_to_the_last_chunk(tracer):
+    with make_client(tracer) as client:
+        answer = client.post('/query_stream', params={'grade': 8}, json={'question': QUESTION}).text
+    trace = tracer.recent[-1]
+    assert trace.answer == answer and trace.error is None
+    assert {'prompt_build', 'gemini_call', 'gemini_stream'} <= set(trace.stages)
+    assert trace.response_tokens is not None
+
+
+def test_query_stages_run_off_the_event_loop_are_traced(tracer):
+    with make_client(tracer) as client:
+        answer = client.post('/query', params={'grade': 8}, json={'question': QUESTION}).json()['answer']
+    trace = tracer.recent[-1]
+    assert trace.answer == answer
+    assert {'summary', 'prompt_build', 'gemini_call'} <= set(trace.stages)
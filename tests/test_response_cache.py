@@ -0,0 +1,28 @@
+import pytest
+
+from response_cache import ResponseCache, SQLiteCacheBackend, scope_key
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def cache(request, tmp_path):
+    if request.param == 'memory':
+        return ResponseCache()
+    return ResponseCache(SQLiteCacheBackend(str(tmp_path / 'answers.sqlite')))
+
+
+def test_data_files_with_the_same_scope_keep_their_own_answers(cache):
+    district, school = scope_key(8, 'A', 'district.csv'), scope_key(8, 'A', 'school.csv')
+    cache.put("Who scored below 70?", district, 'v1', 'district answer')
+    cache.put("Who scored below 70?", school, 'v2', 'school answer')
+    assert cache.get("who scored below 70", district, 'v1') == 'district answer'
+    assert cache.get("who scored below 70", school, 'v2') == 'school answer'
+
+
+def test_a_new_version_does_not_drop_answers_for_an_earlier_one(cache):
+    scope = scope_key(8, 'A', 'students.csv')
+    cache.put("Who scored below 70?", scope, 'v1', 'old answer')
+    cache.put("Who scored below 70?", scope, 'v2', 'new answer')
+    assert cache.get("Who scored below 70?", scope, 'v1') == 'old answer'
+
+    assert cache.invalidate(scope) == 2
+    assert cache.get("Who scored below 70?", scope, 'v2') is None
@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+
+import sql_source
+from ai_query_system_gemini import AdminQuerySystem
+from data_schema import load_student_data
+from fake_model import FakeModelResolver
+from sql_source import SQLiteDataSource
+
+
+@pytest.fixture
+def sqlite_path(tmp_path):
+    path = str(tmp_path / 'students.sqlite')
+    SQLiteDataSource(path).import_frame(load_student_data('student_data.csv', report=False))
+    return path
+
+
+@pytest.fixture
+def row_loads(monkeypatch):
+    """Scopes whose rows were read from SQLite, one entry per read."""
+    loads = []
+    read_sql_query = pd.read_sql_query
+
+    def counting(sql, *args, **kwargs):
+        if sql.startswith('SELECT * FROM records'):
+            loads.append(tuple(kwargs.get('params') or ()))
+        return read_sql_query(sql, *args, **kwargs)
+
+    monkeypatch.setattr(sql_source.pd, 'read_sql_query', counting)
+    return loads
+
+
+def make_system(path, grade, class_section):
+    return AdminQuerySystem(api_key='offline', admin_grade=grade, admin_class=class_section, data_path=path,
+                            answer_cache=None, model_resolver=FakeModelResolver(), tracer=None, query_log=None)
+
+
+def test_systems_share_one_copy_of_a_scope(sqlite_path, row_loads):
+    systems = [make_system(sqlite_path, 8, 'A') for _ in range(3)]
+    for system in systems:
+        system.query("What is the average quiz score?")
+        system.query("How is Aarav Kumar doing?")
+        assert len(system.filtered_data) == 20
+    assert row_loads == [(8, 'A')]
+    assert systems[0].dataset.frame is not systems[0].dataset.frame
+
+
+def test_rows_are_only_loaded_when_a_question_needs_them(sqlite_path, row_loads):
+    system = make_system(sqlite_path, None, None)
+    assert system.get_access_info()['total_records'] == 52
+    system.get_student_features()
+    assert row_loads == []
+    system.query("How is Aarav Kumar doing?")
+    system.query("What is the average quiz score?")
+    assert row_loads == [()]
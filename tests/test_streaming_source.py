@@ -0,0 +1,82 @@
+import asyncio
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ai_query_system_gemini import AdminQuerySystem
+from data_schema import load_student_data
+from data_store import Dataset
+from fake_model import FakeGenerativeModel, FakeModelResolver
+from local_query_engine import default_engine
+from storage import write_storage
+from streaming_source import StreamingDataSource
+
+SCOPES = [(None, None), (8, 'A'), (None, 'B'), (9, None), (12, None)]
+
+
+@pytest.fixture(scope='module')
+def dataset():
+    frame = load_student_data('student_data.csv', report=False)
+    return Dataset('student_data.csv', frame, 0, 0, 'in-memory')
+
+
+@pytest.fixture(scope='module', params=['csv', 'parquet', 'arrow'])
+def path(request, tmp_path_factory, dataset):
+    if request.param == 'csv':
+        return 'student_data.csv'
+    path = str(tmp_path_factory.mktemp('streaming') / f'students.{request.param}')
+    write_storage(dataset.frame, path)
+    return path
+
+
+@pytest.mark.parametrize('grade, class_section', SCOPES)
+def test_streamed_aggregates_match_in_memory(dataset, path, grade, class_section):
+    expected = dataset.aggregates(grade, class_section)
+    streamed = StreamingDataSource(path, chunksize=7).aggregates(grade, class_section)
+
+    for name in ('total_records', 'total_students', 'submitted', 'quiz_count', 'below_threshold'):
+        assert getattr(streamed, name) == getattr(expected, name), name
+    assert np.isclose(streamed.quiz_sum, expected.quiz_sum)
+    pd.testing.assert_frame_equal(streamed.students.reset_index(drop=True), expected.students.reset_index(drop=True),
+                                  check_dtype=False, check_categorical=False)
+    pd.testing.assert_series_equal(streamed.upcoming_quizzes(today='2025-11-01'),
+                                   expected.upcoming_quizzes(today='2025-11-01'),
+                                   check_dtype=False, check_index_type=False)
+
+
+def test_views_are_not_kept(dataset):
+    source = StreamingDataSource('student_data.csv', chunksize=7)
+    for grade, class_section in SCOPES:
+        view = source.view(grade, class_section)
+        assert len(view) == len(dataset.view(grade, class_section))
+        assert 'sample_of' not in view.attrs
+    assert not any(key[0] == 'view' for key in source._memo)
+
+
+def test_large_scopes_are_sampled_and_left_to_the_aggregates(dataset):
+    source = StreamingDataSource('student_data.csv', chunksize=7, view_rows=10)
+    view = source.view()
+    assert view.attrs['sample_of'] == len(dataset.frame)
+    assert 0 < len(view) < len(dataset.frame)
+    assert view['student_id'].isin(dataset.frame['student_id']).all()
+    assert default_engine.answer("What is the average quiz score?", view) is None
+    assert len(source.frame) == len(dataset.frame)
+
+
+@pytest.mark.parametrize('run', ['query', 'aquery'])
+def test_plan_mode_on_a_sampled_scope_answers_from_the_summary(tmp_path, monkeypatch, run):
+    path = str(tmp_path / 'students.csv')
+    shutil.copy('student_data.csv', path)
+    monkeypatch.setenv('STREAMING_DATA', '1')
+    monkeypatch.setenv('STREAMING_VIEW_ROWS', '10')
+    model = FakeGenerativeModel()
+    system = AdminQuerySystem(api_key='offline', data_path=path, answer_cache=None, query_mode='plan',
+                              model_resolver=FakeModelResolver(model), tracer=None, query_log=None)
+    question = "Which homework has the lowest submission rate?"
+    answer = system.query(question) if run == 'query' else asyncio.run(system.aquery(question))
+
+    assert system.filtered_data.attrs['sample_of'] == 52
+    assert system.last_answer_source == 'gemini'
+    assert answer == model.reply and model.calls == 1
@@ -0,0 +1,261 @@
+"""
+Per-query tracing for AdminQuerySystem.
+
+Each query records how long every stage took (local engine, cache lookup,
+data summary, prompt building, model resolution, the Gemini call, plan
+execution), the prompt/response token counts, whether the cache answered,
+which model was used and, on failure, the actual exception. Finished traces
+go to pluggable sinks and the last few hundred are kept in memory for the
+Streamlit metrics panel.
+
+Sinks are chosen with TRACE_SINKS, a comma-separated list:
+    TRACE_SINKS=log                      # logging, logger 'dumroo.trace'
+    TRACE_SINKS=jsonl:logs/traces.jsonl  # one JSON object per line
+    TRACE_SINKS=otel                     # OpenTelemetry spans (pip install opentelemetry-api)
+"""
+
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+
+import numpy as np
+
+_current = contextvars.ContextVar('current_trace', default=None)
+
+
+class QueryTrace:
+    """Timings and facts collected while answering one question."""
+
+    def __init__(self, question, **attributes):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.question = question
+        self.attributes = attributes
+        self.started_at = time.time()
+        self.stages = {}
+        self.source = None
+        self.cache_hit = False
+        self.prompt_tokens = None
+        self.response_tokens = None
+        self.error = None
+        self.answer = None
+        self.total_ms = None
+        self._stage_spans = []
+        self._started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time a block; repeated stages (e.g. a retried call) add up."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed * 1000
+            self._stage_spans.append((name, self.started_at + (started - self._started), elapsed))
+
+    def record_tokens(self, prompt_tokens=None, response_tokens=None):
+        if prompt_tokens is not None:
+            self.prompt_tokens = (self.prompt_tokens or 0) + prompt_tokens
+        if response_tokens is not None:
+            self.response_tokens = (self.response_tokens or 0) + response_tokens
+
+    def record_error(self, error):
+        self.error = {
+            'type': type(error).__name__,
+            'message': str(error),
+            'code': getattr(error, 'code', None),
+            'traceback': ''.join(traceback.format_exception(type(error), error, error.__traceback__)),
+        }
+
+    def finish(self):
+        self.total_ms = (time.perf_counter() - self._started) * 1000
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'started_at': self.started_at,
+            'question': self.question,
+            **self.attributes,
+            'source': self.source,
+            'cache_hit': self.cache_hit,
+            'prompt_tokens': self.prompt_tokens,
+            'response_tokens': self.response_tokens,
+            'total_ms': None if self.total_ms is None else round(self.total_ms, 3),
+            'stages_ms': {name: round(ms, 3) for name, ms in self.stages.items()},
+            'error': self.error,
+        }
+
+
+def current_trace():
+    """The trace of the query running in this context, or None."""
+    return _current.get()
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Time a block as stage `name` of the current trace (no-op outside a query)."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    with trace.stage(name):
+        yield
+
+
+class LoggingSink:
+    """Log each trace as one JSON line."""
+
+    def __init__(self, logger='dumroo.trace', level=logging.INFO):
+        self.logger = logging.getLogger(logger) if isinstance(logger, str) else logger
+        self.level = level
+
+    def emit(self, trace):
+        record = trace.to_dict()
+        if record['error']:
+            record['error'] = {k: v for k, v in record['error'].items() if k != 'traceback'}
+        self.logger.log(logging.WARNING if trace.error else self.level, json.dumps(record, default=str))
+
+
+class JsonlSink:
+    """Append each trace to a JSONL file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+    def emit(self, trace):
+        line = json.dumps(trace.to_dict(), default=str) + '\n'
+        with self._lock, open(self.path, 'a') as f:
+            f.write(line)
+
+
+class OpenTelemetrySink:
+    """Export each trace as an OpenTelemetry span with one child span per stage."""
+
+    def __init__(self, tracer=None):
+        try:
+            from opentelemetry import trace as otel_trace
+        except ImportError:
+            raise ImportError("The OpenTelemetry sink needs opentelemetry-api: "
+                              "pip install opentelemetry-api opentelemetry-sdk") from None
+        self._otel = otel_trace
+        self.tracer = tracer or otel_trace.get_tracer('dumroo.admin_query')
+
+    def emit(self, trace):
+        record = trace.to_dict()
+        attributes = {
+            f'query.{key}': value for key, value in record.items()
+            if isinstance(value, (str, int, float, bool)) and key not in ('trace_id', 'started_at')
+        }
+        start = int(trace.started_at * 1e9)
+        span = self.tracer.start_span('admin_query', start_time=start, attributes=attributes)
+        context = self._otel.set_span_in_context(span)
+        for name, started_at, seconds in trace._stage_spans:
+            child = self.tracer.start_span(name, context=context, start_time=int(started_at * 1e9))
+            child.end(end_time=int((started_at + seconds) * 1e9))
+        if trace.error:
+            span.set_status(self._otel.Status(self._otel.StatusCode.ERROR, trace.error['message']))
+        span.end(end_time=start + int(trace.total_ms * 1e6))
+
+
+class Tracer:
+    """Start traces, hand finished ones to the sinks and keep recent ones for metrics."""
+
+    def __init__(self, sinks=(), keep=500):
+        self.sinks = list(sinks)
+        self.recent = deque(maxlen=keep)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Build the tracer described by TRACE_SINKS."""
+        sinks = []
+        for spec in filter(None, (s.strip() for s in os.getenv('TRACE_SINKS', '').split(','))):
+            kind, _, arg = spec.partition(':')
+            if kind == 'log':
+                sinks.append(LoggingSink())
+            elif kind == 'jsonl':
+                sinks.append(JsonlSink(arg or 'logs/traces.jsonl'))
+            elif kind == 'otel':
+                sinks.append(OpenTelemetrySink())
+            else:
+                raise ValueError(f"Unknown trace sink '{kind}' (expected log, jsonl or otel)")
+        return cls(sinks)
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    @contextlib.contextmanager
+    def trace(self, question, **attributes):
+        """Trace the block as one query; the trace is the current one inside it."""
+        trace = QueryTrace(question, **attributes)
+        token = _current.set(trace)
+        try:
+            yield trace
+        except BaseException as e:
+            if trace.error is None and not isinstance(e, GeneratorExit):
+                trace.record_error(e)
+            raise
+        finally:
+            trace.finish()
+            self._emit(trace)
+            # Raises if a streaming query's generator was resumed in another
+            # context, whose stages would then have been missed
+            _current.reset(token)
+
+    def _emit(self, trace):
+        with self._lock:
+            self.recent.append(trace)
+        for sink in self.sinks:
+            try:
+                sink.emit(trace)
+            except Exception as e:
+                # A broken sink must never fail the query
+                logging.getLogger('dumroo.trace').warning("Trace sink %s failed: %s", type(sink).__name__, e)
+
+    def stats(self):
+        """Aggregate metrics over the recent traces."""
+        with self._lock:
+            traces = list(self.recent)
+        if not traces:
+            return {'queries': 0}
+
+        totals = np.array([t.total_ms for t in traces])
+        stages = {}
+        for t in traces:
+            for name, ms in t.stages.items():
+                stages.setdefault(name, []).append(ms)
+
+        sources = {}
+        for t in traces:
+            sources[t.source] = sources.get(t.source, 0) + 1
+
+        return {
+            'queries': len(traces),
+            'p50_ms': float(np.percentile(totals, 50)),
+            'p95_ms': float(np.percentile(totals, 95)),
+            'cache_hit_rate': sum(t.cache_hit for t in traces) / len(traces),
+            'errors': sum(t.error is not None for t in traces),
+            'prompt_tokens': sum(t.prompt_tokens or 0 for t in traces),
+            'response_tokens': sum(t.response_tokens or 0 for t in traces),
+            'sources': sources,
+            'stage_mean_ms': {name: float(np.mean(values)) for name, values in stages.items()},
+            'last': traces[-1].to_dict(),
+        }
+
+
+# Default tracer used by AdminQuerySystem
+default_tracer = Tracer.from_env()
+
+# Traces without sinks or metrics, for systems created with tracer=None
+null_tracer = Tracer(keep=0)